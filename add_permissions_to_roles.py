@@ -7,6 +7,9 @@ from getpass import getpass
 from utilities.api import Api
 import queries
 from utilities.csv_helper import CsvHelper
+from utilities.name_resolver import get_name_resolver
+
+CSV_FIELDNAMES = ("role", "permission_group")
 
 
 def attach_permission_group_to_role(api: Api, role_id: int, permission_group_id: int):
@@ -26,26 +29,33 @@ def get_permission_group_id(api: Api, permission_name) -> int:
     """
     Get permission group given name.
     """
-    role_filter = {"name": {"eq": permission_name}}
-    permission_groups_query = {
-        "query": queries.GET_PERMISSION_GROUPS,
-        "variables": {"filters": role_filter},
-    }
-    permission_groups = api.request(permission_groups_query)
-    return permission_groups["data"]["permissionGroups"]["edges"][0]["node"]["id"]
+    return get_name_resolver(api, "permissionGroups").resolve(permission_name)
 
 
 def get_role_id(api: Api, role_name) -> int:
     """
     Get role given name.
     """
-    role_filter = {"name": {"eq": role_name}}
-    permission_groups_query = {
-        "query": queries.GET_ROLES,
-        "variables": {"filters": role_filter},
-    }
-    permission_groups = api.request(permission_groups_query)
-    return permission_groups["data"]["roles"]["edges"][0]["node"]["id"]
+    return get_name_resolver(api, "roles").resolve(role_name)
+
+
+def prefetch_ids(api: Api, csv_file_path: str) -> None:
+    """
+    Resolve every role and permission group in the csv in a few bulk queries,
+    so rows are processed from the resolver caches.
+    """
+    role_names, permission_names = set(), set()
+    for row in CsvHelper.iter_csv(csv_file_path, CSV_FIELDNAMES):
+        role_names.add(row["role"])
+        permission_names.add(row["permission_group"])
+    roles = get_name_resolver(api, "roles").prefetch(role_names)
+    permission_groups = get_name_resolver(api, "permissionGroups").prefetch(
+        permission_names
+    )
+    print(
+        f"Resolved {roles} of {len(role_names)} roles and {permission_groups} of "
+        f"{len(permission_names)} permission groups"
+    )
 
 
 if __name__ == "__main__":
@@ -60,11 +70,10 @@ if __name__ == "__main__":
             "Must input client ID and " "client secret to run import"
         )
     api = Api(client_id=args.client_id, client_secret=client_secret)
-    csv_data = CsvHelper.read_from_csv("add_permissions_to_roles.csv")
-    for index, row in enumerate(csv_data):
-        if index == 0:
-            continue
-        print(f"Processing row {index}/{len(csv_data)}")
-        role_id = get_role_id(api, row[0])
-        permission_group_id = get_permission_group_id(api, row[1])
+    prefetch_ids(api, "add_permissions_to_roles.csv")
+    rows = CsvHelper.iter_csv("add_permissions_to_roles.csv", CSV_FIELDNAMES)
+    for index, row in enumerate(rows, start=1):
+        print(f"Processing row {index}")
+        role_id = get_role_id(api, row["role"])
+        permission_group_id = get_permission_group_id(api, row["permission_group"])
         attach_permission_group_to_role(api, role_id, permission_group_id)
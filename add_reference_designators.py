@@ -3,21 +3,63 @@ Given list of reference designators, add to mBOM ID.
 """
 
 import argparse
+import asyncio
 from getpass import getpass
 from utilities.api import Api
+from utilities.async_api import AsyncApi
 import queries
 from utilities.csv_helper import CsvHelper
 
 
-def add_reference_designator(api: Api, mbom_item_id: int, value: str):
+def get_reference_designator_body(mbom_item_id: int, value: str) -> dict:
     """
-    Create reference designators for given mbom item id.
+    Build the request to create a reference designator for given mbom item id.
     """
-    create_reference_designator_body = {
+    return {
         "query": queries.CREATE_MBOM_ITEM_REFERENCE_DESIGNATOR,
         "variables": {"input": {"mbomItemId": mbom_item_id, "value": value}},
     }
-    api.request(create_reference_designator_body)
+
+
+def add_reference_designator(api: Api, mbom_item_id: int, value: str):
+    """
+    Create reference designators for given mbom item id.
+    """
+    api.request(get_reference_designator_body(mbom_item_id, value))
+
+
+def add_reference_designators_batched(
+    api: Api, mbom_item_id: int, values: list, batch_size: int
+):
+    """
+    Create reference designators for given mbom item id, several per request.
+    """
+    bodies = [get_reference_designator_body(mbom_item_id, value) for value in values]
+    results = api.batch(bodies, batch_size=batch_size)
+    for value, result in zip(values, results):
+        if result.get("errors"):
+            print(f"Failed to add reference designator {value}: {result['errors']}")
+
+
+async def add_reference_designators_async(
+    api: AsyncApi, mbom_item_id: int, values: list
+):
+    """
+    Create reference designators concurrently for given mbom item id.
+    """
+    bodies = [get_reference_designator_body(mbom_item_id, value) for value in values]
+    await api.request_many(bodies)
+
+
+async def run_async(client_id: str, client_secret: str, concurrency: int):
+    csv_data = CsvHelper.read_from_csv("add_reference_designators.csv")
+    mbom_item_id = input("Enter the mBOM item ID: ")
+    values = [row[0] for row in csv_data[1:]]
+    async with AsyncApi(
+        client_id=client_id, client_secret=client_secret, max_concurrency=concurrency
+    ) as api:
+        print(f"Processing {len(values)} rows with {concurrency} requests in flight")
+        await add_reference_designators_async(api, mbom_item_id, values)
 
 
 if __name__ == "__main__":
@@ -25,17 +67,39 @@ if __name__ == "__main__":
         description="Add reference designators to existing mBOM item."
     )
     parser.add_argument("--client_id", type=str, help="Your API client ID")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of requests to keep in flight (default: 1, sequential)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Number of rows sent per request (default: 1, one request per row)",
+    )
     args = parser.parse_args()
     client_secret = getpass("Client secret: ")
     if not args.client_id or not client_secret:
         raise argparse.ArgumentError(
             "Must input client ID and " "client secret to run import"
         )
-    api = Api(client_id=args.client_id, client_secret=client_secret)
-    csv_data = CsvHelper.read_from_csv("add_reference_designators.csv")
-    mbom_item_id = input("Enter the mBOM item ID: ")
-    for index, row in enumerate(csv_data):
-        if index == 0:
-            continue
-        print(f"Processing row {index}/{len(csv_data)}")
-        add_reference_designator(api, mbom_item_id, row[0])
+    if args.concurrency > 1:
+        asyncio.run(run_async(args.client_id, client_secret, args.concurrency))
+    elif args.batch_size > 1:
+        api = Api(client_id=args.client_id, client_secret=client_secret)
+        csv_data = CsvHelper.read_from_csv("add_reference_designators.csv")
+        mbom_item_id = input("Enter the mBOM item ID: ")
+        values = [row[0] for row in csv_data[1:]]
+        print(f"Processing {len(values)} rows in batches of {args.batch_size}")
+        add_reference_designators_batched(api, mbom_item_id, values, args.batch_size)
+    else:
+        api = Api(client_id=args.client_id, client_secret=client_secret)
+        csv_data = CsvHelper.read_from_csv("add_reference_designators.csv")
+        mbom_item_id = input("Enter the mBOM item ID: ")
+        for index, row in enumerate(csv_data):
+            if index == 0:
+                continue
+            print(f"Processing row {index}/{len(csv_data)}")
+            add_reference_designator(api, mbom_item_id, row[0])
@@ -3,10 +3,15 @@ Given a csv of user emails and teams, add users to teams (see add_users_to_teams
 """
 
 import argparse
+import asyncio
 from getpass import getpass
 from utilities.api import Api
+from utilities.async_api import AsyncApi, for_each_concurrently
 import queries
-from utilities.csv_helper import CsvHelper
+from utilities.csv_helper import CsvHelper, chunked
+from utilities.name_resolver import get_name_resolver
+
+CSV_FIELDNAMES = ("team", "email")
 
 
 def add_user_to_team(api: Api, team_id: int, user_id: int):
@@ -20,24 +25,82 @@ def add_user_to_team(api: Api, team_id: int, user_id: int):
     api.request(add_user_to_team_body)
 
 
+async def add_user_to_team_async(api: AsyncApi, team_id: int, user_id: int):
+    """
+    Add a user to a team.
+    """
+    await api.request(
+        {
+            "query": queries.ADD_USER_TO_TEAM,
+            "variables": {"input": {"userId": user_id, "teamId": team_id}},
+        }
+    )
+
+
+async def run_async(client_id: str, client_secret: str, concurrency: int):
+    resolver_api = Api(client_id=client_id, client_secret=client_secret)
+    prefetch_ids(resolver_api, "add_users_to_teams.csv")
+    rows = CsvHelper.iter_csv("add_users_to_teams.csv", CSV_FIELDNAMES)
+    async with AsyncApi(
+        client_id=client_id, client_secret=client_secret, max_concurrency=concurrency
+    ) as api:
+        print(f"Processing rows with {concurrency} requests in flight")
+        # Ids are resolved in bulk a chunk of rows ahead, off the event loop.
+        ids = iter_ids(resolver_api, rows, concurrency * 10)
+        await for_each_concurrently(
+            ids, lambda id_pair: add_user_to_team_async(api, *id_pair), concurrency
+        )
+
+
 def get_team_id(api: Api, team_name) -> int:
     """
     Get team Id from team name.
     """
-    team_filter = {"name": {"eq": team_name}}
-    teams_query = {"query": queries.GET_TEAMS, "variables": {"filters": team_filter}}
-    teams = api.request(teams_query)
-    return teams["data"]["teams"]["edges"][0]["node"]["id"]
+    return get_name_resolver(api, "teams").resolve(team_name)
 
 
 def get_user_id(api: Api, user_email) -> int:
     """
     Get user Id from user email.
     """
-    user_filter = {"email": {"eq": user_email}}
-    users_query = {"query": queries.GET_USERS, "variables": {"filters": user_filter}}
-    users = api.request(users_query)
-    return users["data"]["users"]["edges"][0]["node"]["id"]
+    return get_name_resolver(api, "users").resolve(user_email)
+
+
+def resolve_ids(api: Api, rows: list) -> list:
+    """
+    Get the (team id, user id) of each row, re-resolving names whose cached ids
+    have expired in one bulk query per kind.
+    """
+    get_name_resolver(api, "teams").prefetch(row["team"] for row in rows)
+    get_name_resolver(api, "users").prefetch(row["email"] for row in rows)
+    return [
+        (get_team_id(api, row["team"]), get_user_id(api, row["email"])) for row in rows
+    ]
+
+
+def iter_ids(api: Api, rows, chunk_size: int):
+    """
+    Lazily yield the (team id, user id) of each row, resolving chunk_size rows
+    at a time with resolve_ids.
+    """
+    for chunk in chunked(rows, chunk_size):
+        yield from resolve_ids(api, chunk)
+
+
+def prefetch_ids(api: Api, csv_file_path: str) -> None:
+    """
+    Resolve every team and user in the csv in a few bulk queries, so rows are
+    processed from the resolver caches.
+    """
+    team_names, user_emails = set(), set()
+    for row in CsvHelper.iter_csv(csv_file_path, CSV_FIELDNAMES):
+        team_names.add(row["team"])
+        user_emails.add(row["email"])
+    teams = get_name_resolver(api, "teams").prefetch(team_names)
+    users = get_name_resolver(api, "users").prefetch(user_emails)
+    print(
+        f"Resolved {teams} of {len(team_names)} teams and {users} of {len(user_emails)} users"
+    )
 
 
 if __name__ == "__main__":
@@ -45,18 +108,26 @@ if __name__ == "__main__":
         description="Add users to existing teams from csv."
     )
     parser.add_argument("--client_id", type=str, help="Your API client ID")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of requests to keep in flight (default: 1, sequential)",
+    )
     args = parser.parse_args()
     client_secret = getpass("Client secret: ")
     if not args.client_id or not client_secret:
         raise argparse.ArgumentError(
             "Must input client ID and " "client secret to run import"
         )
-    api = Api(client_id=args.client_id, client_secret=client_secret)
-    csv_data = CsvHelper.read_from_csv("add_users_to_teams.csv")
-    for index, row in enumerate(csv_data):
-        if index == 0:
-            continue
-        print(f"Processing row {index}/{len(csv_data)}")
-        team_id = get_team_id(api, row[0])
-        user_id = get_user_id(api, row[1])
-        add_user_to_team(api, team_id, user_id)
+    if args.concurrency > 1:
+        asyncio.run(run_async(args.client_id, client_secret, args.concurrency))
+    else:
+        api = Api(client_id=args.client_id, client_secret=client_secret)
+        prefetch_ids(api, "add_users_to_teams.csv")
+        rows = CsvHelper.iter_csv("add_users_to_teams.csv", CSV_FIELDNAMES)
+        for index, row in enumerate(rows, start=1):
+            print(f"Processing row {index}")
+            team_id = get_team_id(api, row["team"])
+            user_id = get_user_id(api, row["email"])
+            add_user_to_team(api, team_id, user_id)
@@ -22,12 +22,12 @@ def get_runs_from_procedure_id(api: Api, procedure_id: int) -> list:
     Returns:
         list: All run ids associated with given procedure_id
     """
-    runs_query = {
-        "query": queries.GET_RUNS,
-        "variables": {"filters": {"procedureId": {"eq": procedure_id}}},
-    }
-    runs = api.request(runs_query)
-    return [run["node"]["id"] for run in runs["data"]["runs"]["edges"]]
+    runs = api.paginate(
+        queries.GET_RUNS,
+        "runs",
+        variables={"filters": {"procedureId": {"eq": procedure_id}}},
+    )
+    return [run["id"] for run in runs]
 
 
 def create_run_step(api: Api, run_id: int, title: str, content: str = None) -> dict:
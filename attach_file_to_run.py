@@ -11,54 +11,89 @@ The ion file code flow is the following:
 
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 import os
-import requests
 from utilities.api import Api
+from utilities.file_attachment_helper import FileAttachmentHelper
 import queries
 from config import config
 
+# Files uploaded at once, and the bytes they may have in flight between them.
+TRANSFER_WORKERS = 4
+MAX_IN_FLIGHT_BYTES = 256 * 1024 * 1024
 
-def upload_file_to_step(api: Api, run_id: int, file_path: str) -> bool:
+file_attachment_helper = FileAttachmentHelper(MAX_IN_FLIGHT_BYTES)
+
+
+def upload_file_to_entity(api: Api, entity_id: int, file_path: str) -> bool:
     """
-    Finds a run by the provided run ID and uploads the provided file
-    to the first step of that run.
+    Create a file attachment on an entity and upload the file to it.
 
     Args:
         api (Api): API instance to send authenticated requests
-        file_path (str): The path of the file to upload to the step
+        entity_id (int): The entity to attach the file to, e.g. a step's entityId
+        file_path (str): The path of the file to upload
 
     Returns:
         bool: True if the upload succeeded
     """
-    # Get the run you want to upload to, so we can find the step to upload to
-    r = api.request({"query": queries.GET_RUN, "variables": {"id": run_id}})
-    run = r["data"]["run"]
-    first_step = run["steps"][0]
-
     # Get the target URL we can upload our file to by using the
     # createFileAttachment API mutation. We are making the request against
     # the step's entityId, which is how files are associated to objects in ion
     attachment_data = {
         "input": {
-            "entityId": first_step["entityId"],
+            "entityId": entity_id,
             "filename": os.path.basename(file_path),
         }
     }
     upload_request = api.request(
         {"query": queries.CREATE_FILE_ATTACHMENT, "variables": attachment_data}
     )
-    url = upload_request["data"]["createFileAttachment"]["uploadUrl"]
 
-    # Now, let's upload the file!
-    headers = {
-        "Content-Type": upload_request["data"]["createFileAttachment"][
-            "fileAttachment"
-        ]["contentType"]
-    }
+    # Now, let's upload the file! It is streamed from disk rather than read
+    # into memory, so large files are fine.
+    file_attachment_helper.upload_file(
+        file_path, upload_request["data"]["createFileAttachment"]
+    )
+    return True
 
-    r = requests.put(url, headers=headers, data=open(file_path, "rb"))
-    return r.ok
+
+def upload_file_to_step(api: Api, run_id: int, file_path: str) -> bool:
+    """
+    Finds a run by the provided run ID and uploads the provided file
+    to the first step of that run.
+
+    Args:
+        api (Api): API instance to send authenticated requests
+        file_path (str): The path of the file to upload to the step
+
+    Returns:
+        bool: True if the upload succeeded
+    """
+    return upload_files_to_step(api, run_id, [file_path])
+
+
+def upload_files_to_step(
+    api: Api, run_id: int, file_paths: list, workers: int = TRANSFER_WORKERS
+) -> bool:
+    """
+    Uploads files to the first step of a run, up to workers at a time.
+
+    Returns:
+        bool: True if all uploads succeeded
+    """
+    # Get the run you want to upload to, so we can find the step to upload to
+    r = api.request({"query": queries.GET_RUN, "variables": {"id": run_id}})
+    run = r["data"]["run"]
+    first_step = run["steps"][0]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        uploads = [
+            executor.submit(upload_file_to_entity, api, first_step["entityId"], path)
+            for path in file_paths
+        ]
+        return all(upload.result() for upload in uploads)
 
 
 if __name__ == "__main__":
@@ -70,9 +105,16 @@ if __name__ == "__main__":
         description="Upload a file to the first step in a run"
     )
     parser.add_argument(
-        "file_path",
+        "file_paths",
         type=str,
-        help="The path of the file you want to upload to the step.",
+        nargs="+",
+        help="The paths of the files you want to upload to the step.",
+    )
+    parser.add_argument(
+        "--transfers",
+        type=int,
+        default=TRANSFER_WORKERS,
+        help=f"Files uploaded at once (default: {TRANSFER_WORKERS})",
     )
     ion_api = Api(
         client_id=client_id,
@@ -87,4 +129,4 @@ if __name__ == "__main__":
     parser.add_argument("run_id", type=str, help="The run to upload the file to.")
     args = parser.parse_args()
     api = Api(client_id=client_id, client_secret=client_secret)
-    upload_file_to_step(api, args.run_id, args.file_path)
+    upload_files_to_step(api, args.run_id, args.file_paths, args.transfers)
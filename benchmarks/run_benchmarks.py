@@ -0,0 +1,476 @@
+"""
+Benchmark the bulk scripts end to end against a synthetic tenant on the mock
+ION server.
+
+Each benchmark runs in its own process against a freshly generated tenant, so
+wall time and memory are not skewed by earlier runs, and reports the number
+of requests the server received. Request counts are deterministic for a given
+tenant size and seed; compare them to a saved baseline to catch regressions.
+"""
+
+import os
+import sys
+import inspect
+
+# Reset the path so it can be run from the parent directory
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import csv
+import json
+import time
+import types
+import random
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import importlib.util
+import multiprocessing
+from dataclasses import asdict, fields
+
+from benchmarks.synthetic_tenant import (
+    TenantSize,
+    generate_tenant,
+    inventory_update_rows,
+    mbom_rows,
+)
+from mock_ion_server.server import MockIonServer
+
+SCRIPTS = {
+    "procedure_export": "procedure_export/procedure_export.py",
+    "export_inventories": "export_inventories_with_abom/export_inventories.py",
+    "delete_purchases": "delete_purchases/delete_purchases.py",
+    "update_inventory_quantities": "inventory_updates/update_inventory_quantities.py",
+    "create_or_update_mboms": "create_or_update_mboms/bulk_create_or_update_mboms.py",
+    "attach_file_to_run": "attach_file_to_run.py",
+}
+# Size and number of parts of the file uploaded by the attach_file_to_run benchmark.
+UPLOAD_SIZE = 8 * 1024 * 1024
+UPLOAD_PARTS = 4
+
+
+def load_script(name: str, server_url: str):
+    """
+    Import a script as a module, configured to talk to the mock server.
+
+    The scripts read their settings from a config module, so one is registered
+    with the mock server's URL for both the single and source/target settings.
+    """
+    config = {}
+    for prefix in ("", "SOURCE_", "TARGET_"):
+        config[f"{prefix}ION_AUTH_SERVER"] = server_url
+        config[f"{prefix}ION_API_URI"] = server_url
+        config[f"{prefix}ION_CLIENT_ID"] = "benchmark"
+        config[f"{prefix}ION_CLIENT_SECRET"] = "benchmark"
+    sys.modules["config"] = types.SimpleNamespace(config=config)
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(parentdir, SCRIPTS[name])
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_csv(rows: list, csv_file_path: str = "input.csv") -> str:
+    """Write a workload's rows, header first, to the benchmark's working directory."""
+    with open(csv_file_path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+    return csv_file_path
+
+
+def run_procedure_export(module, api_kwargs: dict, workload: dict, options: dict):
+    from utilities.api import Api, POOL_MAXSIZE, create_session
+
+    workers = options["workers"]
+    session = create_session(pool_maxsize=max(workers + 1, POOL_MAXSIZE))
+    source_api = Api(session=session, **api_kwargs)
+    target_api = Api(session=session, **api_kwargs)
+    for procedure_id in workload["procedure_ids"]:
+        procedure_data = module.get_procedure_data(source_api, procedure_id)
+        module.create_procedure_from_source_data(
+            target_api, procedure_data, "", source_api, workers
+        )
+
+
+def run_export_inventories(module, api_kwargs: dict, workload: dict, options: dict):
+    from utilities.api import Api, POOL_MAXSIZE
+
+    slices = options["slices"]
+    api = Api(pool_maxsize=max(slices, POOL_MAXSIZE), **api_kwargs)
+    inventories = module.get_inventories(api, slices)
+    module.export_inventories(inventories, f"inventories.{options['format']}")
+
+
+def run_delete_purchases(module, api_kwargs: dict, workload: dict, options: dict):
+    from utilities.api import Api
+
+    api = Api(**api_kwargs)
+    module.get_receipts(api)
+    purchase_lines = module.get_purchase_lines(api)
+    purchases = module.get_purchases(api)
+    module.build_list_aboms_items(purchase_lines)
+    module.delete_purchase_lines(purchase_lines, api)
+    module.delete_purchases(purchases, api)
+
+
+def run_update_inventory_quantities(
+    module, api_kwargs: dict, workload: dict, options: dict
+):
+    import asyncio
+    from utilities.api import Api
+
+    rows = module.read_inventory_updates(write_csv(workload["rows"]))
+    if options["concurrency"] > 1:
+        asyncio.run(module.run_async(api_kwargs, rows, options["concurrency"]))
+    else:
+        module.update_inventory_quantities(Api(**api_kwargs), rows)
+
+
+def run_create_or_update_mboms(module, api_kwargs: dict, workload: dict, options: dict):
+    from utilities.api import Api
+
+    api = Api(**api_kwargs)
+    rows = module.read_mbom_rows(write_csv(workload["rows"]))
+    input_list = module.convert_csv_rows_into_json(rows)
+    module.create_or_update_mboms(api, input_list)
+
+
+def run_attach_file_to_run(module, api_kwargs: dict, workload: dict, options: dict):
+    """
+    Upload a file to a run step as an S3 multipart upload and check that the
+    assembled file matches. ION issues a single uploadUrl, so the multipart
+    upload is started on the mock server to exercise that path.
+    """
+    import hashlib
+    import requests
+    import queries
+    from utilities.api import Api
+
+    api = Api(**api_kwargs)
+    run = api.request(
+        {"query": queries.GET_RUN, "variables": {"id": workload["run_id"]}}
+    )["data"]["run"]
+    with open("upload.bin", "wb") as f:
+        f.write(random.Random(options["seed"]).randbytes(workload["size"]))
+    file_attachment = api.request(
+        {
+            "query": queries.CREATE_FILE_ATTACHMENT,
+            "variables": {
+                "input": {
+                    "entityId": run["steps"][0]["entityId"],
+                    "filename": "upload.bin",
+                }
+            },
+        }
+    )["data"]["createFileAttachment"]
+    response = requests.post(
+        f"{file_attachment['uploadUrl']}?uploads&parts={workload['parts']}", timeout=10
+    )
+    response.raise_for_status()
+    file_attachment.update(response.json())
+    stats = module.file_attachment_helper.upload_file("upload.bin", file_attachment)
+    file_id = file_attachment["fileAttachment"]["id"]
+    uploaded = requests.get(f"{api_kwargs['api_uri']}/files/{file_id}", timeout=10)
+    if hashlib.sha256(uploaded.content).hexdigest() != stats.sha256:
+        raise Exception("---AN ERROR OCCURRED: uploaded file doesn't match the source")
+
+
+def read_proc_status(field: str) -> int:
+    """
+    Read a memory field of /proc/self/status.
+
+    Returns:
+        int: Value in kilobytes, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class MemoryTracker(object):
+    """
+    Measure how much memory a benchmark run adds to its process.
+
+    ru_maxrss is inherited through fork and exec, so a child reports at least
+    the parent's high-water mark. On Linux the peak RSS (VmHWM) is reset
+    through /proc/self/clear_refs instead, and the result is the peak minus
+    the RSS at start. Elsewhere tracemalloc's peak of Python allocations is
+    used.
+    """
+
+    def start(self) -> None:
+        self.use_proc = read_proc_status("VmRSS") is not None
+        if self.use_proc:
+            try:
+                with open("/proc/self/clear_refs", "w") as f:
+                    f.write("5")
+            except OSError:
+                self.use_proc = False
+        if self.use_proc:
+            self.start_kb = read_proc_status("VmRSS")
+        else:
+            tracemalloc.start()
+
+    def peak_mb(self) -> float:
+        if self.use_proc:
+            return max(read_proc_status("VmHWM") - self.start_kb, 0) / 1024
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / (1024 * 1024)
+
+
+RUNNERS = {
+    "procedure_export": run_procedure_export,
+    "export_inventories": run_export_inventories,
+    "delete_purchases": run_delete_purchases,
+    "update_inventory_quantities": run_update_inventory_quantities,
+    "create_or_update_mboms": run_create_or_update_mboms,
+    "attach_file_to_run": run_attach_file_to_run,
+}
+
+
+def run_in_child(name, server_url, workload, options, results) -> None:
+    """Run one benchmark; the entry point of each benchmark process."""
+    # Client side rate limiting would dominate a run against a local server.
+    os.environ["ION_RATE_LIMIT"] = str(options["rate_limit"])
+    # Every run fetches its own token from the mock server.
+    os.environ.pop("ION_TOKEN_CACHE", None)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        # Claim the root logger so the scripts' basicConfig doesn't write log
+        # files into the repo.
+        logging.basicConfig(
+            level=options["log_level"],
+            format="%(asctime)s %(levelname)-8s %(message)s",
+            filename=os.path.join(workdir, "log.txt"),
+        )
+        module = load_script(name, server_url)
+        from utilities.metrics import get_default_metrics
+
+        api_kwargs = {
+            "client_id": "benchmark",
+            "client_secret": "benchmark",
+            "auth_server": server_url,
+            "api_uri": server_url,
+            "logger": logging.getLogger(name),
+        }
+        memory = MemoryTracker()
+        memory.start()
+        started = time.perf_counter()
+        error = None
+        try:
+            RUNNERS[name](module, api_kwargs, workload, options)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        wall_time = time.perf_counter() - started
+        peak_memory_mb = memory.peak_mb()
+        client = get_default_metrics().summary()
+    results.put(
+        {
+            "wall_time": wall_time,
+            "peak_memory_mb": peak_memory_mb,
+            "retries": sum(stats["retries"] for stats in client.values()),
+            "client_errors": sum(stats["errors"] for stats in client.values()),
+            "error": error,
+        }
+    )
+
+
+def build_workload(name: str, tenant, size: TenantSize, seed: int) -> dict:
+    rng = random.Random(seed)
+    if name == "procedure_export":
+        return {"procedure_ids": [p["id"] for p in tenant.values("procedures")]}
+    if name == "update_inventory_quantities":
+        return {"rows": inventory_update_rows(tenant, rng)}
+    if name == "create_or_update_mboms":
+        return {"rows": mbom_rows(tenant, rng, size.mbom_rows)}
+    if name == "attach_file_to_run":
+        run = tenant.add("runs", {"steps": []})
+        run["steps"].append(tenant.add("runSteps", {"runId": run["id"], "position": 1}))
+        return {"run_id": run["id"], "size": UPLOAD_SIZE, "parts": UPLOAD_PARTS}
+    return {}
+
+
+def run_benchmark(name: str, size: TenantSize, options: dict) -> dict:
+    """
+    Run one benchmark against a fresh tenant.
+
+    Returns:
+        dict: Requests issued (total and per operation), wall time in seconds,
+            peak memory the run added to its process in MB, retries and any
+            error.
+    """
+    tenant = generate_tenant(size, options["seed"])
+    workload = build_workload(name, tenant, size, options["seed"])
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    with MockIonServer(
+        tenant,
+        latency=options["latency"],
+        error_rate=options["error_rate"],
+        upload_error_rate=options["upload_error_rate"],
+        seed=options["seed"],
+    ) as server:
+        process = context.Process(
+            target=run_in_child, args=(name, server.url, workload, options, results)
+        )
+        process.start()
+        result = results.get()
+        process.join()
+        requests_by_operation = server.stats()
+    return {
+        "name": name,
+        "requests": sum(requests_by_operation.values()),
+        "requests_by_operation": requests_by_operation,
+        **result,
+    }
+
+
+def compare_to_baseline(results: list, baseline: dict) -> list:
+    """
+    Returns:
+        list: Messages for benchmarks that issued more requests than the baseline.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result["name"])
+        if expected is None:
+            continue
+        if result["requests"] > expected["requests"]:
+            regressions.append(
+                f"{result['name']}: {result['requests']} requests, "
+                f"baseline {expected['requests']}"
+            )
+        for operation, count in result["requests_by_operation"].items():
+            if count > expected["requests_by_operation"].get(operation, 0):
+                regressions.append(
+                    f"{result['name']}: {count} {operation} requests, baseline "
+                    f"{expected['requests_by_operation'].get(operation, 0)}"
+                )
+    return regressions
+
+
+def print_report(results: list) -> None:
+    print(
+        f"{'benchmark':<30}{'requests':>10}{'wall time (s)':>16}"
+        f"{'peak mem (MB)':>16}{'retries':>10}"
+    )
+    for result in results:
+        print(
+            f"{result['name']:<30}{result['requests']:>10}{result['wall_time']:>16.2f}"
+            f"{result['peak_memory_mb']:>16.1f}{result['retries']:>10}"
+        )
+        if result["error"]:
+            print(f"    failed: {result['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the bulk scripts against a synthetic mock tenant."
+    )
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"Benchmarks to run (default: all): {', '.join(RUNNERS)}",
+    )
+    for field in fields(TenantSize):
+        parser.add_argument(
+            f"--{field.name.replace('_', '-')}",
+            type=int,
+            default=field.default,
+            help=f"Tenant size: {field.name.replace('_', ' ')} (default: {field.default})",
+        )
+    parser.add_argument("--seed", type=int, default=0, help="Tenant random seed")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Mock server latency per request"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of requests failing"
+    )
+    parser.add_argument(
+        "--upload-error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of file uploads and upload parts failing",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="Concurrency for scripts with it"
+    )
+    parser.add_argument(
+        "--slices", type=int, default=1, help="export_inventories --slices"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="procedure_export --workers"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet", "arrow"],
+        default="csv",
+        help="export_inventories output format",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=0,
+        help="ION_RATE_LIMIT for the scripts (default: 0, off)",
+    )
+    parser.add_argument("--log-level", type=str, default="INFO")
+    parser.add_argument("--output", type=str, help="Write the results to a json file")
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        help="Fail if any benchmark issues more requests than in this results file",
+    )
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(RUNNERS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    size = TenantSize(
+        **{field.name: getattr(args, field.name) for field in fields(TenantSize)}
+    )
+    options = {
+        "seed": args.seed,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "upload_error_rate": args.upload_error_rate,
+        "concurrency": args.concurrency,
+        "slices": args.slices,
+        "workers": args.workers,
+        "format": args.format,
+        "rate_limit": args.rate_limit,
+        "log_level": args.log_level.upper(),
+    }
+    results = [
+        run_benchmark(name, size, options) for name in args.benchmarks or RUNNERS
+    ]
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "size": asdict(size),
+                    "options": options,
+                    "results": {result["name"]: result for result in results},
+                },
+                f,
+                indent=2,
+            )
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["size"] != asdict(size) or baseline["options"] != options:
+            print("Warning: baseline was recorded with a different tenant or options.")
+        regressions = compare_to_baseline(results, baseline["results"])
+        for regression in regressions:
+            print(f"Request count regression: {regression}")
+        if regressions or any(result["error"] for result in results):
+            sys.exit(1)
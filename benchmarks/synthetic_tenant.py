@@ -0,0 +1,309 @@
+"""
+Generate synthetic ION tenants of a configurable size for benchmarking.
+
+The same size and seed always produce the same records in the same order, so
+request counts are comparable between runs.
+"""
+
+import os
+import sys
+import inspect
+
+# Reset the path so it can be run from the parent directory
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import random
+from dataclasses import dataclass
+
+from mock_ion_server.tenant import MockTenant, now
+
+
+@dataclass
+class TenantSize:
+    """Number of records to generate. Defaults give a run of a few seconds."""
+
+    procedures: int = 5
+    steps: int = 10
+    child_steps: int = 1
+    datagrid_rows: int = 5
+    assets: int = 1
+    parts: int = 50
+    inventories: int = 500
+    abom_children: int = 3
+    purchase_orders: int = 100
+    purchase_lines: int = 3
+    mbom_rows: int = 200
+
+
+def add_procedure(
+    tenant: MockTenant, rng: random.Random, index: int, size: TenantSize
+) -> dict:
+    """Add a procedure with steps, child steps, fields, datagrids and assets."""
+    label = tenant.values("labels")[index % len(tenant.values("labels"))]
+    procedure = tenant.add_procedure(
+        title=f"Procedure {index}",
+        description=f"Synthetic procedure {index}",
+        labels=[label["value"]],
+    )
+    # A file such as a logo, reused by every step of the procedure.
+    shared_attachment = tenant.add_file(
+        procedure["entityId"],
+        f"logo-{index}.png",
+        rng.randbytes(16 * 1024),
+        "image/png",
+    )
+    previous_step = None
+    for step_index in range(size.steps):
+        is_datagrid = step_index % 3 == 2
+        step = tenant.add_step(
+            procedureId=procedure["id"],
+            title=f"Step {step_index + 1}",
+            type="DATAGRID" if is_datagrid else "DEFAULT",
+            position=step_index + 1,
+            leadTime=rng.randint(0, 3600),
+        )
+        slate_content = [{"type": "paragraph", "children": [{"text": step["title"]}]}]
+        for asset_index in range(size.assets):
+            attachment = tenant.add_file(
+                step["entityId"],
+                f"step-{step['id']}-{asset_index}.png",
+                rng.randbytes(rng.randint(1024, 64 * 1024)),
+                "image/png",
+            )
+            slate_content.append(
+                {"type": "image", "reference": attachment["id"], "children": []}
+            )
+        slate_content.append(
+            {"type": "image", "reference": shared_attachment["id"], "children": []}
+        )
+        step["slateContent"] = slate_content
+        for field_index, field_type in enumerate(("NUMBER", "STRING")):
+            tenant.add(
+                "stepFields",
+                {
+                    "stepId": step["id"],
+                    "name": f"Field {field_index + 1}",
+                    "type": field_type,
+                    "unit": "mm" if field_type == "NUMBER" else None,
+                    "required": field_index == 0,
+                    "signoffRole": {"name": "Quality"} if field_index == 0 else None,
+                    "validations": [],
+                },
+            )
+        if is_datagrid:
+            add_datagrid(tenant, rng, step, size.datagrid_rows)
+        for child_index in range(size.child_steps):
+            tenant.add_step(
+                procedureId=procedure["id"],
+                parentId=step["id"],
+                title=f"Step {step_index + 1}.{child_index + 1}",
+                position=child_index + 1,
+            )
+        if previous_step:
+            tenant.add(
+                "stepEdges",
+                {"stepId": step["id"], "upstreamStepId": previous_step["id"]},
+            )
+        previous_step = step
+    return procedure
+
+
+def add_datagrid(tenant: MockTenant, rng: random.Random, step: dict, rows: int):
+    columns = [
+        tenant.add(
+            "datagridColumns",
+            {
+                "stepId": step["id"],
+                "header": header,
+                "type": column_type,
+                "position": position,
+                "allowNotApplicable": False,
+                "signoffRole": {"name": "Technician"} if header == "Pass" else None,
+            },
+        )
+        for position, (header, column_type) in enumerate(
+            (("Name", "STRING"), ("Value", "NUMBER"), ("Pass", "BOOLEAN")), start=1
+        )
+    ]
+    for position in range(1, rows + 1):
+        row = tenant.add_datagrid_row(stepId=step["id"], position=position)
+        values = (f"Row {position}", str(rng.randint(0, 100)), "true")
+        for column, value in zip(columns, values):
+            tenant.set_datagrid_value(
+                {"rowId": row["id"], "columnId": column["id"], "value": value}
+            )
+
+
+def add_inventories(tenant: MockTenant, rng: random.Random, size: TenantSize):
+    """Add top level inventories, each with an aBOM of installed children."""
+    parts = tenant.values("parts")
+    location = tenant.values("locations")[0]
+    for index in range(size.inventories):
+        part = parts[index % len(parts)]
+        children = []
+        for child_index in range(size.abom_children):
+            child_part = rng.choice(parts)
+            children.append(
+                tenant.add(
+                    "partInventories",
+                    {
+                        "partId": child_part["id"],
+                        "part": child_part,
+                        "serialNumber": f"SN-{index}-{child_index}",
+                        "lotNumber": None,
+                        "quantity": 1.0,
+                        "quantityAvailable": 0.0,
+                        "status": "INSTALLED",
+                        "locationId": location["id"],
+                        "abomItems": [],
+                        "buildRequirements": [],
+                        "updatedAt": now(),
+                    },
+                )
+            )
+        quantity = float(rng.randint(1, 20))
+        abom_items = []
+        if index % 10 == 0:
+            # Out of sync aBOM item, updated before the inventory.
+            abom_items.append(
+                tenant.add(
+                    "abomItems", {"quantity": quantity + 1, "partId": part["id"]}
+                )
+            )
+        tenant.add(
+            "partInventories",
+            {
+                "partId": part["id"],
+                "part": part,
+                "serialNumber": None if index % 4 == 0 else f"SN-{index}",
+                "lotNumber": f"LOT-{index // 4}" if index % 4 == 0 else None,
+                "quantity": quantity,
+                "quantityAvailable": quantity,
+                "status": "AVAILABLE" if index % 5 else "UNAVAILABLE",
+                "locationId": location["id"],
+                "abomItems": abom_items,
+                "buildRequirements": [
+                    {
+                        "abomInstallations": [
+                            {"quantity": 1.0, "partInventory": child}
+                            for child in children
+                        ]
+                    }
+                ],
+                "updatedAt": now(),
+            },
+        )
+
+
+def add_purchase_orders(tenant: MockTenant, rng: random.Random, size: TenantSize):
+    """Add purchase orders with lines; some are received."""
+    for index in range(size.purchase_orders):
+        # No ORDERED purchase orders: delete_purchases resets them to draft, which
+        # changes the etag it later deletes them with.
+        status = ("DRAFT", "DRAFT", "RECEIVED")[index % 3]
+        purchase_order = tenant.add(
+            "purchaseOrders",
+            {
+                "status": status,
+                "approvals": [{"id": 1}] if index % 17 == 0 else [],
+                "fees": [],
+                "approvalRequests": [],
+            },
+        )
+        for _ in range(size.purchase_lines):
+            received = status == "RECEIVED"
+            line = tenant.add(
+                "purchaseOrderLines",
+                {
+                    "purchaseOrder": purchase_order,
+                    "partInventories": [
+                        {
+                            "id": tenant.next_id(),
+                            "installed": False,
+                            "kitted": False,
+                            "received": received,
+                            "abomChildren": [],
+                        }
+                    ],
+                },
+            )
+            if received:
+                tenant.add(
+                    "receipts",
+                    {
+                        "purchaseOrderLines": [line],
+                        "purchaseOrderId": purchase_order["id"],
+                    },
+                )
+
+
+def add_reference_data(tenant: MockTenant, rng: random.Random, size: TenantSize):
+    for name in ("Admin", "Quality", "Technician", "Planner"):
+        tenant.add("roles", {"name": name, "permissionGroups": []})
+    for value in ("Flight", "Ground", "Prototype"):
+        tenant.add("labels", {"value": value, "createdById": 1, "updatedById": 1})
+    tenant.add("locations", {"name": "Warehouse"})
+    for index in range(size.parts):
+        tenant.add(
+            "parts",
+            {
+                "partNumber": f"PN-{index:05d}",
+                "description": f"Part {index}",
+                "revision": rng.choice("ABC"),
+            },
+        )
+
+
+def generate_tenant(size: TenantSize = None, seed: int = 0) -> MockTenant:
+    """
+    Generate a synthetic tenant.
+
+    Args:
+        size (TenantSize): Number of records of each kind.
+        seed (int): Random seed; the same seed gives the same tenant.
+
+    Returns:
+        MockTenant: Tenant to serve with MockIonServer.
+    """
+    size = size or TenantSize()
+    rng = random.Random(seed)
+    tenant = MockTenant()
+    add_reference_data(tenant, rng, size)
+    for index in range(size.procedures):
+        add_procedure(tenant, rng, index, size)
+    add_inventories(tenant, rng, size)
+    add_purchase_orders(tenant, rng, size)
+    return tenant
+
+
+def inventory_update_rows(tenant: MockTenant, rng: random.Random) -> list:
+    """Rows for update_inventory_quantities, header first, like the csv."""
+    rows = [["inventory_id", "new_quantity"]]
+    for inventory in tenant.values("partInventories"):
+        if inventory["buildRequirements"]:
+            rows.append([str(inventory["id"]), f"{rng.randint(1, 20)}.000"])
+    return rows
+
+
+def mbom_rows(tenant: MockTenant, rng: random.Random, count: int) -> list:
+    """Rows for create_or_update_mboms in depth notation, header first."""
+    rows = [
+        [
+            "depth",
+            "part_number",
+            "revision",
+            "quantity",
+            "substitutes",
+            "made_on_assembly",
+        ]
+    ]
+    parts = tenant.values("parts")
+    for index in range(count):
+        part = parts[index % len(parts)]
+        depth = 0 if index == 0 else rng.randint(1, 3)
+        rows.append(
+            [str(depth), part["partNumber"], part["revision"], "1", "", "false"]
+        )
+    return rows
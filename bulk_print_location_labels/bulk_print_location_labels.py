@@ -78,6 +78,28 @@ def get_location(location_id, api):
     return api.request(request_body)["data"]
 
 
+def create_barcode_labels(locations, template_id, api):
+    """Look up all locations and create their barcode labels in batched requests."""
+    location_bodies = [
+        {"query": queries.GET_LOCATION, "variables": {"id": location[0]}}
+        for location in locations
+    ]
+    location_results = api.batch(location_bodies, raise_on_error=True)
+    label_bodies = [
+        {
+            "query": queries.CREATE_BARCODE_LABEL,
+            "variables": {
+                "input": {
+                    "entityId": result["data"]["location"]["entityId"],
+                    "templateId": template_id,
+                }
+            },
+        }
+        for result in location_results
+    ]
+    return [result["data"] for result in api.batch(label_bodies, raise_on_error=True)]
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Bulk print location barcode labels.")
     try:
@@ -100,11 +122,8 @@ if __name__ == "__main__":
         print(f"Available template: {templates}")
         template_id = input("Enter the template id: ")
         printer_ip = input("Enter the printer ip: ")
-        for location in locations:
-            location_data = get_location(location[0], ion_api)
-            barcode_label = create_barcode_label(
-                location_data["location"]["entityId"], int(template_id), ion_api
-            )
+        barcode_labels = create_barcode_labels(locations, int(template_id), ion_api)
+        for barcode_label in barcode_labels:
             print_label(
                 barcode_label["createBarcodeLabel"]["barcodeLabel"]["barcode"],
                 printer_ip,
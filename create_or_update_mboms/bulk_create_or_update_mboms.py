@@ -12,7 +12,7 @@ sys.path.insert(0, parentdir)
 
 import argparse # noqa: E402
 from utilities.api import Api  # noqa: E402
-from utilities.csv_helper import CsvHelper # noqa: E402
+from utilities.csv_helper import CsvHelper, to_bool # noqa: E402
 import queries # noqa: E402
 from config import config # noqa: E402
 import logging # noqa: E402
@@ -26,6 +26,17 @@ logging.basicConfig(
     filemode="w",
 )
 
+CSV_COLUMNS = ("part_number", "revision", "quantity", "substitutes", "made_on_assembly")
+
+
+def read_mbom_rows(csv_file_path: str, is_level_notation: bool = False):
+    """Lazily read mBOM rows from the csv, one typed row dict at a time."""
+    notation_column = "level" if is_level_notation else "depth"
+    types = {"quantity": float, "made_on_assembly": to_bool}
+    if not is_level_notation:
+        types["depth"] = int
+    return CsvHelper.iter_csv(csv_file_path, (notation_column,) + CSV_COLUMNS, types)
+
 
 def create_or_update_mboms(api: Api, input_list: list[dict], is_level_notation: bool = False):
     """Create or update mboms."""
@@ -45,24 +56,24 @@ def create_or_update_mboms(api: Api, input_list: list[dict], is_level_notation:
     logger.info(f"Response: {res}")
     return res["data"]["createOrUpdateMultipleMboms"]
 
-def convert_csv_rows_into_json(csv_data: list, is_level_notation: bool = False) -> list[dict]:
-    items_length: int = len(csv_data) - 1
-    logger.info(f"{items_length} mBOM items to process.")
+def convert_csv_rows_into_json(rows, is_level_notation: bool = False) -> list[dict]:
+    """
+    Convert rows from read_mbom_rows into mutation inputs. Depth and level
+    notation are relative to earlier rows, so all rows go in one mutation.
+    """
+    mbom_notation: str = "level" if is_level_notation else "depth"
     input_list: list[dict] = []
-    for index, row in enumerate(csv_data):
-        if index == 0:
-            continue
-        logger.info(f"Processing row {index}/{items_length}")
-        mbom_notation: str = "level" if is_level_notation else "depth"
+    for index, row in enumerate(rows, start=1):
+        logger.debug(f"Processing row {index}")
         input_list.append({
-            mbom_notation: row[0] if is_level_notation else int(row[0]),
-            "partNumber": row[1],
-            "revision": row[2],
-            "quantity": float(row[3]),
-            "substitutes": row[4],
-            "madeOnAssembly": row[5].strip().lower() == "true"
+            mbom_notation: row[mbom_notation],
+            "partNumber": row["part_number"],
+            "revision": row["revision"],
+            "quantity": row["quantity"],
+            "substitutes": row["substitutes"],
+            "madeOnAssembly": bool(row["made_on_assembly"])
         })
-    logger.info(f"Input list: {input_list}")
+    logger.info(f"{len(input_list)} mBOM items to process.")
     return input_list
 
 
@@ -92,10 +103,8 @@ if __name__ == "__main__":
         csv_file_path: str = "create_or_update_mboms/create_or_update_mboms_depth.csv"
         if args.level:
             csv_file_path = "create_or_update_mboms/create_or_update_mboms_level.csv"
-        csv_data: list = CsvHelper.read_from_csv(csv_file_path)
-        logger.info(csv_data)
-        json_data: list[dict] = convert_csv_rows_into_json(csv_data, args.level)
-        logger.info(json_data)
+        rows = read_mbom_rows(csv_file_path, args.level)
+        json_data: list[dict] = convert_csv_rows_into_json(rows, args.level)
         resp: dict = create_or_update_mboms(api, json_data, args.level)
         logger.info(resp)
         if len(resp["errorMessages"]) > 0:
@@ -32,14 +32,18 @@ logging.basicConfig(
 PURCHASES_TO_SKIP = []
 
 
+def get_all(api, query, connection):
+    """Walk every page of a connection, returned in the single-page response shape."""
+    nodes = api.paginate(query, connection)
+    return {connection: {"edges": [{"node": node} for node in nodes]}}
+
+
 def get_receipts(api):
-    request_body = {"query": queries.GET_RECEIPTS}
-    return api.request(request_body)["data"]
+    return get_all(api, queries.GET_RECEIPTS, "receipts")
 
 
 def get_purchase_lines(api):
-    request_body = {"query": queries.GET_PURCHASE_LINES}
-    return api.request(request_body)["data"]
+    return get_all(api, queries.GET_PURCHASE_LINES, "purchaseOrderLines")
 
 
 def get_purchase_line_etag(id, api):
@@ -50,8 +54,7 @@ def get_purchase_line_etag(id, api):
 
 
 def get_purchases(api):
-    request_body = {"query": queries.GET_PURCHASES}
-    return api.request(request_body)["data"]
+    return get_all(api, queries.GET_PURCHASES, "purchaseOrders")
 
 
 def update_ordered_status_to_draft(po_id, po_etag, api):
@@ -59,7 +62,8 @@ def update_ordered_status_to_draft(po_id, po_etag, api):
         "query": queries.UPDATE_PURCHASE,
         "variables": {"input": {"id": po_id, "etag": po_etag, "status": "DRAFT"}},
     }
-    api.request(request_body)
+    # The etag guards against applying a replayed update twice.
+    api.request(request_body, idempotent=True, replayed_ok=("etag_mismatch",))
 
 
 def build_list_aboms_items(purchase_order_lines):
@@ -107,7 +111,7 @@ def delete_purchase_lines(purchase_lines, api):
             "query": queries.DELETE_PURCHASE_LINE,
             "variables": {"id": purchase_line_id, "etag": etag},
         }
-        api.request(request_body)
+        api.request(request_body, idempotent=True, replayed_ok=("not_found",))
 
 
 def delete_purchases(purchases, api):
@@ -127,7 +131,7 @@ def delete_purchases(purchases, api):
             "query": queries.DELETE_PURCHASE,
             "variables": {"id": purchase_id, "etag": etag},
         }
-        api.request(request_body)
+        api.request(request_body, idempotent=True, replayed_ok=("not_found",))
 
 
 if __name__ == "__main__":
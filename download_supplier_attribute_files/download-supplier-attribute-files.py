@@ -8,10 +8,13 @@ import logging
 import os
 import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from urllib.parse import urlparse, unquote
 
 import requests
+import urllib3
 
 # Add parent directory to path for local imports
 currentdir = os.path.dirname(os.path.abspath(__file__))
@@ -20,6 +23,7 @@ sys.path.insert(0, parentdir)
 
 from config import config
 from utilities.api import Api
+from utilities.retry import RetryPolicy
 
 # Configure logging with absolute path for log file
 log_file = os.path.join(currentdir, "download-supplier-attribute-files.log")
@@ -37,6 +41,29 @@ logging.basicConfig(
 # Constants
 DEFAULT_TIMEOUT = 60  # seconds
 PAGE_SIZE = 100  # Number of suppliers per page
+DEFAULT_WORKERS = 1  # Concurrent downloads
+# Reads start at MIN_CHUNK_SIZE and double, up to MAX_CHUNK_SIZE, while each
+# read takes less than FAST_READ seconds; they halve when one takes longer
+# than SLOW_READ seconds.
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+FAST_READ = 0.05
+SLOW_READ = 1.0
+# Downloads are written here first and renamed when complete, so an
+# interrupted download never leaves a truncated file under the real name.
+PARTIAL_SUFFIX = ".part"
+# The ETag or Last-Modified of the file a .part file was started from, kept
+# next to it so resuming only appends to the same version of the file.
+VALIDATOR_SUFFIX = ".part.validator"
+# Errors of a download that broke off part way; urllib3 raises these from
+# response.raw without wrapping them.
+DOWNLOAD_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.ReadTimeoutError,
+)
 
 
 def format_attribute_names(attribute_names_csv: str) -> list[str]:
@@ -97,46 +124,17 @@ def get_attribute_files(
     }
     """
     
-    all_edges = []
-    has_next_page = True
-    cursor = None
-    page_num = 1
-    
-    while has_next_page:
-        variables = {
-            "first": page_size,
-        }
-        if supplier_filters:
-            variables["supplierFilters"] = supplier_filters
-        if cursor:
-            variables["after"] = cursor
-        
-        request_body = {
-            "query": query,
-            "variables": variables
-        }
-        
-        logger.info(f"Querying suppliers (page {page_num})...")
-        result = api.request(request_body)
-        
-        if not result or "data" not in result:
-            logger.warning("No data returned from API")
-            break
-            
-        suppliers_data = result["data"].get("suppliers")
-        if not suppliers_data:
-            logger.warning("No suppliers data in response")
-            break
-            
-        edges = suppliers_data.get("edges", [])
-        if edges:
-            all_edges.extend(edges)
-            logger.info(f"Retrieved {len(edges)} suppliers on page {page_num}")
-        
-        page_info = suppliers_data.get("pageInfo", {})
-        has_next_page = page_info.get("hasNextPage", False)
-        cursor = page_info.get("endCursor")
-        page_num += 1
+    variables = {}
+    if supplier_filters:
+        variables["supplierFilters"] = supplier_filters
+
+    logger.info("Querying suppliers...")
+    all_edges = [
+        {"node": node}
+        for node in api.paginate(
+            query, "suppliers", variables=variables, page_size=page_size
+        )
+    ]
     
     logger.info(f"Total suppliers retrieved: {len(all_edges)}")
     return all_edges
@@ -158,36 +156,182 @@ def is_valid_url(url: str) -> bool:
         return False
 
 
-def download_file(url: str, filename: str, timeout: int = DEFAULT_TIMEOUT) -> None:
+def download_file(
+    url: str,
+    filename: str,
+    timeout: int = DEFAULT_TIMEOUT,
+    session: Optional[requests.Session] = None,
+    retry_policy: Optional[RetryPolicy] = None
+) -> None:
     """Download a file from a URL.
-    
+
+    The file is written to `filename.part` and renamed to filename once it is
+    complete. If a `.part` file is left over from an interrupted download, only
+    the rest of the file is requested (HTTP Range), and a download that fails
+    part way is retried from where it stopped. The rest is only appended if
+    the server confirms the file hasn't changed since (If-Range); otherwise
+    the whole file is downloaded again.
+
     Args:
         url: URL to download from
         filename: Local filename to save to
         timeout: Request timeout in seconds
-        
+        session: Session to reuse connections from
+        retry_policy: When to retry a failed download, defaults to RetryPolicy()
+
     Raises:
         requests.exceptions.RequestException: If download fails
     """
-    response = requests.get(url, stream=True, timeout=timeout)
-    response.raise_for_status()
-    
-    # Log file size if available
-    content_length = response.headers.get('content-length')
-    if content_length:
-        size_mb = int(content_length) / 1024 / 1024
-        logger.info(f"Downloading {size_mb:.2f} MB...")
-    
-    with open(filename, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    session = session or requests
+    retry_policy = retry_policy or RetryPolicy()
+    partial = filename + PARTIAL_SUFFIX
+    validator = filename + VALIDATOR_SUFFIX
+    attempt = 0
+    while True:
+        try:
+            if _download_to_partial(url, partial, validator, timeout, session):
+                break
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code
+            if not retry_policy.should_retry_status(status, attempt, True):
+                raise
+            retry_after = e.response.headers.get("Retry-After")
+        except DOWNLOAD_ERRORS:
+            if not retry_policy.should_retry_error(attempt, True):
+                raise
+            retry_after = None
+        else:
+            # The server has a different file than the partial download was
+            # started from; start over.
+            if os.path.exists(partial):
+                os.remove(partial)
+            retry_after = 0
+        delay = retry_policy.backoff(attempt, retry_after)
+        logger.warning(f"Retrying download of '{filename}' in {delay:.1f}s")
+        time.sleep(delay)
+        attempt += 1
+    os.replace(partial, filename)
+    if os.path.exists(validator):
+        os.remove(validator)
+
+
+def _download_to_partial(
+    url: str,
+    partial: str,
+    validator: str,
+    timeout: int,
+    session
+) -> bool:
+    """Download a file, or the rest of it, into a partial file.
+
+    Returns:
+        True if the partial file is complete, False if the server rejected
+        the range requested and the partial file must be discarded
+    """
+    offset = 0
+    # Range offsets count encoded bytes, so ask for the file as stored.
+    headers = {"Accept-Encoding": "identity"}
+    # Without a validator there is no telling which version of the file the
+    # partial file holds, so it is downloaded again.
+    if os.path.exists(partial) and os.path.exists(validator):
+        offset = os.path.getsize(partial)
+        with open(validator) as f:
+            headers["If-Range"] = f.read()
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416:
+            # Nothing left to download if the partial file is the whole file.
+            content_range = response.headers.get("Content-Range", "")
+            return content_range == f"bytes */{offset}"
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            content_range = response.headers.get("Content-Range", "")
+            if not content_range.startswith(f"bytes {offset}-"):
+                return False
+            logger.info(f"Resuming '{partial}' from {offset / 1024 / 1024:.2f} MB...")
+            mode = 'ab'
+        else:
+            # The file changed or the server ignored the range; download the
+            # whole file again.
+            offset = 0
+            mode = 'wb'
+            _save_validator(response, validator)
+
+        # Log file size if available
+        content_length = response.headers.get('content-length')
+        if content_length:
+            size_mb = int(content_length) / 1024 / 1024
+            logger.info(f"Downloading {size_mb:.2f} MB...")
+
+        chunk_size = MIN_CHUNK_SIZE
+        with open(partial, mode) as f:
+            while True:
+                started_at = time.monotonic()
+                chunk = response.raw.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                elapsed = time.monotonic() - started_at
+                if elapsed < FAST_READ:
+                    chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+                elif elapsed > SLOW_READ:
+                    chunk_size = max(chunk_size // 2, MIN_CHUNK_SIZE)
+            f.flush()
+            os.fsync(f.fileno())
+        if content_length and os.path.getsize(partial) - offset < int(content_length):
+            raise requests.exceptions.ConnectionError(
+                f"Connection closed after {os.path.getsize(partial)} bytes of '{partial}'"
+            )
+    return True
+
+
+def _save_validator(response: requests.Response, validator: str) -> None:
+    """Keep the ETag or Last-Modified of a download for resuming it with If-Range."""
+    value = response.headers.get("ETag")
+    if not value or value.startswith("W/"):
+        # Weak ETags can't be used with If-Range.
+        value = response.headers.get("Last-Modified")
+    if value:
+        with open(validator, "w") as f:
+            f.write(value)
+    elif os.path.exists(validator):
+        os.remove(validator)
+
+
+def download_attribute_file(
+    url: str,
+    filename: str,
+    supplier_name: str,
+    key: str,
+    timeout: int = DEFAULT_TIMEOUT,
+    session: Optional[requests.Session] = None
+) -> bool:
+    """Download one supplier attribute file, logging rather than raising errors.
+
+    Returns:
+        True if the file was downloaded
+    """
+    try:
+        logger.info(f"Downloading '{key}' for supplier '{supplier_name}' to '{filename}'...")
+        download_file(url, filename, timeout, session)
+        logger.info(f"Successfully downloaded '{filename}'")
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to download file for supplier '{supplier_name}', attribute '{key}': {e}")
+    except Exception as e:
+        logger.error(f"Error processing attribute '{key}' for supplier '{supplier_name}': {e}")
+    return False
 
 
 def process_suppliers(
     nodes: list[dict],
     output_dir: str,
     attribute_names_csv: str,
-    force_overwrite: bool = False
+    force_overwrite: bool = False,
+    workers: int = DEFAULT_WORKERS,
+    timeout: int = DEFAULT_TIMEOUT
 ) -> None:
     """Process supplier nodes and download their attribute files.
     
@@ -196,8 +340,13 @@ def process_suppliers(
         output_dir: Directory to save downloaded files
         attribute_names_csv: Comma-separated string of attribute names to filter by
         force_overwrite: If True, overwrite existing files without warning
+        workers: Number of files to download at a time
+        timeout: Download timeout in seconds
     """
     filter_names = format_attribute_names(attribute_names_csv)
+    # (url, filename, supplier name, attribute key) of each file to download
+    downloads = []
+    filenames = set()
     
     for edge in nodes:
         supplier = edge['node']
@@ -251,16 +400,35 @@ def process_suppliers(
                 if os.path.exists(filename) and not force_overwrite:
                     logger.warning(f"File '{filename}' already exists, skipping. Use --force to overwrite.")
                     continue
+                if filename in filenames:
+                    logger.warning(f"File '{filename}' is already being downloaded for another supplier, skipping.")
+                    continue
+
+                filenames.add(filename)
+                downloads.append((url, filename, supplier_name, key))
                 
-                logger.info(f"Downloading '{key}' for supplier '{supplier_name}' to '{filename}'...")
-                download_file(url, filename)
-                logger.info(f"Successfully downloaded '{filename}'")
-                
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Failed to download file for supplier '{supplier_name}', attribute '{key}': {e}")
             except Exception as e:
                 logger.error(f"Error processing attribute '{key}' for supplier '{supplier_name}': {e}")
 
+    logger.info(f"Downloading {len(downloads)} files, {workers} at a time...")
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(workers, 10))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if workers <= 1:
+            results = [
+                download_attribute_file(*download, timeout, session)
+                for download in downloads
+            ]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(download_attribute_file, *download, timeout, session)
+                    for download in downloads
+                ]
+                results = [future.result() for future in futures]
+    logger.info(f"Downloaded {sum(results)} of {len(downloads)} files")
+
 
 def validate_config(config_dict: dict) -> tuple[str, str, str, str]:
     """Validate and extract required configuration values.
@@ -295,6 +463,7 @@ if __name__ == "__main__":
     parser.add_argument('--output-dir', default='.', help='Output directory for downloaded files (default: current directory)')
     parser.add_argument('--force', action='store_true', help='Overwrite existing files without warning')
     parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT, help=f'Download timeout in seconds (default: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'Number of files to download at a time (default: {DEFAULT_WORKERS})')
     args = parser.parse_args()
     
     try:
@@ -328,7 +497,9 @@ if __name__ == "__main__":
                 os.makedirs(output_dir)
                 logger.info(f"Created output directory: {output_dir}")
             
-            process_suppliers(nodes, output_dir, args.attribute_names, args.force)
+            process_suppliers(
+                nodes, output_dir, args.attribute_names, args.force, args.workers, args.timeout
+            )
             
     except Exception as e:
         error = f"Error occurred while running script: {e}"
@@ -11,8 +11,12 @@ currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentfram
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 
+import json
+import heapq
 import argparse
-from utilities.api import Api
+from datetime import datetime, timedelta, timezone
+from utilities.api import Api, POOL_MAXSIZE
+from utilities.columnar_helper import ColumnarHelper
 from utilities.csv_helper import CsvHelper
 from config import config
 
@@ -28,76 +32,290 @@ logging.basicConfig(
 )
 
 
-def get_inventories(api: Api):
-    """Get inventories paginated 100 records at a time."""
-    inventories = []
-    query = """
-        query GetInventories($after: String) {
-            partInventories(first: 50, after: $after) {
-                edges {
-                    node {
-                        part {
-                            partNumber
-                            description
-                        }
-                        serialNumber
-                        lotNumber
-                        buildRequirements {
-                            abomInstallations {
-                                quantity
-                                partInventory {
-                                    part {
-                                        partNumber
-                                        description
-                                    }
-                                    serialNumber
-                                    lotNumber
+GET_INVENTORIES = """
+    query GetInventories($filters: PartInventoriesInputFilters, $first: Int, $after: String) {
+        partInventories(filters: $filters, first: $first, after: $after, sort: [ID_ASC]) {
+            edges {
+                node {
+                    id
+                    updatedAt
+                    part {
+                        partNumber
+                        description
+                    }
+                    serialNumber
+                    lotNumber
+                    buildRequirements {
+                        abomInstallations {
+                            quantity
+                            partInventory {
+                                part {
+                                    partNumber
+                                    description
                                 }
+                                serialNumber
+                                lotNumber
                             }
                         }
                     }
                 }
-                pageInfo {
-                    endCursor
-                    hasNextPage
+            }
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
+        }
+    }
+"""
+
+INVENTORY_COLUMNS = [
+    "inventoryId",
+    "parentPartNumber",
+    "parentPartDescription",
+    "serialNumber",
+    "lotNumber",
+    "childPartNumber",
+    "childPartDescription",
+    "childSerialNumber",
+    "childLotNumber",
+]
+
+# Incremental exports re-fetch inventories updated this long before the previous
+# run started, covering clock skew and updates made while it was paging.
+INCREMENTAL_OVERLAP = timedelta(minutes=10)
+
+# The updatedAt filter can't see deleted inventories, so incremental exports
+# sweep all inventory ids this often and drop the rows of any that are gone.
+ID_SWEEP_INTERVAL = timedelta(days=7)
+
+GET_INVENTORY_IDS = """
+    query GetInventoryIds($filters: PartInventoriesInputFilters, $first: Int, $after: String) {
+        partInventories(filters: $filters, first: $first, after: $after, sort: [ID_ASC]) {
+            edges {
+                node {
+                    id
                 }
             }
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
         }
+    }
+"""
+
+GET_MAX_INVENTORY_ID = """
+    query GetMaxInventoryId {
+        partInventories(first: 1, sort: [ID_DESC]) {
+            edges {
+                node {
+                    id
+                }
+            }
+        }
+    }
+"""
+
+
+def get_inventory_rows(inventory: dict) -> list:
+    """Flatten an inventory into one row per aBOM installation."""
+    rows = []
+    for build_requirement in inventory["buildRequirements"]:
+        for abom_installation in build_requirement["abomInstallations"]:
+            rows.append({
+                "inventoryId": inventory["id"],
+                "parentPartNumber": inventory["part"]["partNumber"],
+                "parentPartDescription": inventory["part"]["description"],
+                "serialNumber": inventory["serialNumber"],
+                "lotNumber": inventory["lotNumber"],
+                "childPartNumber": abom_installation["partInventory"]["part"]["partNumber"],
+                "childPartDescription": abom_installation["partInventory"]["part"]["description"],
+                "childSerialNumber": abom_installation["partInventory"]["serialNumber"],
+                "childLotNumber": abom_installation["partInventory"]["lotNumber"],
+            })
+    return rows
+
+
+def get_max_inventory_id(api: Api) -> int:
+    """Get the highest inventory id, used as the upper bound of the id space."""
+    edges = api.request({"query": GET_MAX_INVENTORY_ID})["data"]["partInventories"]["edges"]
+    return int(edges[0]["node"]["id"]) if edges else 0
+
+
+def get_inventory_nodes(api: Api, slices: int = 1, filters: dict = None):
     """
-    has_next_page = True
-    after_id = None
-    while has_next_page:
-        request_body = {"query": query, "variables": {"after": after_id}}
-        response = api.request(request_body)
-        for inventory in response["data"]["partInventories"]["edges"]:
-            for build_requirement in inventory["node"]["buildRequirements"]:
-                for abom_installation in build_requirement["abomInstallations"]:
-                    inventories.append({
-                        "parentPartNumber": inventory["node"]["part"]["partNumber"],
-                        "parentPartDescription": inventory["node"]["part"]["description"],
-                        "serialNumber": inventory["node"]["serialNumber"],
-                        "lotNumber": inventory["node"]["lotNumber"],
-                        "childPartNumber": abom_installation["partInventory"]["part"]["partNumber"],
-                        "childPartDescription": abom_installation["partInventory"]["part"]["description"],
-                        "childSerialNumber": abom_installation["partInventory"]["serialNumber"],
-                        "childLotNumber": abom_installation["partInventory"]["lotNumber"],
-                    })
-        has_next_page = response["data"]["partInventories"]["pageInfo"]["hasNextPage"]
-        after_id = response["data"]["partInventories"]["pageInfo"]["endCursor"]
-    return inventories
-
-
-def export_inventories(inventories):
+    Lazily get inventories, paginated 50 records at a time.
+
+    With slices > 1 the id space is split into that many ranges which are
+    fetched in parallel and merged back in id order.
     """
-    Exports inventories to csv.
+    variables = {"filters": filters} if filters else None
+    if slices > 1:
+        max_id = get_max_inventory_id(api)
+        logger.info(f"Exporting inventories 1-{max_id} in {slices} parallel slices")
+        nodes = api.paginate_ranges(
+            GET_INVENTORIES, "partInventories", "id", 1, max_id + 1, slices, variables, page_size=50
+        )
+    else:
+        nodes = api.paginate(
+            GET_INVENTORIES, "partInventories", variables, page_size=50, prefetch=True
+        )
+    return nodes
+
+
+def get_inventory_ids(api: Api, slices: int = 1) -> set:
+    """Get the ids of all inventories, see get_inventory_nodes."""
+    if slices > 1:
+        max_id = get_max_inventory_id(api)
+        nodes = api.paginate_ranges(
+            GET_INVENTORY_IDS, "partInventories", "id", 1, max_id + 1, slices
+        )
+    else:
+        nodes = api.paginate(GET_INVENTORY_IDS, "partInventories", prefetch=True)
+    return {int(node["id"]) for node in nodes}
+
+
+def get_inventories(api: Api, slices: int = 1):
+    """Lazily get inventory rows, see get_inventory_nodes."""
+    for inventory in get_inventory_nodes(api, slices):
+        yield from get_inventory_rows(inventory)
+
+
+def export_inventories(inventories, file_path="export_inventories_with_abom/inventories.csv"):
+    """
+    Exports inventories as they are fetched. The format follows the extension:
+    .parquet, .arrow (Arrow IPC stream), or csv, gzipped if it ends in .gz.
+    """
+    if file_path.endswith(".parquet"):
+        count = ColumnarHelper.write_to_parquet(inventories, file_path, INVENTORY_COLUMNS)
+    elif file_path.endswith(".arrow"):
+        count = ColumnarHelper.write_to_arrow(inventories, file_path, INVENTORY_COLUMNS)
+    else:
+        count = CsvHelper.write_to_csv(inventories, file_path, INVENTORY_COLUMNS)
+    logger.info(f"Exported {count} inventory rows to {file_path}")
+
+
+def read_export(file_path):
+    """Lazily read the rows of an export written by export_inventories."""
+    if file_path.endswith(".parquet"):
+        return ColumnarHelper.read_parquet(file_path)
+    if file_path.endswith(".arrow"):
+        return ColumnarHelper.read_arrow(file_path)
+    return CsvHelper.iter_csv(file_path)
+
+
+def merge_inventory_rows(
+    existing_rows, changed_rows: list, changed_ids: set, live_ids: set = None
+):
+    """
+    Replace the rows of changed inventories in an export, keeping id order.
+
+    Args:
+        existing_rows: Rows of the previous export, in inventory id order.
+        changed_rows (list): Rows of the changed inventories.
+        changed_ids (set): Ids of all changed inventories, including ones that
+            no longer have any aBOM installations.
+        live_ids (set, optional): Ids of all existing inventories. When given,
+            rows of inventories that aren't in it are dropped as deleted.
+
+    Yields:
+        dict: Next row of the merged export.
+    """
+    def inventory_id(row):
+        return int(row["inventoryId"])
+
+    kept_rows = (
+        row
+        for row in existing_rows
+        if inventory_id(row) not in changed_ids
+        and (live_ids is None or inventory_id(row) in live_ids)
+    )
+    yield from heapq.merge(
+        kept_rows, sorted(changed_rows, key=inventory_id), key=inventory_id
+    )
+
+
+def export_inventories_incremental(api: Api, file_path: str, slices: int = 1):
+    """
+    Export only inventories updated since the previous run, merged into its output.
+
+    The high water mark is kept in <file_path>.state.json and only advanced once
+    the output is complete. Without a previous output it does a full export.
+    Every ID_SWEEP_INTERVAL it also fetches all inventory ids to drop the rows
+    of deleted inventories, which the updatedAt filter can't see.
     """
-    CsvHelper.write_to_csv(inventories, "export_inventories_with_abom/inventories.csv")
+    state_path = f"{file_path}.state.json"
+    started_at = datetime.now(timezone.utc)
+    state = None
+    if os.path.exists(state_path) and os.path.exists(file_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    if state is None:
+        logger.info("No previous incremental export, exporting all inventories")
+        export_inventories(get_inventories(api, slices), file_path)
+        ids_swept_at = started_at.isoformat()
+    else:
+        since = state["highWaterMark"]
+        changed_ids = set()
+        changed_rows = []
+        filters = {"updatedAt": {"gte": since}}
+        for inventory in get_inventory_nodes(api, slices, filters):
+            changed_ids.add(int(inventory["id"]))
+            changed_rows.extend(get_inventory_rows(inventory))
+        logger.info(f"{len(changed_ids)} inventories changed since {since}")
+        live_ids = None
+        ids_swept_at = state.get("idsSweptAt")
+        if (
+            ids_swept_at is None
+            or started_at - datetime.fromisoformat(ids_swept_at) >= ID_SWEEP_INTERVAL
+        ):
+            live_ids = get_inventory_ids(api, slices)
+            ids_swept_at = started_at.isoformat()
+            logger.info(f"Swept {len(live_ids)} inventory ids to find deleted inventories")
+        # Write next to the output and swap it in, so an interrupted run leaves
+        # the previous export untouched.
+        directory, file_name = os.path.split(file_path)
+        partial_path = os.path.join(directory, f".partial-{file_name}")
+        merged_rows = merge_inventory_rows(
+            read_export(file_path), changed_rows, changed_ids, live_ids
+        )
+        export_inventories(merged_rows, partial_path)
+        os.replace(partial_path, file_path)
+
+    high_water_mark = (started_at - INCREMENTAL_OVERLAP).isoformat()
+    with open(f"{state_path}.tmp", "w") as f:
+        json.dump({"highWaterMark": high_water_mark, "idsSweptAt": ids_swept_at}, f)
+    os.replace(f"{state_path}.tmp", state_path)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Migrate a procedure from one environment to another."
+        description="Export all inventories with aBOM installations to csv."
+    )
+    parser.add_argument(
+        "--slices",
+        type=int,
+        default=1,
+        help="Split the inventory id space into this many ranges fetched in parallel",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Write export_inventories_with_abom/inventories.csv.gz instead",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet", "arrow"],
+        default="csv",
+        help="Output format; parquet and arrow need pyarrow (default: csv)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch inventories updated since the last incremental run and merge them into its output",
     )
+    args = parser.parse_args()
     try:
         auth_server = config["ION_AUTH_SERVER"]
         api_uri = config["ION_API_URI"]
@@ -113,9 +331,15 @@ if __name__ == "__main__":
             auth_server=auth_server,
             api_uri=api_uri,
             logger=logger,
+            pool_maxsize=max(args.slices, POOL_MAXSIZE),
         )
-        inventories = get_inventories(api)
-        export_inventories(inventories)
+        file_path = f"export_inventories_with_abom/inventories.{args.format}"
+        if args.format == "csv" and args.gzip:
+            file_path += ".gz"
+        if args.incremental:
+            export_inventories_incremental(api, file_path, args.slices)
+        else:
+            export_inventories(get_inventories(api, args.slices), file_path)
 
         print("Completed exporting inventories.")
     except Exception as e:
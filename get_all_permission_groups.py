@@ -9,22 +9,17 @@ from utilities.csv_helper import CsvHelper
 import queries
 
 
-def get_all_permission_groups(api: Api) -> list:
+def get_all_permission_groups(api: Api):
     """
-    Gets all permission groups that exist within ION.
+    Lazily gets all permission groups that exist within ION, page by page.
     """
-    permission_groups_query = {
-        "query": queries.GET_PERMISSION_GROUPS,
-    }
-    permission_groups = api.request(permission_groups_query)
-    return [
-        permission_group["node"]
-        for permission_group in permission_groups["data"]["permissionGroups"]["edges"]
-    ]
+    return api.paginate(queries.GET_PERMISSION_GROUPS, "permissionGroups")
 
 
 def write_to_csv(permission_groups):
-    CsvHelper.write_to_csv(permission_groups, "permission_groups.csv")
+    CsvHelper.write_to_csv(
+        permission_groups, "permission_groups.csv", ["id", "name", "family"]
+    )
 
 
 if __name__ == "__main__":
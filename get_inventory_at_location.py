@@ -14,15 +14,14 @@ Loc = 301
 
 
 def get_inv(loc, api):
-    query = {
-        "query": queries.GET_PART_INVENTORIES,
-        "variables": {
-            "filters": {"locationId": {"eq": loc}, "status": {"neq": "INSTALLED"}}
-        },
-    }
-    r = api.request(query)
-    num = len(r["data"]["partInventories"]["edges"])
-    d_list = [r["data"]["partInventories"]["edges"][i]["node"] for i in range(num)]
+    filters = {"locationId": {"eq": loc}, "status": {"neq": "INSTALLED"}}
+    d_list = list(
+        api.paginate(
+            queries.GET_PART_INVENTORIES,
+            "partInventories",
+            variables={"filters": filters},
+        )
+    )
     df = pd.DataFrame.from_records(d_list)
     df = pd.concat([df.drop(["part"], axis=1), df["part"].apply(pd.Series)], axis=1)
     df = df.drop(["id", "quantityAvailable"], axis=1)
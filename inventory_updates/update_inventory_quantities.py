@@ -6,6 +6,7 @@ import sys
 import inspect
 import re
 import decimal
+import asyncio
 
 
 # Reset the path so it can be run from the parent directory
@@ -15,6 +16,7 @@ sys.path.insert(0, parentdir)
 
 import argparse
 from utilities.api import Api
+from utilities.async_api import AsyncApi, for_each_concurrently
 from utilities.csv_helper import CsvHelper
 import queries
 from config import config
@@ -29,21 +31,26 @@ logging.basicConfig(
     filemode="w",
 )
 
+CSV_FIELDNAMES = ("inventory_id", "new_quantity")
+CSV_TYPES = {"new_quantity": decimal.Decimal}
 
-def get_inventory(api: Api, part_inventory_id: int):
-    """Get inventory info for given id."""
-    request_body = {
+
+def read_inventory_updates(csv_file_path: str):
+    """Lazily read inventory updates from the csv, one row dict at a time."""
+    return CsvHelper.iter_csv(csv_file_path, CSV_FIELDNAMES, CSV_TYPES)
+
+
+def get_inventory_body(part_inventory_id: int) -> dict:
+    """Build the request to get inventory info for given id."""
+    return {
         "query": queries.GET_PART_INVENTORY,
         "variables": {"id": part_inventory_id},
     }
-    res = api.request(request_body)
-    logger.info(f"Response: {res}")
-    return res["data"]["partInventory"]
 
 
-def update_inventory(api: Api, inventory: dict, new_quantity: float):
-    """Update inventory with new quantity."""
-    request_body = {
+def update_inventory_body(inventory: dict, new_quantity: float) -> dict:
+    """Build the request to update inventory with new quantity."""
+    return {
         "query": queries.UPDATE_PART_INVENTORY,
         "variables": {
             "input": {
@@ -53,14 +60,11 @@ def update_inventory(api: Api, inventory: dict, new_quantity: float):
             }
         },
     }
-    res = api.request(request_body)
-    logger.info(f"Response: {res}")
-    return res["data"]["updatePartInventory"]["partInventory"]
 
 
-def update_abom_item(api: Api, abom_item: dict, new_quantity: float):
-    """Update abom item quantity."""
-    request_body = {
+def update_abom_item_body(abom_item: dict, new_quantity: float) -> dict:
+    """Build the request to update abom item quantity."""
+    return {
         "query": queries.UPDATE_ABOM_ITEM,
         "variables": {
             "input": {
@@ -70,44 +74,118 @@ def update_abom_item(api: Api, abom_item: dict, new_quantity: float):
             }
         },
     }
-    res = api.request(request_body)
+
+
+def get_inventory(api: Api, part_inventory_id: int):
+    """Get inventory info for given id."""
+    res = api.request(get_inventory_body(part_inventory_id))
     logger.info(f"Response: {res}")
-    return res["data"]["updateAbomItem"]["abomitem"]
+    return res["data"]["partInventory"]
 
 
-def update_inventory_quantities(api, csv_data):
-    items_length = len(csv_data) - 1
-    logger.info(f"{items_length} inventories to process.")
-    for index, row in enumerate(csv_data):
-        if index == 0:
-            continue
-        logger.info(f"Processing row {index}/{items_length}")
-        inventory = get_inventory(api, row[0])
+def update_inventory(api: Api, inventory: dict, new_quantity: float):
+    """Update inventory with new quantity."""
+    res = api.request(update_inventory_body(inventory, new_quantity))
+    logger.info(f"Response: {res}")
+    return res["data"]["updatePartInventory"]["partInventory"]
+
+
+def update_abom_item(api: Api, abom_item: dict, new_quantity: float):
+    """Update abom item quantity."""
+    res = api.request(update_abom_item_body(abom_item, new_quantity))
+    logger.info(f"Response: {res}")
+    return res["data"]["updateAbomItem"]["abomItem"]
+
+
+def abom_item_needs_sync(inventory: dict) -> bool:
+    """
+    If aBOM quantities are out of sync with inventory quantities then it causes
+    issues when trying to update the inventory.
+    """
+    abom_items = inventory["abomItems"]
+    return bool(
+        abom_items
+        and len(abom_items) == 1
+        and abom_items[0]["quantity"] > inventory["quantity"]
+    )
+
+
+def update_inventory_quantities(api, rows):
+    for index, row in enumerate(rows, start=1):
+        logger.info(f"Processing row {index}")
+        inventory = get_inventory(api, row["inventory_id"])
         if inventory["status"] not in ["AVAILABLE", "UNAVAILABLE"]:
             print(
                 f"Skipping inventory because it is not available. Status: {inventory['status']}"
             )
             continue
-        abom_items = inventory["abomItems"]
-        # If aBOM quantities are out of sync with inventory quantities then it causes issues when trying
-        # to update the inventory.
-        if (
-            abom_items
-            and len(abom_items) == 1
-            and abom_items[0]["quantity"] > inventory["quantity"]
-        ):
-            update_abom_item(api, abom_items[0], inventory["quantity"])
+        if abom_item_needs_sync(inventory):
+            update_abom_item(api, inventory["abomItems"][0], inventory["quantity"])
 
         # Remove excess 0s at end of decimal
-        new_quantity = str(decimal.Decimal(row[1]).normalize())
+        new_quantity = str(row["new_quantity"].normalize())
         updated_inventory = update_inventory(api, inventory, new_quantity)
         logger.info("Inventory updated. Response: {updated_inventory}")
 
 
+async def update_inventory_row_async(api: AsyncApi, row: dict, index: int):
+    """Update a single csv row. Rows are independent so many can run at once."""
+    res = await api.request(get_inventory_body(row["inventory_id"]))
+    inventory = res["data"]["partInventory"]
+    if inventory["status"] not in ["AVAILABLE", "UNAVAILABLE"]:
+        print(
+            f"Skipping inventory because it is not available. Status: {inventory['status']}"
+        )
+        return
+    if abom_item_needs_sync(inventory):
+        await api.request(
+            update_abom_item_body(inventory["abomItems"][0], inventory["quantity"])
+        )
+    new_quantity = str(row["new_quantity"].normalize())
+    res = await api.request(update_inventory_body(inventory, new_quantity))
+    logger.info(f"Row {index} updated. Response: {res}")
+
+
+async def update_inventory_quantities_async(api: AsyncApi, rows, concurrency: int):
+    """
+    Update inventory quantities with up to concurrency rows in flight at once.
+
+    Rows are read from the csv as earlier ones finish, so only the rows in
+    progress are held in memory however long the csv is.
+    """
+    processed = 0
+
+    async def update_row(numbered_row):
+        nonlocal processed
+        index, row = numbered_row
+        try:
+            await update_inventory_row_async(api, row, index)
+        except Exception as e:
+            logger.error(f"Row {index} failed: {e}")
+        processed += 1
+        if processed % 100 == 0:
+            logger.info(f"{processed} inventories processed.")
+
+    await for_each_concurrently(enumerate(rows, start=1), update_row, concurrency)
+    logger.info(f"{processed} inventories processed.")
+
+
+async def run_async(api_kwargs: dict, rows, concurrency: int):
+    async with AsyncApi(max_concurrency=concurrency, **api_kwargs) as api:
+        await update_inventory_quantities_async(api, rows, concurrency)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Round inventory quantity to specified decimal precision."
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of requests to keep in flight (default: 1, sequential)",
+    )
+    args = parser.parse_args()
     try:
         auth_server = config["ION_AUTH_SERVER"]
         api_uri = config["ION_API_URI"]
@@ -118,15 +196,19 @@ if __name__ == "__main__":
         raise (e)
 
     try:
-        api = Api(
-            client_id=client_id,
-            client_secret=client_secret,
-            auth_server=auth_server,
-            api_uri=api_uri,
-            logger=logger,
-        )
-        csv_data = CsvHelper.read_from_csv("inventory_updates/inventory_update.csv")
-        update_inventory_quantities(api, csv_data)
+        api_kwargs = {
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "auth_server": auth_server,
+            "api_uri": api_uri,
+            "logger": logger,
+        }
+        rows = read_inventory_updates("inventory_updates/inventory_update.csv")
+        if args.concurrency > 1:
+            asyncio.run(run_async(api_kwargs, rows, args.concurrency))
+        else:
+            api = Api(**api_kwargs)
+            update_inventory_quantities(api, rows)
         print("Completed inventory updates.")
     except Exception as e:
         print(f"Error occurred while running script: {e}")
@@ -0,0 +1,252 @@
+"""
+Minimal GraphQL parser and executor for the mock ION server.
+
+Supports what the example scripts send: a single query or mutation with
+variables, aliases, literal and variable arguments, nested selection sets and
+inline fragments. Root fields are resolved by plain Python functions that
+return dicts and lists; the result is then projected onto the selection set so
+responses only contain the fields that were asked for.
+"""
+
+import re
+import json
+from functools import lru_cache
+
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<ignored>[\s,]+|\#[^\n]*)
+    |(?P<spread>\.\.\.)
+    |(?P<block_string>\"\"\"(?:.|\n)*?\"\"\")
+    |(?P<string>"(?:\\.|[^"\\])*")
+    |(?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    |(?P<name>[_A-Za-z][_0-9A-Za-z]*)
+    |(?P<punctuator>[!$():=@\[\]{}|&])
+    """,
+    re.VERBOSE,
+)
+
+
+class GraphQLError(Exception):
+    """Error reported in the response's errors list."""
+
+
+class Field(object):
+    def __init__(self, name, alias=None, arguments=None, selections=None) -> None:
+        self.name = name
+        self.response_key = alias or name
+        self.arguments = arguments or {}
+        self.selections = selections
+
+
+class Variable(object):
+    def __init__(self, name) -> None:
+        self.name = name
+
+
+def tokenize(document: str) -> list:
+    tokens = []
+    index = 0
+    while index < len(document):
+        match = TOKEN_PATTERN.match(document, index)
+        if not match:
+            raise GraphQLError(f"Syntax error at position {index}")
+        index = match.end()
+        kind = match.lastgroup
+        if kind == "ignored":
+            continue
+        value = match.group()
+        if kind == "block_string":
+            kind, value = "string", value[3:-3]
+        elif kind == "string":
+            value = json.loads(value)
+        tokens.append((kind, value))
+    return tokens
+
+
+class Parser(object):
+    def __init__(self, document: str) -> None:
+        self.tokens = tokenize(document)
+        self.position = 0
+
+    def peek(self, offset: int = 0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, expected: str = None) -> str:
+        kind, value = self.peek()
+        if kind is None or (expected is not None and value != expected):
+            raise GraphQLError(f"Expected '{expected}', found '{value}'")
+        self.position += 1
+        return value
+
+    def parse_operation(self) -> tuple:
+        """
+        Returns:
+            tuple: (operation type, list of root Field selections).
+        """
+        operation_type = "query"
+        if self.peek()[1] in ("query", "mutation", "subscription"):
+            operation_type = self.take()
+            if self.peek()[0] == "name":
+                self.take()
+            if self.peek()[1] == "(":
+                self.skip_variable_definitions()
+        selections = self.parse_selection_set()
+        return operation_type, selections
+
+    def skip_variable_definitions(self) -> None:
+        depth = 0
+        while True:
+            value = self.take()
+            if value == "(":
+                depth += 1
+            elif value == ")":
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def parse_selection_set(self) -> list:
+        self.take("{")
+        selections = []
+        while self.peek()[1] != "}":
+            if self.peek()[0] == "spread":
+                self.take()
+                if self.peek()[1] == "on":
+                    self.take()
+                    self.take()
+                self.skip_directives()
+                selections.extend(self.parse_selection_set())
+                continue
+            selections.append(self.parse_field())
+        self.take("}")
+        return selections
+
+    def parse_field(self) -> Field:
+        name = self.take()
+        alias = None
+        if self.peek()[1] == ":":
+            self.take()
+            alias, name = name, self.take()
+        arguments = {}
+        if self.peek()[1] == "(":
+            self.take()
+            while self.peek()[1] != ")":
+                argument = self.take()
+                self.take(":")
+                arguments[argument] = self.parse_value()
+            self.take(")")
+        self.skip_directives()
+        selections = None
+        if self.peek()[1] == "{":
+            selections = self.parse_selection_set()
+        return Field(name, alias, arguments, selections)
+
+    def skip_directives(self) -> None:
+        while self.peek()[1] == "@":
+            self.take()
+            self.take()
+            if self.peek()[1] == "(":
+                while self.take() != ")":
+                    pass
+
+    def parse_value(self):
+        kind, value = self.peek()
+        if value == "$":
+            self.take()
+            return Variable(self.take())
+        if value == "[":
+            self.take()
+            items = []
+            while self.peek()[1] != "]":
+                items.append(self.parse_value())
+            self.take("]")
+            return items
+        if value == "{":
+            self.take()
+            fields = {}
+            while self.peek()[1] != "}":
+                key = self.take()
+                self.take(":")
+                fields[key] = self.parse_value()
+            self.take("}")
+            return fields
+        self.take()
+        if kind == "number":
+            return float(value) if re.search(r"[.eE]", value) else int(value)
+        if kind == "string":
+            return value
+        return {"true": True, "false": False, "null": None}.get(value, value)
+
+
+@lru_cache(maxsize=512)
+def parse(document: str) -> tuple:
+    """Parse a document once; the scripts send the same few queries repeatedly."""
+    return Parser(document).parse_operation()
+
+
+def resolve_variables(value, variables: dict):
+    """Replace Variable placeholders in an argument value with their values."""
+    if isinstance(value, Variable):
+        return variables.get(value.name)
+    if isinstance(value, list):
+        return [resolve_variables(item, variables) for item in value]
+    if isinstance(value, dict):
+        return {key: resolve_variables(item, variables) for key, item in value.items()}
+    return value
+
+
+def project(value, selections: list):
+    """Keep only the selected fields of a resolved value, applying aliases."""
+    if value is None or selections is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, selections) for item in value]
+    result = {}
+    for field in selections:
+        item = value.get(field.name) if isinstance(value, dict) else None
+        if callable(item):
+            # Lazily computed field, e.g. a step's child steps.
+            item = item()
+        result[field.response_key] = project(item, field.selections)
+    return result
+
+
+def execute(document: str, variables: dict, resolvers: dict) -> dict:
+    """
+    Execute a GraphQL request against root field resolvers.
+
+    Args:
+        document (str): Query or mutation text.
+        variables (dict): Request variables.
+        resolvers (dict): {operation type: {root field name: callable(**args)}}.
+
+    Returns:
+        dict: Response with "data" and, if any field failed, "errors".
+    """
+    try:
+        operation_type, selections = parse(document)
+    except GraphQLError as e:
+        return {"data": None, "errors": [{"message": str(e)}]}
+    data = {}
+    errors = []
+    root_resolvers = resolvers.get(operation_type, {})
+    for field in selections:
+        try:
+            if field.name == "__typename":
+                data[field.response_key] = operation_type.capitalize()
+                continue
+            resolver = root_resolvers.get(field.name)
+            if resolver is None:
+                raise GraphQLError(
+                    f"Cannot query field '{field.name}' on {operation_type}"
+                )
+            arguments = resolve_variables(field.arguments, variables or {})
+            data[field.response_key] = project(resolver(**arguments), field.selections)
+        except (GraphQLError, AttributeError, KeyError, TypeError, ValueError) as e:
+            # Missing or malformed input is reported like a validation error.
+            data[field.response_key] = None
+            errors.append({"message": str(e), "path": [field.response_key]})
+    response = {"data": data}
+    if errors:
+        response["errors"] = errors
+    return response
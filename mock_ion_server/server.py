@@ -0,0 +1,388 @@
+"""
+Local stand-in for the ION API, for benchmarking and regression testing the
+example scripts without network access.
+
+Serves the token endpoint, POST /graphql over an in-memory MockTenant, signed
+upload URLs (PUT /uploads/<id>, or S3 style multipart uploads through
+create_multipart_upload) and file downloads (GET /files/<id>, with ETag,
+Range and If-Range support). Latency, errors and throttling can be injected per request.
+
+Usage:
+    python mock_ion_server/server.py --port 8000 --latency 0.05 --error-rate 0.01
+
+Then point the scripts at it:
+    ION_API_URI=http://localhost:8000 ION_AUTH_SERVER=http://localhost:8000
+"""
+
+import os
+import sys
+import inspect
+
+# Reset the path so it can be run from the parent directory
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
+from xml.etree import ElementTree
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mock_ion_server.graphql_executor import execute
+from mock_ion_server.tenant import MockTenant, seed_sample
+from utilities.request_log import operation_name
+
+TOKEN_PATH = "/realms/api-keys/protocol/openid-connect/token"
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class MockIonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this every response
+    # waits on the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:
+        logging.debug("mock ion %s - %s", self.address_string(), format % args)
+
+    def read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def send(self, status: int, body: bytes = b"", headers: dict = None) -> None:
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_json(self, status: int, data, headers: dict = None) -> None:
+        self.send(
+            status,
+            json.dumps(data).encode(),
+            {"Content-Type": "application/json", **(headers or {})},
+        )
+
+    def do_POST(self) -> None:
+        body = self.read_body()
+        if self.path.startswith(TOKEN_PATH):
+            self.server.mock.count("accessToken")
+            self.send_json(200, {"access_token": "mock-token", "expires_in": 3600})
+        elif self.path.rstrip("/") == "/graphql":
+            status, response, headers = self.server.mock.graphql(body)
+            self.send_json(status, response, headers)
+        elif self.path == "/reset":
+            self.server.mock.reset_stats()
+            self.send_json(200, {})
+        elif self.path.startswith("/uploads/"):
+            query = parse_qs(urlsplit(self.path).query, keep_blank_values=True)
+            if "uploads" in query:
+                self.create_multipart_upload()
+            else:
+                self.complete_multipart_upload(body)
+        else:
+            self.send_json(404, {"message": f"Unknown path {self.path}"})
+
+    def do_PUT(self) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        match = re.match(r"/uploads/(\d+)$", url.path)
+        body = self.read_body()
+        if not match:
+            self.send_json(404, {"message": f"Unknown path {self.path}"})
+            return
+        mock = self.server.mock
+        mock.count("uploadPart" if "partNumber" in query else "upload")
+        mock.delay()
+        if mock.upload_failed():
+            self.send(500, b"<Error><Code>InternalError</Code></Error>")
+            return
+        if "partNumber" in query:
+            upload = mock.multipart_uploads.get(query.get("uploadId", [""])[0])
+            if upload is None or upload["fileId"] != int(match.group(1)):
+                self.send(404, b"<Error><Code>NoSuchUpload</Code></Error>")
+                return
+            upload["parts"][int(query["partNumber"][0])] = body
+            self.send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+            return
+        mock.tenant.files[int(match.group(1))] = body
+        self.send(200)
+
+    def create_multipart_upload(self) -> None:
+        """
+        S3 CreateMultipartUpload (?uploads&parts=N), answered with the part
+        and completion URLs a multipart capable API would issue.
+        """
+        url = urlsplit(self.path)
+        match = re.match(r"/uploads/(\d+)$", url.path)
+        if not match:
+            self.send_json(404, {"message": f"Unknown path {self.path}"})
+            return
+        mock = self.server.mock
+        mock.count("createMultipartUpload")
+        parts = int(parse_qs(url.query).get("parts", ["1"])[0])
+        self.send_json(200, mock.create_multipart_upload(match.group(1), parts))
+
+    def complete_multipart_upload(self, body: bytes) -> None:
+        """S3 CompleteMultipartUpload: join the listed parts into the file."""
+        url = urlsplit(self.path)
+        mock = self.server.mock
+        upload_id = parse_qs(url.query).get("uploadId", [""])[0]
+        mock.count("completeMultipartUpload")
+        upload = mock.multipart_uploads.pop(upload_id, None)
+        if upload is None:
+            self.send(404, b"<Error><Code>NoSuchUpload</Code></Error>")
+            return
+        content = []
+        for part in ElementTree.fromstring(body).iter("Part"):
+            data = upload["parts"].get(int(part.findtext("PartNumber")))
+            etag = f'"{hashlib.md5(data).hexdigest()}"' if data is not None else None
+            if etag != part.findtext("ETag"):
+                self.send(400, b"<Error><Code>InvalidPart</Code></Error>")
+                return
+            content.append(data)
+        mock.tenant.files[upload["fileId"]] = b"".join(content)
+        self.send(200, b"<CompleteMultipartUploadResult/>")
+
+    def do_GET(self) -> None:
+        match = re.match(r"/files/(\d+)$", self.path)
+        if self.path == "/stats":
+            self.send_json(200, self.server.mock.stats())
+            return
+        content = (
+            self.server.mock.tenant.files.get(int(match.group(1))) if match else None
+        )
+        if content is None:
+            self.send_json(404, {"message": f"Unknown path {self.path}"})
+            return
+        self.server.mock.count("download")
+        self.server.mock.delay()
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Type": "application/octet-stream",
+            "ETag": etag,
+        }
+        range_match = RANGE_PATTERN.match(self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        # A range of a file that changed since If-Range is answered in full.
+        if not range_match or (if_range and if_range != etag):
+            self.send(200, content, headers)
+            return
+        start, end = range_match.groups()
+        if start:
+            start, end = int(start), min(int(end or len(content) - 1), len(content) - 1)
+        else:
+            start, end = max(len(content) - int(end), 0), len(content) - 1
+        if start >= len(content):
+            self.send(416, b"", {"Content-Range": f"bytes */{len(content)}"})
+            return
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+        self.send(206, content[start : end + 1], headers)
+
+    do_HEAD = do_GET
+
+
+class MockIonServer(object):
+    """
+    Mock ION API server over an in-memory tenant.
+
+    Can be run from the command line or started in a background thread:
+
+        with MockIonServer(latency=0.02) as server:
+            api = Api(client_id, client_secret, server.url, server.url)
+
+    Args:
+        tenant (MockTenant): Dataset to serve; a small sample if not given.
+        host (str): Interface to bind.
+        port (int): Port to bind; 0 picks a free port.
+        latency (float): Seconds added to every GraphQL request, upload and download.
+        jitter (float): Maximum extra random latency in seconds.
+        error_rate (float): Fraction of GraphQL requests failing with a 502.
+        throttle_rate (float): Fraction of GraphQL requests rejected with a 429.
+        upload_error_rate (float): Fraction of uploads and upload parts failing
+            with a 500.
+        seed (int): Random seed for reproducible error injection.
+    """
+
+    def __init__(
+        self,
+        tenant: MockTenant = None,
+        host: str = "localhost",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        upload_error_rate: float = 0.0,
+        seed: int = None,
+    ) -> None:
+        self.httpd = ThreadingHTTPServer((host, port), MockIonHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.tenant = tenant or seed_sample(MockTenant())
+        self.tenant.base_url = self.url
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.upload_error_rate = upload_error_rate
+        self.multipart_uploads = {}
+        self.random = random.Random(seed)
+        self.resolvers = self.tenant.resolvers()
+        self._counts = Counter()
+        # The tenant is not thread safe; requests are executed one at a time
+        # while injected latency is spent outside the lock.
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count(self, operation: str) -> None:
+        with self._lock:
+            self._counts[operation] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+    def delay(self) -> None:
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+    def upload_failed(self) -> bool:
+        if not self.upload_error_rate:
+            return False
+        with self._lock:
+            return self.random.random() < self.upload_error_rate
+
+    def create_multipart_upload(self, file_attachment_id, part_count: int) -> dict:
+        """
+        Start an S3 style multipart upload of a file attachment.
+
+        Returns:
+            dict: The presigned URLs a multipart capable API would issue:
+                "uploadUrls" (one per part) and "completeUploadUrl".
+        """
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.multipart_uploads[upload_id] = {
+                "fileId": int(file_attachment_id),
+                "parts": {},
+            }
+        base = f"{self.url}/uploads/{file_attachment_id}"
+        return {
+            "uploadUrls": [
+                f"{base}?partNumber={number}&uploadId={upload_id}"
+                for number in range(1, part_count + 1)
+            ],
+            "completeUploadUrl": f"{base}?uploadId={upload_id}",
+        }
+
+    def graphql(self, body: bytes) -> tuple:
+        """
+        Returns:
+            tuple: (HTTP status, response body, extra headers).
+        """
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, {"errors": [{"message": "Body must be JSON"}]}, {}
+        self.count(operation_name(request.get("query")))
+        self.delay()
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            return (
+                429,
+                {"errors": [{"message": "Too many requests"}]},
+                {"Retry-After": "1"},
+            )
+        if roll < self.throttle_rate + self.error_rate:
+            return 502, {"errors": [{"message": "Bad gateway"}]}, {}
+        with self._lock:
+            response = execute(
+                request.get("query") or "", request.get("variables"), self.resolvers
+            )
+        return 200, response, {}
+
+    def start(self) -> "MockIonServer":
+        """Serve in a daemon thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockIonServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock ION API.")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per request."
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Max random extra latency."
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of 502s."
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="Fraction of 429s."
+    )
+    parser.add_argument(
+        "--upload-error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of uploads and upload parts failing with a 500.",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    server = MockIonServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        upload_error_rate=args.upload_error_rate,
+        seed=args.seed,
+    )
+    print(f"Mock ION API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,636 @@
+"""
+In-memory ION tenant backing the mock server.
+
+Records are plain dicts shared by reference, so an inventory's part or a purchase
+order line's purchase order always reflects the latest mutation. Fields that are
+derived from other tables (a step's child steps, its datagrid, a procedure's
+steps) are exposed as callables and evaluated lazily by the executor.
+"""
+
+import itertools
+from datetime import datetime, timezone
+
+from mock_ion_server.graphql_executor import GraphQLError
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def matches(record: dict, filters: dict) -> bool:
+    """Check a record against ION style filters, e.g. {"name": {"eq": "QA"}}."""
+    for key, conditions in (filters or {}).items():
+        value = record.get(key)
+        for operator, expected in (conditions or {}).items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                try:
+                    expected = (
+                        [int(item) for item in expected]
+                        if isinstance(expected, list)
+                        else int(expected)
+                    )
+                except (TypeError, ValueError):
+                    pass
+            if operator == "eq" and value != expected:
+                return False
+            if operator == "neq" and value == expected:
+                return False
+            if operator == "in" and value not in expected:
+                return False
+            if operator == "notIn" and value in expected:
+                return False
+            if value is None and operator in ("gt", "gte", "lt", "lte"):
+                return False
+            if operator == "gt" and not value > expected:
+                return False
+            if operator == "gte" and not value >= expected:
+                return False
+            if operator == "lt" and not value < expected:
+                return False
+            if operator == "lte" and not value <= expected:
+                return False
+            if (
+                operator == "ilike"
+                and str(expected).strip("%").lower() not in str(value).lower()
+            ):
+                return False
+    return True
+
+
+def connection(records, filters=None, first=None, after=None, sort=None, **kwargs):
+    """Build a Relay connection over records with filtering and cursor paging."""
+    items = [record for record in records if matches(record, filters)]
+    for sort_key in reversed(sort or []):
+        field, _, direction = sort_key.rpartition("_")
+        field = {"ID": "id", "UPDATED_AT": "updatedAt"}.get(field, field.lower())
+        items.sort(
+            key=lambda record: record.get(field) or 0, reverse=direction == "DESC"
+        )
+    start = int(after) if after else 0
+    end = len(items) if first is None else start + int(first)
+    page = items[start:end]
+    return {
+        "edges": [
+            {"node": node, "cursor": str(start + index + 1)}
+            for index, node in enumerate(page)
+        ],
+        "pageInfo": {
+            "endCursor": str(start + len(page)),
+            "hasNextPage": end < len(items),
+        },
+        "totalCount": len(items),
+    }
+
+
+class MockTenant(object):
+    """Tables of records plus resolvers for every operation in queries.py."""
+
+    TABLES = (
+        "users",
+        "teams",
+        "roles",
+        "permissionGroups",
+        "labels",
+        "locations",
+        "barcodeTemplates",
+        "barcodeLabels",
+        "parts",
+        "partInventories",
+        "abomItems",
+        "purchaseOrders",
+        "purchaseOrderLines",
+        "receipts",
+        "issues",
+        "suppliers",
+        "runs",
+        "runSteps",
+        "runStepFields",
+        "procedures",
+        "steps",
+        "stepFields",
+        "datagridColumns",
+        "datagridRows",
+        "datagridValues",
+        "stepEdges",
+        "fileAttachments",
+        "mbomItemReferenceDesignators",
+    )
+
+    def __init__(self, base_url: str = "http://localhost:8000") -> None:
+        self.base_url = base_url
+        self.tables = {name: {} for name in self.TABLES}
+        self.files = {}
+        self._ids = itertools.count(1)
+        self._etags = itertools.count(1)
+
+    # Storage helpers
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def etag(self) -> str:
+        return f"etag-{next(self._etags)}"
+
+    def add(self, table: str, record: dict) -> dict:
+        record.setdefault("id", self.next_id())
+        record.setdefault("_etag", self.etag())
+        record.setdefault("entityId", self.next_id())
+        record.setdefault("updatedAt", now())
+        self.tables[table][record["id"]] = record
+        return record
+
+    def get(self, table: str, id) -> dict:
+        try:
+            return self.tables[table][int(id)]
+        except (KeyError, TypeError, ValueError):
+            raise GraphQLError(f"{table} {id} not found")
+
+    def update(self, table: str, input: dict, fields: tuple) -> dict:
+        """Apply an update mutation's input, enforcing the etag like the API."""
+        record = self.get(table, input["id"])
+        if "etag" in input and input["etag"] != record["_etag"]:
+            raise GraphQLError(f"etag mismatch for {table} {input['id']}")
+        for field in fields:
+            if field in input:
+                record[field] = input[field]
+        record["_etag"] = self.etag()
+        record["updatedAt"] = now()
+        return record
+
+    def delete(self, table: str, id, etag: str) -> dict:
+        record = self.get(table, id)
+        if etag != record["_etag"]:
+            raise GraphQLError(f"etag mismatch for {table} {id}")
+        del self.tables[table][record["id"]]
+        return {"id": record["id"]}
+
+    def values(self, table: str) -> list:
+        return list(self.tables[table].values())
+
+    # Builders used by resolvers and dataset generators
+
+    def file_url(self, attachment_id: int) -> str:
+        return f"{self.base_url}/files/{attachment_id}"
+
+    def add_file(
+        self, entity_id: int, filename: str, content: bytes = None, content_type=None
+    ) -> dict:
+        attachment = self.add(
+            "fileAttachments",
+            {
+                "entityId": entity_id,
+                "filename": filename,
+                "contentType": content_type or "application/octet-stream",
+                "s3Bucket": "mock-bucket",
+            },
+        )
+        attachment["s3Key"] = f"{attachment['id']}/{filename}"
+        # Evaluated per request, as the server's port is only known once it binds.
+        attachment["downloadUrl"] = lambda: self.file_url(attachment["id"])
+        attachment["url"] = attachment["downloadUrl"]
+        if content is not None:
+            self.files[attachment["id"]] = content
+        return attachment
+
+    def add_step(self, **fields) -> dict:
+        step = self.add(
+            "steps",
+            {
+                "title": "Step",
+                "type": "DEFAULT",
+                "slateContent": None,
+                "content": None,
+                "leadTime": None,
+                "procedureId": None,
+                "parentId": None,
+                "position": 0,
+                "isDerivedStep": False,
+                "isStandardStep": False,
+                "standardStep": None,
+                "originStepId": None,
+                "locationId": None,
+                "locationSubtypeId": None,
+                "version": 1,
+                "attributes": [],
+                "labels": [],
+                **fields,
+            },
+        )
+        step_id = step["id"]
+        step["upstreamStepIds"] = lambda: [
+            edge["upstreamStepId"]
+            for edge in self.values("stepEdges")
+            if edge["stepId"] == step_id
+        ]
+        step["steps"] = lambda: sorted(
+            (child for child in self.values("steps") if child["parentId"] == step_id),
+            key=lambda child: child["position"],
+        )
+        step["fields"] = lambda: [
+            field for field in self.values("stepFields") if field["stepId"] == step_id
+        ]
+        step["datagridColumns"] = lambda: connection(
+            column
+            for column in self.values("datagridColumns")
+            if column["stepId"] == step_id
+        )
+        step["datagridRows"] = lambda: connection(
+            row for row in self.values("datagridRows") if row["stepId"] == step_id
+        )
+        step["assets"] = lambda: [
+            attachment
+            for attachment in self.values("fileAttachments")
+            if attachment["entityId"] == step["entityId"]
+        ]
+        return step
+
+    def add_datagrid_row(self, **fields) -> dict:
+        row = self.add("datagridRows", {"allowNotApplicable": False, **fields})
+        row_id = row["id"]
+        row["values"] = lambda: [
+            value for value in self.values("datagridValues") if value["rowId"] == row_id
+        ]
+        return row
+
+    def add_procedure(self, **fields) -> dict:
+        procedure = self.add(
+            "procedures",
+            {
+                "title": "Procedure",
+                "description": None,
+                "type": "BUILD",
+                "attributes": [],
+                "labels": [],
+                **fields,
+            },
+        )
+        procedure.setdefault("familyId", procedure["id"])
+        procedure_id = procedure["id"]
+        procedure["steps"] = lambda: sorted(
+            (
+                step
+                for step in self.values("steps")
+                if step["procedureId"] == procedure_id and not step["parentId"]
+            ),
+            key=lambda step: step["position"],
+        )
+        return procedure
+
+    def find(self, table: str, **fields) -> dict:
+        for record in self.values(table):
+            if all(record.get(key) == value for key, value in fields.items()):
+                return record
+        return None
+
+    # Resolvers
+
+    def resolvers(self) -> dict:
+        """
+        Returns:
+            dict: Root field resolvers for graphql_executor.execute.
+        """
+        listing = lambda table: lambda **args: connection(self.values(table), **args)
+        single = lambda table: lambda id: self.get(table, id)
+        return {
+            "query": {
+                "runs": listing("runs"),
+                "run": single("runs"),
+                "partInventories": listing("partInventories"),
+                "partInventory": single("partInventories"),
+                "permissionGroups": listing("permissionGroups"),
+                "roles": listing("roles"),
+                "teams": listing("teams"),
+                "users": listing("users"),
+                "procedure": single("procedures"),
+                "fileAttachment": single("fileAttachments"),
+                "labels": listing("labels"),
+                "step": single("steps"),
+                "steps": listing("steps"),
+                "location": single("locations"),
+                "locations": listing("locations"),
+                "parts": listing("parts"),
+                "barcodeTemplates": listing("barcodeTemplates"),
+                "receipts": listing("receipts"),
+                "purchaseOrderLine": single("purchaseOrderLines"),
+                "purchaseOrderLines": listing("purchaseOrderLines"),
+                "purchaseOrders": listing("purchaseOrders"),
+                "issues": listing("issues"),
+                "suppliers": listing("suppliers"),
+            },
+            "mutation": {
+                "createRunStep": self.create_run_step,
+                "createRunStepField": self.create_run_step_field,
+                "updateRunStepFieldValue": lambda input: {
+                    "runStepField": self.update("runStepFields", input, ("value",))
+                },
+                "updateRunStep": lambda input: {
+                    "runStep": self.update("runSteps", input, ("status",))
+                },
+                "createRole": lambda input: {
+                    "role": self.add("roles", {"name": input["name"]})
+                },
+                "attachPermissionGroupToRole": self.attach_permission_group_to_role,
+                "addUserToTeam": self.add_user_to_team,
+                "createMbomItemReferenceDesignator": lambda input: {
+                    "mbomItemReferenceDesignator": self.add(
+                        "mbomItemReferenceDesignators", dict(input)
+                    )
+                },
+                "createProcedure": self.create_procedure,
+                "createStep": self.create_step,
+                "createFileAttachment": self.create_file_attachment,
+                "createAsset": self.create_file_attachment,
+                "updateStep": lambda input: {
+                    "step": self.update(
+                        "steps", input, ("slateContent", "title", "leadTime")
+                    )
+                },
+                "updatePartInventory": lambda input: {
+                    "partInventory": self.update(
+                        "partInventories", input, ("quantity", "status", "locationId")
+                    )
+                },
+                "addLabelToProcedureFamily": self.add_label_to_procedure_family,
+                "createLabel": lambda input: {
+                    "label": self.add("labels", {"value": input["value"]})
+                },
+                "createStepField": lambda input: {
+                    "stepField": self.add("stepFields", dict(input))
+                },
+                "createDatagridColumn": lambda input: {
+                    "datagridColumn": self.add("datagridColumns", dict(input))
+                },
+                "createDatagridRow": lambda input: {
+                    "datagridRow": self.add_datagrid_row(**input)
+                },
+                "setDatagridValue": self.set_datagrid_value,
+                "createStepEdge": lambda input: {
+                    "stepEdge": self.add("stepEdges", dict(input))
+                },
+                "copyStep": self.copy_step,
+                "updateAbomItem": lambda input: {
+                    "abomItem": self.update("abomItems", input, ("quantity",))
+                },
+                "createBarcodeLabel": self.create_barcode_label,
+                "updatePurchaseOrder": lambda input: {
+                    "purchaseOrder": self.update("purchaseOrders", input, ("status",))
+                },
+                "deletePurchaseOrder": lambda id, etag: self.delete(
+                    "purchaseOrders", id, etag
+                ),
+                "deleteReceipt": lambda id, etag: self.delete("receipts", id, etag),
+                "deletePurchaseOrderLine": lambda id, etag: self.delete(
+                    "purchaseOrderLines", id, etag
+                ),
+                "updateIssueAttribute": self.update_issue_attribute,
+                "createOrUpdateMultipleMboms": self.create_or_update_mboms,
+            },
+        }
+
+    def create_run_step(self, input: dict) -> dict:
+        run = self.get("runs", input["runId"])
+        step = self.add(
+            "runSteps",
+            {
+                "title": input.get("title"),
+                "content": input.get("content"),
+                "runId": run["id"],
+                "status": "REDLINE",
+                "createdById": 1,
+                "position": len(run["steps"]) + 1,
+            },
+        )
+        run["steps"].append(step)
+        return {"step": step}
+
+    def create_run_step_field(self, input: dict) -> dict:
+        self.get("runSteps", input["runStepId"])
+        return {"runStepField": self.add("runStepFields", {"value": None, **input})}
+
+    def attach_permission_group_to_role(self, input: dict) -> dict:
+        role = self.get("roles", input["roleId"])
+        group = self.get("permissionGroups", input["permissionGroupId"])
+        role.setdefault("permissionGroups", []).append(group)
+        return {"role": role}
+
+    def add_user_to_team(self, input: dict) -> dict:
+        team = self.get("teams", input["teamId"])
+        user = self.get("users", input["userId"])
+        team["users"].append(user)
+        return {"teamId": team["id"], "userId": user["id"]}
+
+    def create_procedure(self, title, description=None, type=None, **kwargs) -> dict:
+        procedure = self.add_procedure(
+            title=title, description=description, type=type or "BUILD"
+        )
+        return {"procedure": procedure}
+
+    def create_step(self, input: dict) -> dict:
+        fields = dict(input)
+        if fields.get("parentId"):
+            parent = self.get("steps", fields["parentId"])
+            fields["procedureId"] = parent["procedureId"]
+        fields["isStandardStep"] = not fields.get("procedureId")
+        siblings = [
+            step
+            for step in self.values("steps")
+            if step["procedureId"] == fields.get("procedureId")
+            and step["parentId"] == fields.get("parentId")
+        ]
+        fields["position"] = len(siblings) + 1
+        return {"step": self.add_step(**fields)}
+
+    def create_file_attachment(self, input: dict) -> dict:
+        attachment = self.add_file(input["entityId"], input["filename"])
+        return {
+            "fileAttachment": attachment,
+            "uploadUrl": f"{self.base_url}/uploads/{attachment['id']}",
+        }
+
+    def add_label_to_procedure_family(self, input: dict) -> dict:
+        label = self.get("labels", input["labelId"])
+        for procedure in self.values("procedures"):
+            if procedure["familyId"] == int(input["familyId"]):
+                procedure["labels"].append(label["value"])
+        return {"labelId": label["id"], "familyId": input["familyId"]}
+
+    def set_datagrid_value(self, input: dict) -> dict:
+        row = self.get("datagridRows", input["rowId"])
+        column = self.get("datagridColumns", input["columnId"])
+        value = self.find("datagridValues", rowId=row["id"], columnId=column["id"])
+        if value is None:
+            value = self.add(
+                "datagridValues",
+                {"rowId": row["id"], "columnId": column["id"], "type": column["type"]},
+            )
+        value["value"] = input.get("value")
+        value["notApplicable"] = False
+        value["fileAttachmentId"] = None
+        if column["type"] == "FILE_ATTACHMENT" and input.get("value"):
+            value["fileAttachmentId"] = int(input["value"])
+        value["fileAttachment"] = (
+            self.tables["fileAttachments"].get(value["fileAttachmentId"])
+            if value["fileAttachmentId"]
+            else None
+        )
+        return {"datagridValue": value}
+
+    def copy_step(self, input: dict) -> dict:
+        source = self.get("steps", input["stepId"])
+        fields = {
+            key: value
+            for key, value in source.items()
+            if not callable(value) and key not in ("id", "_etag", "entityId")
+        }
+        fields.update(
+            procedureId=input.get("procedureId"),
+            parentId=input.get("parentId"),
+            isDerivedStep=True,
+            isStandardStep=False,
+            standardStep={"id": source["id"]},
+            originStepId=source["id"],
+        )
+        return {"step": self.add_step(**fields)}
+
+    def create_barcode_label(self, input: dict) -> dict:
+        label = self.add(
+            "barcodeLabels",
+            {
+                "entityId": input["entityId"],
+                "templateId": input["templateId"],
+            },
+        )
+        label["barcode"] = f"^XA^FO50,50^BCN,100,Y,N,N^FD{input['entityId']}^FS^XZ"
+        return {"barcodeLabel": label}
+
+    def update_issue_attribute(self, input: dict) -> dict:
+        issue = self.get("issues", input["issueId"])
+        for attribute in issue["attributes"]:
+            if attribute["key"] == input["key"]:
+                if input.get("etag") != attribute["Etag"]:
+                    raise GraphQLError(f"etag mismatch for issue {issue['id']}")
+                break
+        else:
+            attribute = {"key": input["key"]}
+            issue["attributes"].append(attribute)
+        attribute["value"] = input["value"]
+        attribute["Etag"] = self.etag()
+        return {"issueAttribute": attribute}
+
+    def create_or_update_mboms(self, input: dict) -> dict:
+        rows = input.get("depthInputs") or input.get("levelInputs") or []
+        errors = []
+        new_ids = []
+        for index, row in enumerate(rows, start=1):
+            if not self.find("parts", partNumber=row.get("partNumber")):
+                errors.append(
+                    {
+                        "rowId": index,
+                        "errorMsg": f"Unknown part {row.get('partNumber')}",
+                    }
+                )
+                continue
+            new_ids.append(self.next_id())
+        return {"errorMessages": errors, "newMbomRowIds": new_ids}
+
+
+def seed_sample(tenant: MockTenant) -> MockTenant:
+    """Fill a tenant with a small sample dataset matching the example CSVs."""
+    admin = tenant.add("roles", {"name": "Admin", "permissionGroups": []})
+    tenant.add("roles", {"name": "Quality", "permissionGroups": []})
+    for name, family in (("View parts", "parts"), ("Edit parts", "parts")):
+        tenant.add("permissionGroups", {"name": name, "family": family})
+    user = tenant.add(
+        "users",
+        {
+            "name": "Ada",
+            "email": "ada@example.com",
+            "organizationId": 1,
+            "roles": [admin],
+        },
+    )
+    tenant.add(
+        "teams",
+        {"name": "Assembly", "roles": [admin], "supervisorId": user["id"], "users": []},
+    )
+    tenant.add("labels", {"value": "Flight", "createdById": 1, "updatedById": 1})
+    tenant.add("barcodeTemplates", {"name": "Location", "entityType": "LOCATIONS"})
+    location = tenant.add("locations", {"name": "Shelf A"})
+    part = tenant.add(
+        "parts", {"partNumber": "PN-1", "description": "Bracket", "revision": "A"}
+    )
+    child = tenant.add(
+        "partInventories",
+        {
+            "partId": part["id"],
+            "part": part,
+            "serialNumber": "SN-2",
+            "lotNumber": None,
+            "quantity": 1.0,
+            "quantityAvailable": 1.0,
+            "status": "INSTALLED",
+            "locationId": location["id"],
+            "abomItems": [],
+            "buildRequirements": [],
+            "updatedAt": now(),
+        },
+    )
+    tenant.add(
+        "partInventories",
+        {
+            "partId": part["id"],
+            "part": part,
+            "serialNumber": "SN-1",
+            "lotNumber": None,
+            "quantity": 1.0,
+            "quantityAvailable": 1.0,
+            "status": "AVAILABLE",
+            "locationId": location["id"],
+            "abomItems": [],
+            "buildRequirements": [
+                {"abomInstallations": [{"quantity": 1.0, "partInventory": child}]}
+            ],
+            "updatedAt": now(),
+        },
+    )
+    procedure = tenant.add_procedure(title="Sample procedure")
+    step = tenant.add_step(procedureId=procedure["id"], title="Inspect", position=1)
+    tenant.add(
+        "stepFields",
+        {
+            "stepId": step["id"],
+            "name": "Torque",
+            "type": "NUMBER",
+            "unit": "Nm",
+            "required": True,
+            "signoffRole": None,
+            "validations": [],
+        },
+    )
+    purchase_order = tenant.add(
+        "purchaseOrders",
+        {"status": "DRAFT", "approvals": [], "fees": [], "approvalRequests": []},
+    )
+    tenant.add(
+        "purchaseOrderLines",
+        {"purchaseOrder": purchase_order, "partInventories": []},
+    )
+    tenant.add(
+        "issues",
+        {"attributes": [{"key": "Defect Code", "value": "D1", "Etag": tenant.etag()}]},
+    )
+    brochure = tenant.add_file(0, "brochure.pdf", b"%PDF-1.4 mock brochure\n")
+    tenant.add(
+        "suppliers",
+        {
+            "name": "Acme Corp",
+            "Attributes": [
+                {
+                    "key": "Brochure",
+                    "value": brochure["downloadUrl"],
+                    "type": "FILE_ATTACHMENT",
+                }
+            ],
+        },
+    )
+    return tenant
@@ -6,6 +6,10 @@ import sys
 import inspect
 import re
 import json
+import threading
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 # Reset the path so it can be run from the parent directory
@@ -14,8 +18,10 @@ parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 
 import argparse
-from utilities.api import Api
+from utilities.api import Api, POOL_MAXSIZE, create_session
+from utilities.asset_cache import AssetCache
 from utilities.file_attachment_helper import FileAttachmentHelper
+from utilities.name_resolver import get_name_resolver
 import queries
 from config import config
 
@@ -30,7 +36,19 @@ logging.basicConfig(
     filemode="w",
 )
 
-file_attachment_helper = FileAttachmentHelper()
+# Files copied at once, and the bytes they may have in flight between them.
+TRANSFER_WORKERS = 4
+MAX_IN_FLIGHT_BYTES = 256 * 1024 * 1024
+
+file_attachment_helper = FileAttachmentHelper(MAX_IN_FLIGHT_BYTES)
+# Replaced by one with --transfers threads when run as a script.
+transfer_pool = ThreadPoolExecutor(max_workers=TRANSFER_WORKERS)
+# Replaced by the --asset-cache file when run as a script.
+asset_cache = AssetCache()
+
+
+# Matches file attachment references in slate content dumped to json.
+SLATE_REFERENCE_EXPRESSION = "reference.: ('|\")?(?P<id>.\d*)('|\")?"
 
 
 def get_procedure_data(api: Api, procedure_id: int):
@@ -64,17 +82,122 @@ def create_ion_file_attachment(api: Api, file_name: str, step_entity_id: int):
     return api.request(request_body)["data"]["createAsset"]
 
 
-def add_asset(api: Api, asset: dict, step: dict):
-    """Download file from source env, upload to target, and add as asset on the step."""
+def file_attachment_exists(api: Api, file_attachment_id: str) -> bool:
+    """Check that a file attachment still exists in an environment."""
+    request_body = {
+        "query": queries.GET_FILE_ATTACHMENT,
+        "variables": {"id": file_attachment_id},
+    }
+    try:
+        return bool(api.request(request_body)["data"]["fileAttachment"])
+    except requests.exceptions.RequestException:
+        raise
+    except Exception:
+        # The API reports a deleted file attachment as an error.
+        return False
+
+
+def find_uploaded_file_attachment(api: Api, target: str, key: str):
+    """
+    Look up a file attachment uploaded under key. One recorded by an earlier
+    run is checked once, as it may have been deleted from the target since;
+    if it is gone it is evicted from the cache and None is returned.
+    """
+    file_attachment_id = asset_cache.get(target, key)
+    if file_attachment_id is None or asset_cache.is_verified(
+        target, file_attachment_id
+    ):
+        return file_attachment_id
+    if file_attachment_exists(api, file_attachment_id):
+        asset_cache.mark_verified(target, file_attachment_id)
+        return file_attachment_id
+    logger.info(f"Cached file attachment {file_attachment_id} is gone, uploading again")
+    asset_cache.evict(target, file_attachment_id)
+    return None
+
+
+def add_asset(api: Api, asset: dict, step: dict, source_api: Api):
+    """
+    Download file from source env, upload to target, and add as asset on the step.
+
+    Files already uploaded to the target, by this run or a previous one using
+    the same asset cache, are reused instead: first by source file attachment,
+    then by content hash. Uploads of previous runs are checked to still exist
+    first.
+    """
     file_name = asset["filename"]
-    file_object = file_attachment_helper.download_file_attachment(
-        asset["downloadUrl"], asset["filename"]
-    )
-    new_file_attachment = create_ion_file_attachment(api, file_name, step["entityId"])
-    file_attachment_helper.upload_file_attachment(
-        file_object, file_name, new_file_attachment
-    )
-    return new_file_attachment
+    target = api.tenant_key
+    # Source ids are only unique within the source organization.
+    source_key = f"{source_api.tenant_key}#{asset['id']}"
+    with asset_cache.lock(target, source_key):
+        file_attachment_id = find_uploaded_file_attachment(api, target, source_key)
+        if file_attachment_id is None:
+            # Spooled rather than piped into the upload, as the content hash
+            # decides whether to upload at all.
+            file_object, stats = file_attachment_helper.download_to_file(
+                asset["downloadUrl"], file_name
+            )
+            with file_object:
+                content_key = f"sha256:{stats.sha256}"
+                with asset_cache.lock(target, content_key):
+                    file_attachment_id = find_uploaded_file_attachment(
+                        api, target, content_key
+                    )
+                    if file_attachment_id is None:
+                        new_file_attachment = create_ion_file_attachment(
+                            api, file_name, step["entityId"]
+                        )
+                        file_attachment_helper.upload_file_attachment(
+                            file_object, file_name, new_file_attachment
+                        )
+                        file_attachment_id = new_file_attachment["fileAttachment"][
+                            "id"
+                        ]
+                    asset_cache.put(
+                        target, [source_key, content_key], file_attachment_id
+                    )
+        else:
+            logger.info(f"Reusing uploaded file attachment {file_attachment_id}")
+    return {"fileAttachment": {"id": file_attachment_id}}
+
+
+def copy_file_attachment(
+    api: Api, source_api: Api, file_attachment_id: int, step: dict
+) -> dict:
+    """Copy a source file attachment to the target as an asset of step."""
+    existing_file_attachment = get_file_attachment_info(source_api, file_attachment_id)
+    return add_asset(api, existing_file_attachment, step, source_api)
+
+
+def start_asset_transfers(
+    api: Api, step: dict, new_step: dict, source_api: Api
+) -> dict:
+    """
+    Start copying the files referenced by a step's slate content and datagrid
+    values on the transfer pool, so they transfer while other work goes on.
+
+    Returns:
+        dict: Future of the new asset per source file attachment id.
+    """
+    file_attachment_ids = []
+    if step["slateContent"]:
+        file_attachment_ids += [
+            match.groupdict()["id"]
+            for match in re.finditer(
+                SLATE_REFERENCE_EXPRESSION, json.dumps(step["slateContent"])
+            )
+        ]
+    if step["type"] == "DATAGRID":
+        for row in step["datagridRows"]["edges"]:
+            for value in row["node"]["values"]:
+                if value["type"] == "FILE_ATTACHMENT" and value["fileAttachmentId"]:
+                    file_attachment_ids.append(str(value["fileAttachmentId"]))
+    return {
+        file_attachment_id: transfer_pool.submit(
+            copy_file_attachment, api, source_api, file_attachment_id, new_step
+        )
+        for file_attachment_id in dict.fromkeys(file_attachment_ids)
+    }
 
 
 def get_file_attachment_info(api: Api, file_attachment_id: int):
@@ -96,7 +219,8 @@ def update_step_slate_content(
             "input": {"id": step_id, "etag": etag, "slateContent": new_slate_content}
         },
     }
-    return api.request(request_body)
+    # The etag guards against applying a replayed update twice.
+    return api.request(request_body, idempotent=True, replayed_ok=("etag_mismatch",))
 
 
 def add_field_to_step(api: Api, field: dict, step_id: int):
@@ -117,8 +241,18 @@ def add_field_to_step(api: Api, field: dict, step_id: int):
     api.request(request_body)
 
 
-def add_datagrid_to_step(api: Api, columns: dict, rows: dict, step: dict):
-    """Add datagrid information to a step."""
+def add_datagrid_to_step(
+    api: Api,
+    columns: dict,
+    rows: dict,
+    step: dict,
+    source_api: Api,
+    transfers: dict = None,
+):
+    """
+    Add datagrid information to a step. File attachment values are taken from
+    transfers (see start_asset_transfers) or copied here.
+    """
     step_id: int = step["id"]
     column_map = {}
     for column in columns["edges"]:
@@ -152,10 +286,13 @@ def add_datagrid_to_step(api: Api, columns: dict, rows: dict, step: dict):
                 continue
             # Special handling for file attachments
             if value["type"] == "FILE_ATTACHMENT" and value["fileAttachmentId"]:
-                existing_file_attachment = get_file_attachment_info(
-                    source_api, value["fileAttachmentId"]
-                )
-                new_file_attachment = add_asset(api, existing_file_attachment, step)
+                file_attachment_id = str(value["fileAttachmentId"])
+                if transfers and file_attachment_id in transfers:
+                    new_file_attachment = transfers[file_attachment_id].result()
+                else:
+                    new_file_attachment = copy_file_attachment(
+                        api, source_api, file_attachment_id, step
+                    )
                 value["value"] = new_file_attachment["fileAttachment"]["id"]
             value_body = {
                 "query": queries.SET_DATAGRID_VALUE,
@@ -167,7 +304,8 @@ def add_datagrid_to_step(api: Api, columns: dict, rows: dict, step: dict):
                     }
                 },
             }
-            api.request(value_body)
+            # Setting a cell to the same value again is harmless.
+            api.request(value_body, idempotent=True)
 
 
 def find_existing_standard_step(api: Api, title: str):
@@ -191,37 +329,52 @@ def load_standard_step(source_api: Api, id: int):
     return standard_step
 
 
-def add_step(
-    api: Api,
-    step: dict,
-    source_procedure_data: dict,
-    procedure_id: int,
-    source_api: Api,
-    step_map: dict,
-    parent_step_id: int = None,
-    is_standard_step: bool = False,
+class StepContentPool(object):
+    """
+    Runs the work below created steps (their content and child steps) on a
+    bounded pool of threads, while the calling thread goes on creating the
+    next sibling. Work may submit more work, e.g. a step's subtree submits
+    its children's. With one worker the work runs inline, as each step is
+    created.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.executor = None
+        if workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = deque()
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        if self.executor is None:
+            fn(*args)
+        else:
+            with self.lock:
+                self.futures.append(self.executor.submit(fn, *args))
+
+    def wait(self):
+        """Wait for all submitted work, including work submitted meanwhile."""
+        if self.executor is None:
+            return
+        try:
+            while True:
+                with self.lock:
+                    if not self.futures:
+                        break
+                    future = self.futures.popleft()
+                # Work submitted by this future is queued before it finishes.
+                future.result()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def add_step_content(
+    api: Api, step: dict, new_step: dict, source_api: Api, transfers: dict
 ):
-    """Add new step."""
-    create_step_input = {
-        "slateContent": step["slateContent"],
-        "title": step["title"],
-        "procedureId": procedure_id,
-        "leadTime": step["leadTime"],
-        # "locationId": step["locationId"],
-        # "locationSubtypeId": step["locationSubtypeId"],
-        "type": step["type"],
-        "parentId": parent_step_id,
-    }
-    if is_standard_step:
-        del create_step_input["procedureId"]
-    logger.info("Creating new step.")
-    request_body = {
-        "query": queries.CREATE_STEP,
-        "variables": {"input": create_step_input},
-    }
-    new_step = api.request(request_body)["data"]["createStep"]["step"]
-    step_map[step["id"]] = new_step["id"]
-    logger.info(f"Added new step: {new_step}")
+    """
+    Copy the slate content assets, fields and datagrid of a step, waiting for
+    each file in transfers only when its new id is needed.
+    """
     # Skipping adding step assets for now b/c it gets handled below in the slate content
     # logger.info(f"Transitioning {len(step['assets'])} step assets.")
     # for asset in step["assets"]:
@@ -230,19 +383,16 @@ def add_step(
     logger.info(f"Replacing step slate content references to file attachments")
     slate_content = step["slateContent"]
     if slate_content:
-        expression = "reference.: ('|\")?(?P<id>.\d*)('|\")?"
         # Need to convert first to a string (json.dumps) so the text can be replaced.
         # Uses a regex match to find all references
-        match_list = reversed(list(re.finditer(expression, json.dumps(slate_content))))
+        match_list = reversed(
+            list(re.finditer(SLATE_REFERENCE_EXPRESSION, json.dumps(slate_content)))
+        )
         slate_content_updated = False
         for match in match_list:
             existing_file_attachment_id = match.groupdict()["id"]
-            # Getting existing file attachment data
-            existing_file_attachment = get_file_attachment_info(
-                source_api, existing_file_attachment_id
-            )
-            # Uploading file to target env
-            new_file_attachment = add_asset(api, existing_file_attachment, new_step)
+            # Waiting for the file to be uploaded to target env
+            new_file_attachment = transfers[existing_file_attachment_id].result()
             # Replace slate content references
             new_slate_content = json.dumps(slate_content).replace(
                 match.group(),
@@ -264,9 +414,90 @@ def add_step(
     if step["type"] == "DATAGRID":
         logger.info("Adding datagrid to step.")
         add_datagrid_to_step(
-            api, step["datagridColumns"], step["datagridRows"], new_step
+            api,
+            step["datagridColumns"],
+            step["datagridRows"],
+            new_step,
+            source_api,
+            transfers,
         )
-    # Add child steps
+
+
+def add_step(
+    api: Api,
+    step: dict,
+    source_procedure_data: dict,
+    procedure_id: int,
+    source_api: Api,
+    step_map: dict,
+    parent_step_id: int = None,
+    is_standard_step: bool = False,
+    content_pool: StepContentPool = None,
+):
+    """
+    Add new step. Only the step itself is created here, as ION positions
+    siblings in the order they are created. Its content and child steps are
+    handed to content_pool, so they are copied while later siblings are
+    created.
+    """
+    create_step_input = {
+        "slateContent": step["slateContent"],
+        "title": step["title"],
+        "procedureId": procedure_id,
+        "leadTime": step["leadTime"],
+        # "locationId": step["locationId"],
+        # "locationSubtypeId": step["locationSubtypeId"],
+        "type": step["type"],
+        "parentId": parent_step_id,
+    }
+    if is_standard_step:
+        del create_step_input["procedureId"]
+    # Standard steps must be complete before they are copied into the procedure.
+    if is_standard_step or content_pool is None:
+        content_pool = StepContentPool()
+    logger.info("Creating new step.")
+    request_body = {
+        "query": queries.CREATE_STEP,
+        "variables": {"input": create_step_input},
+    }
+    new_step = api.request(request_body)["data"]["createStep"]["step"]
+    step_map[step["id"]] = new_step["id"]
+    logger.info(f"Added new step: {new_step}")
+    transfers = start_asset_transfers(api, step, new_step, source_api)
+    content_pool.submit(
+        add_step_subtree,
+        api,
+        step,
+        new_step,
+        source_procedure_data,
+        None if is_standard_step else procedure_id,
+        source_api,
+        step_map,
+        transfers,
+        parent_step_id,
+        content_pool,
+    )
+    return new_step
+
+
+def add_step_subtree(
+    api: Api,
+    step: dict,
+    new_step: dict,
+    source_procedure_data: dict,
+    procedure_id: int,
+    source_api: Api,
+    step_map: dict,
+    transfers: dict,
+    parent_step_id: int,
+    content_pool: StepContentPool,
+):
+    """
+    Copy a created step's content, then create its child steps in order.
+    The content goes first so the slate content update is made with the etag
+    returned by createStep, before adding children can change it.
+    """
+    add_step_content(api, step, new_step, source_api, transfers)
     if not parent_step_id:
         logger.info(f"Processing {len(step['steps'])} child steps")
         for child_step in step["steps"]:
@@ -276,10 +507,10 @@ def add_step(
                 child_step,
                 step_map,
                 source_procedure_data,
-                None if is_standard_step else procedure_id,
+                procedure_id,
                 parent_id=new_step["id"],
+                content_pool=content_pool,
             )
-    return new_step
 
 
 def add_dependencies(api: Api, step_map: dict, dependencies: dict):
@@ -314,6 +545,11 @@ def copy_step_into_procedure(
     return new_step
 
 
+# Serializes looking up and creating standard steps, so derived steps in
+# subtrees copied at the same time create each standard step once.
+standard_step_lock = threading.RLock()
+
+
 def check_if_standard_step_and_add(
     api: Api,
     source_api: Api,
@@ -322,22 +558,26 @@ def check_if_standard_step_and_add(
     source_procedure_data: dict,
     procedure_id: int,
     parent_id: int = None,
+    content_pool: StepContentPool = None,
 ):
     if step["isDerivedStep"]:
         logger.info("Step is derived step. Checking if standard step already exists.")
-        reference_standard_step = find_existing_standard_step(api, step["title"])
-        if not reference_standard_step:
-            logger.info("Standard step does not exist, creating a new one.")
-            standard_step = load_standard_step(source_api, step["standardStep"]["id"])
-            reference_standard_step = add_step(
-                api,
-                standard_step,
-                source_procedure_data,
-                procedure_id,
-                source_api,
-                step_map,
-                is_standard_step=True,
-            )
+        with standard_step_lock:
+            reference_standard_step = find_existing_standard_step(api, step["title"])
+            if not reference_standard_step:
+                logger.info("Standard step does not exist, creating a new one.")
+                standard_step = load_standard_step(
+                    source_api, step["standardStep"]["id"]
+                )
+                reference_standard_step = add_step(
+                    api,
+                    standard_step,
+                    source_procedure_data,
+                    procedure_id,
+                    source_api,
+                    step_map,
+                    is_standard_step=True,
+                )
         derived_step = copy_step_into_procedure(
             api, reference_standard_step["id"], procedure_id, parent_id
         )
@@ -351,60 +591,117 @@ def check_if_standard_step_and_add(
             source_api,
             step_map,
             parent_step_id=parent_id,
+            content_pool=content_pool,
         )
 
 
 def add_steps(
-    api: Api, source_procedure_data: dict, procedure_id: int, source_api: Api
+    api: Api,
+    source_procedure_data: dict,
+    procedure_id: int,
+    source_api: Api,
+    workers: int = 1,
 ):
-    """Adds steps to newly created procedure."""
+    """
+    Adds steps to newly created procedure.
+
+    ION positions steps in the order they are created, so each createStep
+    waits for the one of the previous sibling. Everything below a created
+    step is independent of its siblings: with workers > 1 its content and
+    child steps are copied by that many threads while later siblings are
+    created, and each parent's children are created concurrently with other
+    parents'.
+    """
     logger.info(f"Adding {len(source_procedure_data['steps'])} step(s) to procedure")
     step_map = {}
     dependencies = {}
-    for index, step in enumerate(source_procedure_data["steps"]):
-        logger.info(f"Processing step {index + 1}")
-        for upstream_step_id in step["upstreamStepIds"]:
-            dependencies[step["id"]] = upstream_step_id
-        check_if_standard_step_and_add(
-            api, source_api, step, step_map, source_procedure_data, procedure_id
-        )
+    content_pool = StepContentPool(workers)
+    try:
+        for index, step in enumerate(source_procedure_data["steps"]):
+            logger.info(f"Processing step {index + 1}")
+            for upstream_step_id in step["upstreamStepIds"]:
+                dependencies[step["id"]] = upstream_step_id
+            check_if_standard_step_and_add(
+                api,
+                source_api,
+                step,
+                step_map,
+                source_procedure_data,
+                procedure_id,
+                content_pool=content_pool,
+            )
+    finally:
+        content_pool.wait()
     add_dependencies(api, step_map, dependencies)
 
 
+# Serializes creating roles and labels, so concurrent lookups of a missing
+# name create it once.
+create_lock = threading.Lock()
+
+
 def get_role(api: Api, name: str):
     """Check if role already exists and if not, create it."""
-    request_body = {
-        "query": queries.GET_ROLES,
-        "variables": {"filters": {"name": {"eq": name}}},
-    }
-    existing_roles = api.request(request_body)["data"]["roles"]["edges"]
-    if existing_roles:
-        return existing_roles[0]["node"]
-    else:
-        new_role_request_body = {
-            "query": queries.CREATE_ROLE,
-            "variables": {"input": {"name": name}},
-        }
-        new_role = api.request(new_role_request_body)["data"]
-        return new_role["createRole"]["role"]
+    roles = get_name_resolver(api, "roles")
+    role_id = roles.find(name)
+    if role_id is None:
+        with create_lock:
+            role_id = roles.find(name)
+            if role_id is None:
+                new_role_request_body = {
+                    "query": queries.CREATE_ROLE,
+                    "variables": {"input": {"name": name}},
+                }
+                new_role = api.request(new_role_request_body)["data"]
+                role_id = new_role["createRole"]["role"]["id"]
+                roles.add(name, role_id)
+    return {"id": role_id, "name": name}
 
 
 def get_label(api: Api, value: str):
     """Check if label already exists and if not, create it."""
-    request_body = {
-        "query": queries.GET_LABELS,
-        "variables": {"filters": {"value": {"eq": value}}},
-    }
-    existing_labels = api.request(request_body)["data"]["labels"]["edges"]
-    if existing_labels:
-        return existing_labels[0]["node"]
-    else:
-        new_label_request_body = {
-            "query": queries.CREATE_LABEL,
-            "variables": {"input": {"value": value}},
-        }
-        new_label = api.request(new_label_request_body)["data"]
-        return new_label["createLabel"]["label"]
+    labels = get_name_resolver(api, "labels")
+    label_id = labels.find(value)
+    if label_id is None:
+        with create_lock:
+            label_id = labels.find(value)
+            if label_id is None:
+                new_label_request_body = {
+                    "query": queries.CREATE_LABEL,
+                    "variables": {"input": {"value": value}},
+                }
+                new_label = api.request(new_label_request_body)["data"]
+                label_id = new_label["createLabel"]["label"]["id"]
+                labels.add(value, label_id)
+    return {"id": label_id, "value": value}
+
+
+def get_signoff_role_names(steps: list) -> set:
+    """Collect the signoff roles of the fields and datagrid columns of steps."""
+    names = set()
+    for step in steps:
+        for field in step["fields"]:
+            if field["signoffRole"]:
+                names.add(field["signoffRole"]["name"])
+        for column in (step.get("datagridColumns") or {}).get("edges", []):
+            if column["node"]["signoffRole"]:
+                names.add(column["node"]["signoffRole"]["name"])
+        names |= get_signoff_role_names(step.get("steps") or [])
+    return names
+
+
+def prefetch_roles_and_labels(api: Api, source_procedure_data: dict):
+    """
+    Resolve the roles and labels the procedure uses in bulk before creating
+    steps, so get_role and get_label are served from the resolver caches.
+    """
+    role_names = get_signoff_role_names(source_procedure_data["steps"])
+    roles = get_name_resolver(api, "roles").prefetch(role_names)
+    labels = get_name_resolver(api, "labels").prefetch(source_procedure_data["labels"])
+    logger.info(
+        f"Found {roles} of {len(role_names)} roles and {labels} of "
+        f"{len(source_procedure_data['labels'])} labels in the target environment"
+    )
 
 
 def add_labels(api: Api, labels: list, procedure_family_id: int):
@@ -418,27 +715,55 @@ def add_labels(api: Api, labels: list, procedure_family_id: int):
                 "input": {"labelId": new_label["id"], "familyId": procedure_family_id}
             },
         }
-        api.request(request_body)["data"]
+        api.request(
+            request_body, idempotent=True, replayed_ok=("already_exists",)
+        )["data"]
 
 
 def create_procedure_from_source_data(
-    api: Api, source_procedure_data: dict, new_title: str, source_api: Api
+    api: Api,
+    source_procedure_data: dict,
+    new_title: str,
+    source_api: Api,
+    workers: int = 1,
 ):
     """
     Create new procedure in target environment from source data.
     """
+    prefetch_roles_and_labels(api, source_procedure_data)
     new_procedure = create_procedure_container(api, source_procedure_data, new_title)
     labels = source_procedure_data["labels"]
     add_labels(api, labels, new_procedure["familyId"])
     new_procedure_id = new_procedure["id"]
     logger.info(f"Created new procedure: {new_procedure_id}")
-    add_steps(api, source_procedure_data, new_procedure_id, source_api)
+    add_steps(api, source_procedure_data, new_procedure_id, source_api, workers)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Migrate a procedure from one environment to another."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Threads copying step assets, fields and datagrids while steps are created",
+    )
+    parser.add_argument(
+        "--transfers",
+        type=int,
+        default=TRANSFER_WORKERS,
+        help=f"Files copied at once (default: {TRANSFER_WORKERS})",
+    )
+    parser.add_argument(
+        "--asset-cache",
+        type=str,
+        help="File recording assets uploaded to the target, to reuse them in later runs",
+    )
+    args = parser.parse_args()
+    if args.asset_cache:
+        asset_cache = AssetCache(args.asset_cache)
+    transfer_pool = ThreadPoolExecutor(max_workers=args.transfers)
     try:
         source_auth_server = config["SOURCE_ION_AUTH_SERVER"]
         source_api_uri = config["SOURCE_ION_API_URI"]
@@ -452,12 +777,15 @@ if __name__ == "__main__":
         raise (f"Error with the config settings: {e}")
 
     try:
+        # Share one connection pool between the source and target environments.
+        session = create_session(pool_maxsize=max(args.workers + 1, POOL_MAXSIZE))
         source_api = Api(
             client_id=source_client_id,
             client_secret=source_client_secret,
             auth_server=source_auth_server,
             api_uri=source_api_uri,
             logger=logger,
+            session=session,
         )
         target_api = Api(
             client_id=target_client_id,
@@ -465,12 +793,13 @@ if __name__ == "__main__":
             auth_server=target_auth_server,
             api_uri=target_api_uri,
             logger=logger,
+            session=session,
         )
         procedure_id = input("Input the procedure ID that you would like to export: ")
         new_title = input("Enter an optional title for the new procedure: ")
         procedure_data = get_procedure_data(source_api, procedure_id)
         create_procedure_from_source_data(
-            target_api, procedure_data, new_title, source_api
+            target_api, procedure_data, new_title, source_api, args.workers
         )
         print("Completed procedure export.")
     except Exception as e:
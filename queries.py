@@ -1,11 +1,12 @@
 """GraphQL Query and Mutation constants."""
 
 GET_RUNS = """
-    query GetRuns($filters: RunsInputFilters, $sort: [RunSortEnum]) {
-        runs(sort: $sort, filters: $filters) {
+    query GetRuns($filters: RunsInputFilters, $sort: [RunSortEnum], $first: Int, $after: String) {
+        runs(sort: $sort, filters: $filters, first: $first, after: $after) {
             edges{node {
                 id title procedureId
             }}
+            pageInfo { endCursor hasNextPage }
         }
     }
 """
@@ -23,8 +24,12 @@ GET_RUN = """
 """
 
 GET_PART_INVENTORIES = """
-query getPartInventories($filters: PartInventoriesInputFilters){
-  partInventories(filters:$filters){
+query getPartInventories($filters: PartInventoriesInputFilters, $first: Int, $after: String){
+  partInventories(filters:$filters, first: $first, after: $after){
+    pageInfo{
+      endCursor
+      hasNextPage
+    }
     edges{
       node{
         id
@@ -85,8 +90,8 @@ UPDATE_RUN_STEP = """
 """
 
 GET_PERMISSION_GROUPS = """
-    query GetPermissionGroups($filters: PermissionGroupsInputFilters, $sort: [PermissionGroupSortEnum]) {
-    permissionGroups(sort: $sort, filters: $filters) {
+    query GetPermissionGroups($filters: PermissionGroupsInputFilters, $sort: [PermissionGroupSortEnum], $first: Int, $after: String) {
+    permissionGroups(sort: $sort, filters: $filters, first: $first, after: $after) {
         edges {
         node {
             id
@@ -94,6 +99,10 @@ GET_PERMISSION_GROUPS = """
             family
         }
         }
+        pageInfo {
+            endCursor
+            hasNextPage
+        }
     }
     }
 """
@@ -1090,8 +1099,12 @@ DELETE_PURCHASE = """
 """
 
 GET_RECEIPTS = """
-    query receipts($filters:ReceiptsInputFilters){
-        receipts(filters: $filters) {
+    query receipts($filters:ReceiptsInputFilters, $first: Int, $after: String){
+        receipts(filters: $filters, first: $first, after: $after) {
+              pageInfo {
+                endCursor
+                hasNextPage
+              }
               edges {
                 node {
                     purchaseOrderLines {
@@ -1135,8 +1148,12 @@ GET_PURCHASE_LINE_ETAG = """
 """
 
 GET_PURCHASE_LINES = """ 
-    query PurchaseOrderLines($filterss: PurchaseOrderLinesInputFilters) {
-        purchaseOrderLines(filters: $filterss) {
+    query PurchaseOrderLines($filterss: PurchaseOrderLinesInputFilters, $first: Int, $after: String) {
+        purchaseOrderLines(filters: $filterss, first: $first, after: $after) {
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
             edges {
                 node {
                     id
@@ -1163,8 +1180,12 @@ GET_PURCHASE_LINES = """
 """
 
 GET_PURCHASES = """
-    query PurchaseOrders($filterss: PurchaseOrdersInputFilters) {
-        purchaseOrders(filters: $filterss) {
+    query PurchaseOrders($filterss: PurchaseOrdersInputFilters, $first: Int, $after: String) {
+        purchaseOrders(filters: $filterss, first: $first, after: $after) {
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
             edges {
                 node {
                     id
@@ -1200,8 +1221,12 @@ UPDATE_ISSUE_ATTRIBUTE = """
 """
 
 GET_ISSUE_ATTRIBUTES = """
-    query Issues {
-        issues {
+    query Issues($first: Int, $after: String) {
+        issues(first: $first, after: $after) {
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
             edges {
                 node {
                     id
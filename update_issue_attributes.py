@@ -30,8 +30,8 @@ logging.basicConfig(
 
 
 def get_issues(api):
-    request_body = {"query": queries.GET_ISSUE_ATTRIBUTES}
-    return api.request(request_body)["data"]
+    issues = api.paginate(queries.GET_ISSUE_ATTRIBUTES, "issues")
+    return {"issues": {"edges": [{"node": issue} for issue in issues]}}
 
 
 def update_issue_attribute(issues, api):
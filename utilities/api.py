@@ -1,25 +1,195 @@
 import os
+import json
+import time
 import logging
+import threading
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from urllib.parse import urljoin
 
+from utilities import graphql_batch
+from utilities.metrics import get_default_metrics
+from utilities.rate_limiter import get_rate_limiter
+from utilities.request_log import encode_body, log_request, operation_name
+from utilities.retry import (
+    REJECTED_STATUSES,
+    RetryPolicy,
+    is_mutation,
+    is_replay_error,
+    may_have_been_applied,
+)
+
 AUTH0_DOMAIN = os.getenv("ION_AUTH_SERVER", "staging-auth.buildwithion.com")
 API_URL = os.getenv("ION_API_URI", "https://staging-api.buildwithion.com")
 
+# Connection pool defaults. pool_connections is the number of hosts kept in the
+# pool, pool_maxsize the number of open connections kept per host.
+POOL_CONNECTIONS = int(os.getenv("ION_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("ION_POOL_MAXSIZE", "10"))
+
+# Optional on-disk token cache shared by back-to-back script runs.
+TOKEN_CACHE_PATH = os.getenv("ION_TOKEN_CACHE")
+# Refresh the token this many seconds before it expires.
+TOKEN_REFRESH_MARGIN = 60
+# Lifetime assumed when the auth server does not return expires_in.
+DEFAULT_TOKEN_LIFETIME = 300
+# Page size used when walking Relay connections.
+PAGE_SIZE = 100
+# Pages of nodes each range of Api.paginate_ranges is sized to hold.
+RANGE_PAGES = 10
+# Maximum number of operations merged into one request by Api.batch.
+BATCH_SIZE = 100
+# (connect, read) timeout in seconds for every HTTP request.
+REQUEST_TIMEOUT = (10, 120)
+
+
+def auth_url(auth_server: str) -> str:
+    """
+    Get the token endpoint for an auth server.
+
+    Args:
+        auth_server (str): Host name, or a full URL such as http://localhost:8000
+            when pointing the scripts at a local mock server.
+
+    Returns:
+        str: Token endpoint URL.
+    """
+    base = auth_server if "://" in auth_server else f"https://{auth_server}"
+    return urljoin(base, "/realms/api-keys/protocol/openid-connect/token")
+
+
+def create_session(
+    pool_connections: int = POOL_CONNECTIONS,
+    pool_maxsize: int = POOL_MAXSIZE,
+    pool_block: bool = False,
+    keep_alive: bool = True,
+) -> requests.Session:
+    """
+    Create a pooled HTTP session that can be shared between Api instances.
+
+    Args:
+        pool_connections (int): Number of hosts to keep connection pools for.
+        pool_maxsize (int): Maximum number of connections kept open per host.
+        pool_block (bool): Block when all connections to a host are in use
+            instead of opening extra, non-pooled connections.
+        keep_alive (bool): Reuse connections between requests.
+
+    Returns:
+        requests.Session: Session with the pooled adapter mounted.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def read_token_cache(path: str, key: str):
+    """
+    Load a still valid token from the on-disk token cache.
+
+    Args:
+        path (str): Cache file, or None if there is no cache.
+        key (str): Client the token was issued to, see Api.tenant_key.
+
+    Returns:
+        tuple: (access_token, expires_at) or None if no usable token is cached.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            entry = json.load(f).get(key)
+    except (OSError, ValueError):
+        return None
+    if not entry or time.time() >= entry["expires_at"] - TOKEN_REFRESH_MARGIN:
+        return None
+    return entry["access_token"], entry["expires_at"]
+
+
+def write_token_cache(path: str, key: str, access_token: str, expires_at: float):
+    """Store a token in the cache file, readable by the current user only."""
+    if not path:
+        return
+    cache = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+    cache[key] = {"access_token": access_token, "expires_at": expires_at}
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
 
 class Api(object):
     def __init__(
-        self, client_id, client_secret, auth_server=None, api_uri=None, logger=None
+        self,
+        client_id,
+        client_secret,
+        auth_server=None,
+        api_uri=None,
+        logger=None,
+        session=None,
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        token_cache_path=TOKEN_CACHE_PATH,
+        refresh_in_background=True,
+        retry_policy=None,
+        timeout=REQUEST_TIMEOUT,
+        rate_limiter=None,
+        metrics=None,
     ) -> None:
         self.client_id = client_id
         self.client_secret = client_secret
         self.api_url = api_uri or API_URL
         self.audience = self.api_url
         self.auth_server = auth_server or AUTH0_DOMAIN
-        self.access_token = self.get_access_token()
         self.logger = logger
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.timeout = timeout
+        # Api instances for the same API share one limiter unless given their own.
+        self.rate_limiter = rate_limiter or get_rate_limiter(self.api_url)
+        # Process wide by default, dumped to ION_METRICS_FILE at exit if set.
+        self.metrics = metrics or get_default_metrics()
+        # Pass the same session to several Api instances to share one pool.
+        self.session = session or create_session(pool_connections, pool_maxsize)
+        self.token_cache_path = (
+            os.path.expanduser(token_cache_path) if token_cache_path else None
+        )
+        self.refresh_in_background = refresh_in_background
+        self.token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self._refresh_timer = None
+        cached_token = self._read_token_cache()
+        if cached_token:
+            self.access_token, self.token_expires_at = cached_token
+            self._schedule_refresh()
+        else:
+            self.access_token = self.get_access_token()
 
     def get_access_token(self) -> str:
+        """
+        Fetch a new client credentials token from the auth server.
+
+        Records the token expiry, writes the token cache when one is configured
+        and schedules the next background refresh.
+
+        Returns:
+            str: Access token.
+        """
         payload = {
             "grant_type": "client_credentials",
             "client_id": self.client_id,
@@ -29,15 +199,77 @@ class Api(object):
 
         headers = {"content-type": "application/x-www-form-urlencoded"}
 
-        auth_url = urljoin(
-            f"https://{self.auth_server}",
-            "/realms/api-keys/protocol/openid-connect/token",
-            "oauth/token",
+        res = self._send(
+            lambda: self.session.post(
+                auth_url(self.auth_server),
+                data=payload,
+                headers=headers,
+                timeout=self.timeout,
+            ),
+            idempotent=True,
+            operation="accessToken",
         )
-        res = requests.post(auth_url, data=payload, headers=headers)
         if res.status_code == 400:
             logging.error("---AN ERROR OCCURRED IN GETTING THE ACCESS TOKEN---")
-        return res.json()["access_token"]
+        token_info = res.json()
+        access_token = token_info["access_token"]
+        expires_in = token_info.get("expires_in") or DEFAULT_TOKEN_LIFETIME
+        self.token_expires_at = time.time() + float(expires_in)
+        self._write_token_cache(access_token, self.token_expires_at)
+        self._schedule_refresh()
+        return access_token
+
+    def refresh_access_token(self, force: bool = True) -> None:
+        """
+        Replace the current access token with a freshly fetched one.
+
+        Args:
+            force (bool): Refresh even if the current token is not close to expiry.
+        """
+        with self._token_lock:
+            if force or self._token_needs_refresh():
+                self.access_token = self.get_access_token()
+
+    def _token_needs_refresh(self) -> bool:
+        return time.time() >= self.token_expires_at - TOKEN_REFRESH_MARGIN
+
+    def _schedule_refresh(self) -> None:
+        """Start a daemon timer that refreshes the token before it expires."""
+        if not self.refresh_in_background:
+            return
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+        delay = max(self.token_expires_at - TOKEN_REFRESH_MARGIN - time.time(), 0)
+        self._refresh_timer = threading.Timer(delay, self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh_access_token()
+        except Exception as e:
+            # The next request refreshes synchronously if this one failed.
+            logging.warning(f"Background token refresh failed: {e}")
+
+    @property
+    def tenant_key(self) -> str:
+        """
+        Identifies the data this client acts on. Organizations share an API
+        URL and the client credentials pick the organization, so caches of
+        records must be keyed by this rather than by api_url.
+        """
+        return f"{self.client_id}|{self.audience}"
+
+    def _token_cache_key(self) -> str:
+        return self.tenant_key
+
+    def _read_token_cache(self):
+        return read_token_cache(self.token_cache_path, self._token_cache_key())
+
+    def _write_token_cache(self, access_token: str, expires_at: float) -> None:
+        write_token_cache(
+            self.token_cache_path, self._token_cache_key(), access_token, expires_at
+        )
 
     def _get_headers(self) -> dict:
         """
@@ -46,28 +278,372 @@ class Api(object):
         Returns:
             dict: Return API request headers with authorization token.
         """
+        if self._token_needs_refresh():
+            self.refresh_access_token(force=False)
         return {
             "Authorization": f"{self.access_token}",
             "Content-Type": "application/json",
         }
 
-    def request(self, query_info: dict) -> dict:
+    def _send(self, send, idempotent: bool, operation: str) -> requests.Response:
+        """
+        Call send() until it succeeds or the retry policy gives up.
+
+        Args:
+            send (callable): Sends the HTTP request and returns the response.
+            idempotent (bool): Whether repeating the request is harmless.
+            operation (str): Operation name retries are counted under.
+
+        Returns:
+            requests.Response: The last response received.
+        """
+        attempt = 0
+        while True:
+            try:
+                res = send()
+            except requests.exceptions.RequestException as e:
+                if not self.retry_policy.should_retry_exception(e, attempt, idempotent):
+                    raise
+                delay = self.retry_policy.backoff(attempt)
+                reason = type(e).__name__
+            else:
+                if not self.retry_policy.should_retry_status(
+                    res.status_code, attempt, idempotent
+                ):
+                    return res
+                delay = self.retry_policy.backoff(
+                    attempt, res.headers.get("Retry-After")
+                )
+                reason = f"HTTP {res.status_code}"
+            attempt += 1
+            self.metrics.record_retry(operation)
+            logging.warning(
+                f"Request failed ({reason}), retry {attempt} in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+    def _post(
+        self, query_info: dict, idempotent: bool = None, replayed_ok: tuple = ()
+    ) -> dict:
+        """
+        Send a request body to the GraphQL endpoint and return the decoded JSON.
+
+        Args:
+            query_info (dict): Mutation or resolver request info.
+            idempotent (bool, optional): Whether the request may be retried after
+                it could have reached the API. Defaults to True for queries and
+                False for mutations.
+            replayed_ok (tuple): See request.
+        """
+        if idempotent is None:
+            idempotent = not is_mutation(query_info.get("query"))
+        url = urljoin(self.api_url, "graphql")
+        body, variable_sizes = encode_body(query_info)
+        started = time.monotonic()
+        # Whether an attempt may have been applied without its success being
+        # seen, and whether that happened before the last attempt.
+        outcome_unknown = False
+        replayed = False
+
+        def post():
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            sent_at = time.monotonic()
+            res = self.session.post(
+                url, headers=self._get_headers(), data=body, timeout=self.timeout
+            )
+            if self.rate_limiter:
+                if res.status_code in REJECTED_STATUSES:
+                    self.rate_limiter.on_throttle(sent_at)
+                else:
+                    self.rate_limiter.on_success(time.monotonic() - sent_at, sent_at)
+            return res
+
+        def send():
+            nonlocal outcome_unknown, replayed
+            replayed = outcome_unknown
+            try:
+                res = post()
+                if res.status_code == 401:
+                    # The token was revoked or expired early; the request was not run.
+                    self.refresh_access_token()
+                    res = post()
+            except requests.exceptions.RequestException as e:
+                outcome_unknown = outcome_unknown or may_have_been_applied(error=e)
+                raise
+            outcome_unknown = outcome_unknown or may_have_been_applied(res.status_code)
+            return res
+
+        operation = operation_name(query_info.get("query"))
+        try:
+            res = self._send(send, idempotent, operation)
+        except Exception:
+            self.metrics.record(
+                operation, time.monotonic() - started, len(body), error=True
+            )
+            raise
+        elapsed = time.monotonic() - started
+        log_request(
+            self.logger,
+            self.api_url,
+            query_info,
+            variable_sizes,
+            res.status_code,
+            elapsed,
+            len(res.content),
+        )
+        try:
+            resp_value = res.json()
+        except ValueError:
+            resp_value = None
+        if (
+            replayed_ok
+            and replayed
+            and resp_value
+            and is_replay_error(resp_value, replayed_ok)
+        ):
+            logging.info(
+                f"{operation} was applied by an earlier attempt: {resp_value['errors']}"
+            )
+            resp_value = {"data": resp_value.get("data")}
+        self.metrics.record(
+            operation,
+            elapsed,
+            len(body),
+            len(res.content),
+            error=resp_value is None
+            or res.status_code >= 400
+            or bool(resp_value.get("errors")),
+        )
+        if resp_value is None:
+            res.raise_for_status()
+            return res.json()
+        return resp_value
+
+    def request(
+        self, query_info: dict, idempotent: bool = None, replayed_ok: tuple = ()
+    ) -> dict:
         """
         Send authenticated request to ION GraphQL API.
 
+        Transient failures (timeouts, 429 and 5xx responses) are retried with
+        backoff according to the retry policy.
+
         Args:
             query_info (dict): Mutation or resolver request info.
+            idempotent (bool, optional): Allow retrying a mutation as freely as a
+                query. Defaults to True for queries and False for mutations.
+            replayed_ok (tuple): For etag guarded updates, deletes and links,
+                the kinds of retry.REPLAY_ERRORS the request gets when an
+                earlier attempt was applied, e.g. ("not_found",) for a delete.
+                If an earlier attempt may have been applied (it timed out or
+                got a 5xx other than 503) and the request then fails only with
+                these errors, return instead of raising.
 
         Returns:
             dict: API response from request.
         """
-        headers = self._get_headers()
-        if self.logger:
-            self.logger.info(f"Calling {self.api_url} with {query_info}")
-        res = requests.post(
-            urljoin(self.api_url, "graphql"), headers=headers, json=query_info
-        )
-        resp_value = res.json()
+        resp_value = self._post(query_info, idempotent, replayed_ok)
         if resp_value.get("errors"):
             raise Exception(f"---AN ERROR OCCURRED IN THE API REQUEST---\n{resp_value}")
         return resp_value
+
+    def batch(
+        self,
+        query_infos: list,
+        batch_size: int = BATCH_SIZE,
+        raise_on_error: bool = False,
+    ) -> list:
+        """
+        Send many independent queries or mutations in as few requests as possible.
+
+        Consecutive operations of the same type are merged into one aliased
+        operation of up to batch_size items (see utilities.graphql_batch).
+        Mutations within a request run in order, as they would sequentially.
+
+        Args:
+            query_infos (list): Mutation or resolver request infos.
+            batch_size (int): Maximum number of operations per HTTP request.
+            raise_on_error (bool): Raise as soon as a request returns an item
+                with errors, without sending the remaining items, instead of
+                returning its errors.
+
+        Returns:
+            list: One response per query_info, in the same order, each shaped
+                like a request() response ({"data": ..., "errors": ...}).
+        """
+        results = []
+        chunk = []
+        chunk_type = None
+        for query_info in list(query_infos) + [None]:
+            item_type = None
+            if query_info is not None:
+                item_type = graphql_batch.parse_operation(query_info["query"])[0]
+            if chunk and (
+                query_info is None
+                or item_type != chunk_type
+                or len(chunk) >= batch_size
+            ):
+                merged = graphql_batch.merge_operations(chunk)
+                chunk_results = graphql_batch.split_response(
+                    self._post(merged), len(chunk)
+                )
+                if raise_on_error:
+                    # Stop before sending the next chunk.
+                    for resp_value in chunk_results:
+                        if resp_value.get("errors"):
+                            raise Exception(
+                                f"---AN ERROR OCCURRED IN THE API REQUEST---\n{resp_value}"
+                            )
+                results.extend(chunk_results)
+                chunk = []
+            if query_info is not None:
+                chunk.append(query_info)
+                chunk_type = item_type
+        return results
+
+    def paginate(
+        self,
+        query: str,
+        path: str,
+        variables: dict = None,
+        page_size: int = PAGE_SIZE,
+        prefetch: bool = False,
+    ):
+        """
+        Lazily walk a Relay connection, yielding its nodes page by page.
+
+        The query must accept $first and $after variables and select
+        edges { node { ... } } and pageInfo { endCursor hasNextPage } on the
+        connection.
+
+        Args:
+            query (str): GraphQL query selecting the connection.
+            path (str): Dotted path to the connection inside "data",
+                e.g. "partInventories" or "procedure.steps".
+            variables (dict, optional): Extra query variables such as filters.
+            page_size (int): Number of nodes requested per page.
+            prefetch (bool): Request the next page in the background while the
+                caller processes the current one.
+
+        Yields:
+            dict: Nodes of the connection in server order.
+        """
+        variables = dict(variables or {})
+        variables["first"] = page_size
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+        def fetch(after):
+            request_body = {"query": query, "variables": {**variables, "after": after}}
+            connection = self.request(request_body)["data"]
+            for key in path.split("."):
+                connection = connection[key]
+            return connection
+
+        try:
+            connection = fetch(None)
+            while True:
+                page_info = connection["pageInfo"]
+                next_page = None
+                if page_info["hasNextPage"]:
+                    if executor:
+                        next_page = executor.submit(fetch, page_info["endCursor"])
+                for edge in connection["edges"]:
+                    yield edge["node"]
+                if not page_info["hasNextPage"]:
+                    break
+                if next_page:
+                    connection = next_page.result()
+                else:
+                    connection = fetch(page_info["endCursor"])
+        finally:
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def paginate_ranges(
+        self,
+        query: str,
+        path: str,
+        key: str,
+        start: int,
+        stop: int,
+        slices: int,
+        variables: dict = None,
+        page_size: int = PAGE_SIZE,
+        range_pages: int = RANGE_PAGES,
+    ):
+        """
+        Walk a connection in parallel by splitting it into key ranges.
+
+        [start, stop) is walked as a sequence of contiguous ranges, each one
+        added to the query's filters as {key: {"gte": lo, "lt": hi}} and
+        paginated on its own thread. Only `slices` ranges are fetched ahead of
+        the caller, and ranges are sized from the density of the previous one
+        to hold about range_pages pages, so memory stays bounded however large
+        the connection is (for unique keys such as "id"). Nodes are yielded in
+        range order, so the output matches a single ascending walk. The query
+        must accept a $filters variable. Keep slices at or below the session's
+        pool_maxsize so every worker gets a pooled connection.
+
+        Args:
+            query (str): GraphQL query selecting the connection.
+            path (str): Dotted path to the connection inside "data".
+            key (str): Filterable numeric field to split on, e.g. "id".
+            start (int): Lowest key value, inclusive.
+            stop (int): Highest key value, exclusive.
+            slices (int): Number of ranges fetched in parallel.
+            variables (dict, optional): Extra query variables. Existing filters
+                are kept and combined with the range filter.
+            page_size (int): Number of nodes requested per page.
+            range_pages (int): Pages of nodes each range is sized to hold.
+
+        Yields:
+            dict: Nodes of the connection, ordered by range.
+        """
+        variables = dict(variables or {})
+        slices = max(slices, 1)
+        target = page_size * range_pages
+        width = max(min(-(-(stop - start) // slices), target), 1)
+        next_lo = start
+        # (width, future) of the ranges fetched ahead, in key order.
+        pending = deque()
+
+        def fetch_range(lo, hi):
+            filters = dict(variables.get("filters") or {})
+            filters[key] = {"gte": lo, "lt": hi}
+            range_variables = {**variables, "filters": filters}
+            return list(self.paginate(query, path, range_variables, page_size))
+
+        def submit_range():
+            nonlocal next_lo
+            hi = min(next_lo + width, stop)
+            pending.append((hi - next_lo, executor.submit(fetch_range, next_lo, hi)))
+            next_lo = hi
+
+        executor = ThreadPoolExecutor(max_workers=slices)
+        try:
+            while next_lo < stop and len(pending) < slices:
+                submit_range()
+            while pending:
+                range_width, future = pending.popleft()
+                nodes = future.result()
+                # Size the next range from the density of this one, at most
+                # doubling at a time so a dense stretch after a sparse one
+                # can't produce a huge range.
+                if nodes:
+                    width = min(-(-target * range_width // len(nodes)), width * 2)
+                else:
+                    width *= 2
+                if next_lo < stop:
+                    submit_range()
+                yield from nodes
+        finally:
+            # Don't wait for ranges still being fetched if the caller stopped
+            # early; each one is bounded and finishes in the background.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        """Stop the token refresh timer and close the pooled connections."""
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+        self.session.close()
@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class AssetCache(object):
+    """
+    Record of files already uploaded to a target environment, so copies of a
+    file are transferred once and later references reuse its fileAttachment.
+
+    Uploads are keyed by any number of strings, typically the source file
+    attachment ("<source tenant key>#<id>") and the sha256 of the content, and
+    scoped to the target's Api.tenant_key, as organizations share API URLs.
+    With a file path the cache persists across runs; the default keeps it in
+    memory for one run. Entries from earlier runs may point at attachments
+    deleted since, so callers should check them once before reuse (see
+    is_verified) and evict those that are gone. Thread safe.
+
+    Args:
+        db_path (str): SQLite file to keep the cache in, or ":memory:".
+    """
+
+    def __init__(self, db_path: str = ":memory:") -> None:
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # (target, key) -> [lock, threads holding or waiting for it]
+        self._key_locks = {}
+        # (target, file_attachment_id) uploaded or checked by this process.
+        self._verified = set()
+        with self._db:
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(assets)")]
+            if "api_url" in columns:
+                # Caches used to be scoped by API URL alone, mixing up the
+                # organizations behind one URL; start them over.
+                self._db.execute("DROP TABLE assets")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS assets ("
+                "target TEXT, key TEXT, file_attachment_id TEXT, "
+                "PRIMARY KEY (target, key))"
+            )
+
+    @contextmanager
+    def lock(self, target: str, key: str):
+        """
+        Lock to hold while looking up and uploading a file, so threads copying
+        the same file wait for the first upload instead of repeating it. The
+        lock is dropped once no thread holds or waits for it.
+        """
+        with self._lock:
+            entry = self._key_locks.setdefault((target, key), [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[(target, key)]
+
+    def get(self, target: str, key: str):
+        """
+        Returns:
+            str: Id of the fileAttachment uploaded under key, or None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file_attachment_id FROM assets WHERE target = ? AND key = ?",
+                (target, key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, target: str, keys: list, file_attachment_id) -> None:
+        """Record an uploaded fileAttachment under each of keys."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO assets VALUES (?, ?, ?)",
+                [(target, key, str(file_attachment_id)) for key in keys],
+            )
+            self._verified.add((target, str(file_attachment_id)))
+
+    def is_verified(self, target: str, file_attachment_id) -> bool:
+        """Check if a fileAttachment was uploaded or checked by this process."""
+        with self._lock:
+            return (target, str(file_attachment_id)) in self._verified
+
+    def mark_verified(self, target: str, file_attachment_id) -> None:
+        with self._lock:
+            self._verified.add((target, str(file_attachment_id)))
+
+    def evict(self, target: str, file_attachment_id) -> None:
+        """Forget a fileAttachment that no longer exists, under all its keys."""
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM assets WHERE target = ? AND file_attachment_id = ?",
+                (target, str(file_attachment_id)),
+            )
+            self._verified.discard((target, str(file_attachment_id)))
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+from urllib.parse import urljoin
+
+from utilities.api import (
+    AUTH0_DOMAIN,
+    API_URL,
+    DEFAULT_TOKEN_LIFETIME,
+    REQUEST_TIMEOUT,
+    TOKEN_CACHE_PATH,
+    TOKEN_REFRESH_MARGIN,
+    Api,
+    auth_url,
+    read_token_cache,
+    write_token_cache,
+)
+from utilities.metrics import get_default_metrics
+from utilities.rate_limiter import get_rate_limiter
+from utilities.request_log import encode_body, log_request, operation_name
+from utilities.retry import REJECTED_STATUSES, RetryPolicy, is_mutation
+
+# Maximum number of requests in flight at once.
+MAX_CONCURRENCY = 20
+# Network errors retried like requests' ConnectionError and Timeout.
+RETRY_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+def connect_failed(error: Exception) -> bool:
+    """
+    Check if a request failed before reaching the server. Like requests'
+    ConnectTimeout for Api, only a connect timeout counts; other connection
+    errors may have happened after the request was sent.
+    """
+    return isinstance(error, aiohttp.ConnectionTimeoutError)
+
+
+# Returned by next() once the items of for_each_concurrently run out.
+_DONE = object()
+
+
+async def for_each_concurrently(items, worker, concurrency: int) -> None:
+    """
+    Await worker(item) for each item of an iterable, keeping up to concurrency
+    calls running.
+
+    A new item is started as soon as any call finishes, so one slow request
+    doesn't hold up the others, and only the items in progress are held in
+    memory. Items are read in a thread, so a lazy iterable can read a file or
+    resolve names without blocking the event loop.
+
+    Args:
+        items: Items to process, e.g. rows from CsvHelper.iter_csv.
+        worker (callable): Coroutine function called with each item.
+        concurrency (int): Maximum number of calls running at once.
+
+    Raises:
+        Exception: The first exception raised by worker, after the other
+            calls are cancelled.
+    """
+    iterator = iter(items)
+    lock = asyncio.Lock()
+
+    async def run():
+        while True:
+            async with lock:
+                item = await asyncio.to_thread(next, iterator, _DONE)
+            if item is _DONE:
+                return
+            await worker(item)
+
+    tasks = [asyncio.ensure_future(run()) for _ in range(max(concurrency, 1))]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class AsyncApi(object):
+    """
+    asyncio client for the ION GraphQL API.
+
+    Has the same request(query_info) contract as utilities.api.Api but the
+    request is a coroutine. Tokens are cached, refreshed and retried after a
+    401 like in Api, and failures are retried under the same RetryPolicy
+    rules. Use it as an async context manager so the connection pool is
+    opened and closed with the client:
+
+        async with AsyncApi(client_id, client_secret) as api:
+            results = await asyncio.gather(*(api.request(body) for body in bodies))
+    """
+
+    def __init__(
+        self,
+        client_id,
+        client_secret,
+        auth_server=None,
+        api_uri=None,
+        logger=None,
+        max_concurrency=MAX_CONCURRENCY,
+        session=None,
+        token_cache_path=TOKEN_CACHE_PATH,
+        retry_policy=None,
+        timeout=REQUEST_TIMEOUT,
+        rate_limiter=None,
+        metrics=None,
+    ) -> None:
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = api_uri or API_URL
+        self.audience = self.api_url
+        self.auth_server = auth_server or AUTH0_DOMAIN
+        self.logger = logger
+        self.max_concurrency = max_concurrency
+        self.retry_policy = retry_policy or RetryPolicy()
+        connect_timeout, read_timeout = timeout
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        # Shared with Api instances and other clients for the same API.
+        self.rate_limiter = rate_limiter or get_rate_limiter(self.api_url)
+        self.metrics = metrics or get_default_metrics()
+        # Pass the same aiohttp session to several clients to share one pool.
+        self.session = session
+        self._owns_session = session is None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.token_cache_path = (
+            os.path.expanduser(token_cache_path) if token_cache_path else None
+        )
+        self._token_lock = asyncio.Lock()
+        self.access_token = None
+        self.token_expires_at = 0.0
+
+    # Same key as Api, so both clients share the on-disk token cache.
+    tenant_key = Api.tenant_key
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self) -> None:
+        """Open the connection pool and load or fetch the first access token."""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency, limit_per_host=self.max_concurrency
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+        cached_token = read_token_cache(self.token_cache_path, self.tenant_key)
+        if cached_token:
+            self.access_token, self.token_expires_at = cached_token
+        await self._ensure_token()
+
+    async def close(self) -> None:
+        """Close the connection pool if this client created it."""
+        if self.session is not None and self._owns_session:
+            await self.session.close()
+            self.session = None
+
+    async def get_access_token(self) -> str:
+        """
+        Fetch a new client credentials token from the auth server and write
+        the token cache when one is configured.
+
+        Returns:
+            str: Access token.
+        """
+        payload = {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "audience": self.audience,
+        }
+
+        async def send():
+            async with self.session.post(
+                auth_url(self.auth_server), data=payload, timeout=self.timeout
+            ) as res:
+                return res.status, res.headers, await res.read()
+
+        status, content = await self._send(send, True, "accessToken")
+        if status == 400:
+            logging.error("---AN ERROR OCCURRED IN GETTING THE ACCESS TOKEN---")
+        token_info = json.loads(content)
+        access_token = token_info["access_token"]
+        expires_in = token_info.get("expires_in") or DEFAULT_TOKEN_LIFETIME
+        self.token_expires_at = time.time() + float(expires_in)
+        write_token_cache(
+            self.token_cache_path,
+            self.tenant_key,
+            access_token,
+            self.token_expires_at,
+        )
+        return access_token
+
+    async def _ensure_token(self) -> None:
+        """Fetch a token if there is none yet or the current one is about to expire."""
+        async with self._token_lock:
+            if time.time() >= self.token_expires_at - TOKEN_REFRESH_MARGIN:
+                self.access_token = await self.get_access_token()
+
+    async def refresh_access_token(self, rejected_token: str) -> None:
+        """
+        Replace a token the API rejected. Requests rejected together refresh
+        it once.
+        """
+        async with self._token_lock:
+            if self.access_token == rejected_token:
+                self.access_token = await self.get_access_token()
+
+    async def _send(self, send, idempotent: bool, operation: str) -> tuple:
+        """
+        Await send() until it succeeds or the retry policy gives up, like
+        Api._send.
+
+        Args:
+            send (callable): Coroutine function sending the request and
+                returning (status, headers, body).
+            idempotent (bool): Whether repeating the request is harmless.
+            operation (str): Operation name retries are counted under.
+
+        Returns:
+            tuple: (status, response body) of the last response.
+        """
+        attempt = 0
+        while True:
+            try:
+                status, headers, content = await send()
+            except RETRY_ERRORS as e:
+                if not self.retry_policy.should_retry_error(
+                    attempt, idempotent, connect_failed(e)
+                ):
+                    raise
+                delay = self.retry_policy.backoff(attempt)
+                reason = type(e).__name__
+            else:
+                if not self.retry_policy.should_retry_status(
+                    status, attempt, idempotent
+                ):
+                    return status, content
+                delay = self.retry_policy.backoff(attempt, headers.get("Retry-After"))
+                reason = f"HTTP {status}"
+            attempt += 1
+            self.metrics.record_retry(operation)
+            logging.warning(
+                f"Request failed ({reason}), retry {attempt} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+    async def _post_graphql(self, url: str, body: bytes) -> tuple:
+        """Send one request to the GraphQL endpoint."""
+        await self._ensure_token()
+        access_token = self.access_token
+        headers = {
+            "Authorization": f"{access_token}",
+            "Content-Type": "application/json",
+        }
+        if self.rate_limiter:
+            await asyncio.sleep(self.rate_limiter.wait_time())
+        sent_at = time.monotonic()
+        async with self.session.post(
+            url, headers=headers, data=body, timeout=self.timeout
+        ) as res:
+            if self.rate_limiter:
+                if res.status in REJECTED_STATUSES:
+                    self.rate_limiter.on_throttle(sent_at)
+                else:
+                    self.rate_limiter.on_success(time.monotonic() - sent_at, sent_at)
+            return res.status, res.headers, await res.read(), access_token
+
+    async def _post(self, query_info: dict, idempotent: bool) -> dict:
+        """Send a request body, recording logs and metrics for it."""
+        url = urljoin(self.api_url, "graphql")
+        body, variable_sizes = encode_body(query_info)
+        operation = operation_name(query_info.get("query"))
+        started = time.monotonic()
+
+        async def send():
+            status, headers, content, access_token = await self._post_graphql(url, body)
+            if status == 401:
+                # The token was revoked or expired early; the request was not run.
+                await self.refresh_access_token(access_token)
+                status, headers, content, _ = await self._post_graphql(url, body)
+            return status, headers, content
+
+        try:
+            status, content = await self._send(send, idempotent, operation)
+        except Exception:
+            self.metrics.record(
+                operation, time.monotonic() - started, len(body), error=True
+            )
+            raise
+        elapsed = time.monotonic() - started
+        log_request(
+            self.logger,
+            self.api_url,
+            query_info,
+            variable_sizes,
+            status,
+            elapsed,
+            len(content),
+        )
+        try:
+            resp_value = json.loads(content)
+        except ValueError:
+            resp_value = None
+        self.metrics.record(
+            operation,
+            elapsed,
+            len(body),
+            len(content),
+            error=resp_value is None or status >= 400 or bool(resp_value.get("errors")),
+        )
+        if resp_value is None:
+            raise Exception(
+                f"---AN ERROR OCCURRED IN THE API REQUEST---\nHTTP {status}"
+            )
+        return resp_value
+
+    async def request(self, query_info: dict, idempotent: bool = None) -> dict:
+        """
+        Send authenticated request to ION GraphQL API.
+
+        At most max_concurrency requests are sent at the same time; further
+        calls wait for a free slot. Transient failures are retried like in
+        Api.request.
+
+        Args:
+            query_info (dict): Mutation or resolver request info.
+            idempotent (bool, optional): Allow retrying a mutation as freely as a
+                query. Defaults to True for queries and False for mutations.
+
+        Returns:
+            dict: API response from request.
+        """
+        if idempotent is None:
+            idempotent = not is_mutation(query_info.get("query"))
+        async with self._semaphore:
+            resp_value = await self._post(query_info, idempotent)
+        if resp_value.get("errors"):
+            raise Exception(f"---AN ERROR OCCURRED IN THE API REQUEST---\n{resp_value}")
+        return resp_value
+
+    async def request_many(
+        self, query_infos: list, return_exceptions: bool = False
+    ) -> list:
+        """
+        Send several requests concurrently.
+
+        Args:
+            query_infos (list): Mutation or resolver request infos.
+            return_exceptions (bool): Return failed requests' exceptions in the
+                result list instead of raising the first one.
+
+        Returns:
+            list: API responses in the same order as query_infos.
+        """
+        return await asyncio.gather(
+            *(self.request(query_info) for query_info in query_infos),
+            return_exceptions=return_exceptions,
+        )
@@ -1,17 +1,81 @@
 import csv
+import gzip
+from itertools import chain, islice
+
+# Rows written between flushes of a streamed csv.
+FLUSH_EVERY = 1000
+
+
+def to_bool(value: str) -> bool:
+    """Convert a csv cell such as "true", "True " or "1" to a bool."""
+    return value.strip().lower() in ("true", "1", "yes", "y")
+
+
+def chunked(iterable, chunk_size: int):
+    """
+    Group an iterable into lists of up to chunk_size items, lazily.
+
+    Args:
+        iterable: Items to group, e.g. rows from CsvHelper.iter_csv.
+        chunk_size (int): Maximum number of items per chunk.
+
+    Yields:
+        list: Next chunk of items.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
 
 
 class CsvHelper:
-    def write_to_csv(items_list, csv_file_path):
-        with open(csv_file_path, "w") as f:
+    def write_to_csv(
+        items_list, csv_file_path, columns=None, flush_every=FLUSH_EVERY, compress=None
+    ):
+        """
+        Write dicts to a csv as they are produced.
+
+        items_list may be a list or any iterator, e.g. a generator walking API
+        pages, and is consumed one row at a time so exports run in constant
+        memory. The file is flushed every flush_every rows, so the output
+        written so far is usable if a run is interrupted.
+
+        Args:
+            items_list: Iterable of row dicts.
+            csv_file_path (str): Output path.
+            columns (list): Column names in order. Defaults to the keys of the
+                first row. Keys missing from a row are written empty and keys not
+                in columns are ignored.
+            flush_every (int): Number of rows between flushes.
+            compress (bool): Write gzip. Defaults to True if the path ends in .gz.
+
+        Returns:
+            int: Number of rows written, excluding the header.
+        """
+        rows = iter(items_list)
+        if columns is None:
+            first_row = next(rows, None)
+            columns = list(first_row.keys()) if first_row else []
+            rows = chain([first_row], rows) if first_row else rows
+        if compress is None:
+            compress = str(csv_file_path).endswith(".gz")
+        if compress:
+            f = gzip.open(csv_file_path, "wt", newline="")
+        else:
+            f = open(csv_file_path, "w", newline="")
+        count = 0
+        with f:
             writer = csv.writer(f)
-            columns = items_list[0].keys()
-            writer.writerow(columns)
-            for row in items_list:
-                row_data = []
-                for column in columns:
-                    row_data.append(row.get(column))
-                writer.writerow(row_data)
+            if columns:
+                writer.writerow(columns)
+            for row in rows:
+                writer.writerow([row.get(column) for column in columns])
+                count += 1
+                if count % flush_every == 0:
+                    f.flush()
+        return count
 
     def read_from_csv(csv_file_path):
         csv_data = []
@@ -20,3 +84,61 @@ class CsvHelper:
             for row in reader:
                 csv_data.append(row)
         return csv_data
+
+    def iter_csv(csv_file_path, fieldnames=None, types=None):
+        """
+        Lazily read a csv one row at a time as dicts keyed by column name.
+
+        Only the current row is held in memory, so large files can be processed
+        as they are read instead of loading them up front.
+
+        Args:
+            csv_file_path (str): Path of the csv file, read as gzip if it ends
+                in .gz.
+            fieldnames (tuple): Column names, in file order. If given, the
+                header row is skipped instead of used, so scripts don't depend
+                on the exact header text. Otherwise the stripped header is used.
+            types (dict): {column: callable} converting values, e.g.
+                {"quantity": float}. Other columns are kept as strings. Empty
+                values of typed columns become None.
+
+        Yields:
+            dict: Next row.
+        """
+        types = types or {}
+        if str(csv_file_path).endswith(".gz"):
+            f = gzip.open(csv_file_path, "rt", newline="")
+        else:
+            f = open(csv_file_path, newline="")
+        with f:
+            reader = csv.reader(f, delimiter=",", quotechar='"')
+            header = next(reader, None)
+            if header is None:
+                return
+            columns = fieldnames or [column.strip() for column in header]
+            for line_number, values in enumerate(reader, start=2):
+                if not any(value.strip() for value in values):
+                    continue
+                row = dict(zip(columns, values))
+                for column, convert in types.items():
+                    value = row.get(column)
+                    if value is None or not value.strip():
+                        row[column] = None
+                        continue
+                    try:
+                        row[column] = convert(value.strip())
+                    except (TypeError, ValueError, ArithmeticError) as e:
+                        raise ValueError(
+                            f"{csv_file_path} line {line_number}: invalid {column} "
+                            f"{value!r}: {e}"
+                        )
+                yield row
+
+    def iter_csv_chunks(csv_file_path, chunk_size, fieldnames=None, types=None):
+        """
+        Lazily read a csv in lists of up to chunk_size rows, see iter_csv.
+
+        Yields:
+            list: Next chunk of row dicts.
+        """
+        return chunked(CsvHelper.iter_csv(csv_file_path, fieldnames, types), chunk_size)
@@ -1,29 +1,411 @@
 import requests
 from urllib.parse import urljoin
 import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+from utilities.api import REQUEST_TIMEOUT
+from utilities.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from a download or file per buffer.
+CHUNK_SIZE = 1024 * 1024
+# Downloads up to this size are buffered in memory, larger ones spill to disk.
+SPOOL_SIZE = 8 * 1024 * 1024
+# Parts sent at once by a multipart upload.
+PART_WORKERS = 4
+
+
+@dataclass
+class TransferStats:
+    """Size, content hash and duration of a streamed transfer."""
+
+    size: int
+    sha256: str
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second."""
+        return self.size / self.seconds if self.seconds else 0.0
+
+
+class _UploadBody(object):
+    """
+    File-like request body of known length, read a buffer at a time.
+
+    Signed S3 URLs need a Content-Length, so streamed bodies can't be sent
+    chunked. Hashes what is read and reports progress as it goes.
+    """
+
+    def __init__(self, source, length: int, progress=None, file_name: str = None):
+        self.source = source
+        self.length = length
+        self.progress = progress
+        self.file_name = file_name
+        self.sent = 0
+        self.hash = hashlib.sha256()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size: int = CHUNK_SIZE) -> bytes:
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        # Stop at length, so a part of a file doesn't run on into the next.
+        data = self.source.read(min(size, CHUNK_SIZE, self.length - self.sent))
+        if data:
+            self.sent += len(data)
+            self.hash.update(data)
+            if self.progress:
+                self.progress(self.file_name, self.sent, self.length)
+        return data
+
+
+class ByteBudget(object):
+    """
+    Limits the bytes of concurrent transfers. A transfer waits until the bytes
+    already in flight plus its own fit in max_bytes; one larger than the whole
+    budget runs once nothing else is in flight.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int) -> None:
+        with self._condition:
+            while self.in_flight and self.in_flight + size > self.max_bytes:
+                self._condition.wait()
+            self.in_flight += size
+
+    def release(self, size: int) -> None:
+        with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+
+class _SpooledDownload(tempfile.SpooledTemporaryFile):
+    """Spooled download that gives its bytes back to the budget when closed."""
+
+    def __init__(self, budget: ByteBudget = None, size: int = 0):
+        super().__init__(max_size=SPOOL_SIZE)
+        self._budget = budget
+        self._size = size
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            if self._budget:
+                self._budget.release(self._size)
+                self._budget = None
+
+
+def _file_sha256(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def log_transfer(file_name: str, stats: TransferStats) -> None:
+    logger.info(
+        f"Transferred {file_name}: {stats.size / 1e6:.1f} MB in "
+        f"{stats.seconds:.1f} s ({stats.throughput / 1e6:.1f} MB/s)"
+    )
 
 
 class FileAttachmentHelper:
-    def upload_file_to_s3(self, file_attachment: dict, file_object: bytes):
-        """Upload file to s3 with signed URL."""
+    """
+    Args:
+        max_in_flight_bytes (int): If given, downloads and transfers wait while
+            this many bytes are already being transferred by other threads,
+            counted by Content-Length (SPOOL_SIZE if unknown). A spooled
+            download counts until its file object is closed.
+        timeout (tuple): (connect, read) timeout in seconds of every request.
+            The read timeout bounds each wait for data, not the whole transfer.
+    """
+
+    def __init__(self, max_in_flight_bytes: int = None, timeout=REQUEST_TIMEOUT):
+        self.budget = ByteBudget(max_in_flight_bytes) if max_in_flight_bytes else None
+        self.timeout = timeout
+
+    def _reserve(self, response: requests.Response) -> int:
+        """Wait for room in the budget for a response, returning the bytes taken."""
+        if self.budget is None:
+            return 0
+        length = response.headers.get("Content-Length")
+        size = int(length) if length else SPOOL_SIZE
+        self.budget.acquire(size)
+        return size
+
+    def upload_file_to_s3(
+        self, file_attachment: dict, file_object, progress=None, length: int = None
+    ):
+        """
+        Upload file to s3 with signed URL.
+
+        Args:
+            file_attachment (dict): createAsset/createFileAttachment result with
+                the uploadUrl.
+            file_object: Contents as bytes, or a binary file object which is
+                sent from its current position a buffer at a time.
+            progress: Optional callable(file_name, bytes_sent, total_bytes).
+            length (int): Bytes to send from file_object. Defaults to the rest
+                of the file, which must then be seekable.
+
+        Returns:
+            TransferStats: Bytes sent and their sha256.
+        """
+        content_type = file_attachment["fileAttachment"].get("contentType")
+        file_name = file_attachment["fileAttachment"].get("filename")
+        started_at = time.monotonic()
+        if isinstance(file_object, (bytes, bytearray)):
+            body = file_object
+            size = len(file_object)
+            sha256 = hashlib.sha256(file_object).hexdigest()
+        else:
+            if length is None:
+                start = file_object.tell()
+                length = file_object.seek(0, os.SEEK_END) - start
+                file_object.seek(start)
+            body = _UploadBody(file_object, length, progress, file_name)
         with requests.put(
             url=file_attachment["uploadUrl"],
-            headers={"Content-Type": file_attachment["fileAttachment"]["contentType"]},
-            data=file_object,
+            headers={"Content-Type": content_type or "application/octet-stream"},
+            data=body,
+            timeout=self.timeout,
         ) as response:
             response.raise_for_status()
+        if isinstance(body, _UploadBody):
+            size = body.sent
+            sha256 = body.hash.hexdigest()
+        return TransferStats(size, sha256, time.monotonic() - started_at)
+
+    def download_to_file(self, url: str, file_name: str = None, progress=None):
+        """
+        Download a file a buffer at a time into a temporary file, which stays
+        in memory up to SPOOL_SIZE bytes and spills to disk beyond that.
+
+        Args:
+            url (str): Download URL.
+            file_name (str): Name used in progress reports and logs.
+            progress: Optional callable(file_name, bytes_received, total_bytes),
+                total_bytes is None if the server doesn't send a length.
+
+        Returns:
+            tuple: (file object positioned at the start, TransferStats). Close
+                the file object when done with it.
+        """
+        started_at = time.monotonic()
+        with requests.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            reserved = self._reserve(response)
+            file_object, size, sha256 = self._spool(
+                response, file_name, progress, reserved
+            )
+        stats = TransferStats(size, sha256, time.monotonic() - started_at)
+        log_transfer(file_name or url, stats)
+        return file_object, stats
+
+    def _spool(
+        self,
+        response: requests.Response,
+        file_name: str,
+        progress=None,
+        reserved: int = 0,
+    ):
+        """
+        Copy a streamed response into a spooled temporary file, which releases
+        the reserved budget when it is closed.
+        """
+        file_object = _SpooledDownload(self.budget if reserved else None, reserved)
+        sha256 = hashlib.sha256()
+        size = 0
+        total = response.headers.get("Content-Length")
+        total = int(total) if total else None
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                file_object.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+                if progress:
+                    progress(file_name, size, total)
+        except Exception:
+            file_object.close()
+            raise
+        file_object.seek(0)
+        return file_object, size, sha256.hexdigest()
+
+    def upload_file(
+        self,
+        file_path: str,
+        file_attachment: dict,
+        progress=None,
+        workers: int = PART_WORKERS,
+        retry_policy: RetryPolicy = None,
+    ):
+        """
+        Upload a local file to a signed upload URL, a buffer at a time. Waits
+        for room in the in-flight budget first, if there is one.
+
+        If file_attachment carries S3 style presigned multipart URLs
+        ("uploadUrls", one per part in order, "completeUploadUrl" and
+        optionally "partSize"), the file is sent in parts, workers at a time,
+        each retried on its own. With only an "uploadUrl", or a single
+        "uploadUrls" entry and no "completeUploadUrl", it is a single PUT.
+
+        Returns:
+            TransferStats: Bytes sent, their sha256 and the time taken.
+        """
+        size = os.path.getsize(file_path)
+        if self.budget:
+            self.budget.acquire(size)
+        urls = file_attachment.get("uploadUrls") or []
+        try:
+            if len(urls) > 1 or (urls and file_attachment.get("completeUploadUrl")):
+                stats = self._upload_parts(
+                    file_path, file_attachment, progress, workers, retry_policy
+                )
+            else:
+                if urls and not file_attachment.get("uploadUrl"):
+                    file_attachment = {**file_attachment, "uploadUrl": urls[0]}
+                with open(file_path, "rb") as f:
+                    stats = self.upload_file_to_s3(file_attachment, f, progress)
+        finally:
+            if self.budget:
+                self.budget.release(size)
+        log_transfer(os.path.basename(file_path), stats)
+        return stats
+
+    def _upload_parts(
+        self,
+        file_path: str,
+        file_attachment: dict,
+        progress=None,
+        workers: int = PART_WORKERS,
+        retry_policy: RetryPolicy = None,
+    ) -> TransferStats:
+        """Multipart upload of a file, see upload_file."""
+        retry_policy = retry_policy or RetryPolicy()
+        urls = file_attachment["uploadUrls"]
+        file_name = os.path.basename(file_path)
+        size = os.path.getsize(file_path)
+        part_size = file_attachment.get("partSize") or -(-size // len(urls))
+        offsets = range(0, size, part_size)
+        if len(offsets) > len(urls):
+            raise Exception(
+                f"---AN ERROR OCCURRED: {file_name} needs {len(offsets)} parts of "
+                f"{part_size} bytes but only {len(urls)} upload URLs were issued"
+            )
+        started_at = time.monotonic()
+        lock = threading.Lock()
+        sent = [0]
+
+        def upload_part(number: int, offset: int) -> str:
+            length = min(part_size, size - offset)
+            attempt = 0
+            while True:
+                part_sent = [0]
+
+                def part_progress(name, done, total):
+                    with lock:
+                        sent[0] += done - part_sent[0]
+                        part_sent[0] = done
+                        total_sent = sent[0]
+                    if progress:
+                        progress(file_name, total_sent, size)
+
+                retry_after = None
+                try:
+                    with open(file_path, "rb") as f:
+                        f.seek(offset)
+                        body = _UploadBody(f, length, part_progress, file_name)
+                        with requests.put(
+                            urls[number - 1], data=body, timeout=self.timeout
+                        ) as response:
+                            if response.ok:
+                                return response.headers.get("ETag")
+                            status = response.status_code
+                            retry_after = response.headers.get("Retry-After")
+                            if not retry_policy.should_retry_status(
+                                status, attempt, True
+                            ):
+                                response.raise_for_status()
+                except (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                ) as e:
+                    if not retry_policy.should_retry_exception(e, attempt, True):
+                        raise
+                # Don't count the failed attempt's bytes twice.
+                with lock:
+                    sent[0] -= part_sent[0]
+                delay = retry_policy.backoff(attempt, retry_after)
+                logger.warning(f"Retrying part {number} of {file_name} in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            etags = list(executor.map(upload_part, range(1, len(offsets) + 1), offsets))
+        self._complete_multipart_upload(
+            file_attachment["completeUploadUrl"], etags, retry_policy
+        )
+        return TransferStats(
+            size, _file_sha256(file_path), time.monotonic() - started_at
+        )
 
-    def download_file_attachment(self, url: str, file_name: str):
-        # with open('/tmp/my-file', 'wb') as f:
-        #     self.s3.download_fileobj(s3_bucket, file_path, f)
-        response = requests.get(url)
-        return response.content
-        # with open('procedure_export/temp-files/' + file_name, 'wb') as f:
-        #     f.write(response.content)
+    def _complete_multipart_upload(
+        self, url: str, etags: list, retry_policy: RetryPolicy
+    ) -> None:
+        """Assemble the uploaded parts (S3 CompleteMultipartUpload)."""
+        parts = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag></Part>"
+            for number, etag in enumerate(etags, start=1)
+        )
+        body = f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>"
+        attempt = 0
+        while True:
+            try:
+                response = requests.post(
+                    url,
+                    data=body.encode(),
+                    headers={"Content-Type": "application/xml"},
+                    timeout=self.timeout,
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                if not retry_policy.should_retry_exception(e, attempt, True):
+                    raise
+            else:
+                # S3 can report a failed completion in the body of a 200 response.
+                failed = not response.ok or "<Error>" in response.text
+                if not failed:
+                    return
+                if not retry_policy.should_retry_status(
+                    response.status_code if not response.ok else 500, attempt, True
+                ):
+                    raise Exception(
+                        f"---AN ERROR OCCURRED completing multipart upload: "
+                        f"{response.status_code} {response.text}"
+                    )
+            time.sleep(retry_policy.backoff(attempt))
+            attempt += 1
 
     def upload_file_attachment(
-        self, file_object: bytes, file_name: str, file_attachment: dict
+        self, file_object, file_name: str, file_attachment: dict, progress=None
     ):
         # with open(file_name, 'rb') as f:
-        self.upload_file_to_s3(file_attachment, file_object)
+        return self.upload_file_to_s3(file_attachment, file_object, progress)
@@ -0,0 +1,213 @@
+"""
+Combine independent GraphQL operations into one aliased operation.
+
+Each operation's top-level fields are aliased as b<index>_<field> and its
+variables renamed to <name>_<index>, so N operations of the same type
+(query or mutation) can be sent as a single request. split_response maps
+the combined response back to one response per original operation.
+"""
+
+import re
+
+from utilities.request_log import operation_name
+
+OPERATION_TYPES = ("query", "mutation")
+
+
+def _skip_balanced(text: str, start: int, open_char: str, close_char: str) -> int:
+    """Return the index just past the bracket that closes text[start]."""
+    depth = 0
+    index = start
+    while index < len(text):
+        char = text[index]
+        if char == '"':
+            index = _skip_string(text, index)
+            continue
+        if char == "#":
+            newline = text.find("\n", index)
+            index = len(text) if newline == -1 else newline
+            continue
+        if char == open_char:
+            depth += 1
+        elif char == close_char:
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    raise ValueError(f"Unbalanced '{open_char}' in GraphQL operation")
+
+
+def _skip_string(text: str, start: int) -> int:
+    """Return the index just past the string literal starting at text[start]."""
+    if text.startswith('"""', start):
+        end = text.find('"""', start + 3)
+        if end == -1:
+            raise ValueError("Unterminated block string in GraphQL operation")
+        return end + 3
+    index = start + 1
+    while index < len(text):
+        if text[index] == "\\":
+            index += 2
+            continue
+        if text[index] == '"':
+            return index + 1
+        index += 1
+    raise ValueError("Unterminated string in GraphQL operation")
+
+
+def parse_operation(query: str) -> tuple:
+    """
+    Split a single GraphQL operation into its parts.
+
+    Args:
+        query (str): Query or mutation text, e.g. a constant from queries.py.
+
+    Returns:
+        tuple: (operation type, variable definitions without parentheses,
+            top-level selection set without braces).
+    """
+    text = query.strip()
+    selection_start = text.find("{")
+    if selection_start == -1:
+        raise ValueError("GraphQL operation has no selection set")
+    header = text[:selection_start].strip()
+    operation_type = header.split("(")[0].split()[0] if header else "query"
+    if operation_type not in OPERATION_TYPES:
+        raise ValueError(f"Cannot batch GraphQL operation of type '{operation_type}'")
+    variable_definitions = ""
+    if "(" in header:
+        definitions_start = header.index("(")
+        definitions_end = _skip_balanced(header, definitions_start, "(", ")")
+        variable_definitions = header[definitions_start + 1 : definitions_end - 1]
+    selection_end = _skip_balanced(text, selection_start, "{", "}")
+    if text[selection_end:].strip():
+        raise ValueError("Only a single GraphQL operation can be batched")
+    return (
+        operation_type,
+        variable_definitions,
+        text[selection_start + 1 : selection_end - 1],
+    )
+
+
+def _alias_top_level_fields(selection: str, prefix: str) -> str:
+    """Prefix the response key of every top-level field in a selection set."""
+    name_pattern = re.compile(r"[_A-Za-z][_0-9A-Za-z]*")
+    output = []
+    index = 0
+    while index < len(selection):
+        char = selection[index]
+        if char.isspace() or char == ",":
+            output.append(char)
+            index += 1
+            continue
+        if char == "#":
+            newline = selection.find("\n", index)
+            index = len(selection) if newline == -1 else newline
+            continue
+        if selection.startswith("...", index):
+            raise ValueError("Fragments are not supported in batched operations")
+        match = name_pattern.match(selection, index)
+        if not match:
+            raise ValueError(f"Unexpected '{char}' in GraphQL selection set")
+        response_key = match.group()
+        field_name = response_key
+        index = match.end()
+        rest = selection[index:]
+        stripped = rest.lstrip()
+        if stripped.startswith(":"):
+            index += len(rest) - len(stripped) + 1
+            while selection[index].isspace():
+                index += 1
+            field_match = name_pattern.match(selection, index)
+            field_name = field_match.group()
+            index = field_match.end()
+        output.append(f"{prefix}{response_key}: {field_name}")
+        field_start = index
+        while index < len(selection) and selection[index].isspace():
+            index += 1
+        if index < len(selection) and selection[index] == "(":
+            index = _skip_balanced(selection, index, "(", ")")
+        while index < len(selection) and selection[index].isspace():
+            index += 1
+        if index < len(selection) and selection[index] == "{":
+            index = _skip_balanced(selection, index, "{", "}")
+        output.append(selection[field_start:index])
+    return "".join(output)
+
+
+def item_prefix(index: int) -> str:
+    return f"b{index}_"
+
+
+def merge_operations(query_infos: list) -> dict:
+    """
+    Merge several operations of the same type into one aliased operation.
+
+    Args:
+        query_infos (list): Request bodies with "query" and optional "variables".
+
+    Returns:
+        dict: Request body for the combined operation.
+    """
+    operation_type = None
+    definitions = []
+    selections = []
+    variables = {}
+    for index, query_info in enumerate(query_infos):
+        item_type, item_definitions, selection = parse_operation(query_info["query"])
+        if operation_type and item_type != operation_type:
+            raise ValueError("Cannot batch queries and mutations together")
+        operation_type = item_type
+        names = re.findall(r"\$([_A-Za-z][_0-9A-Za-z]*)\s*:", item_definitions)
+        for name in names:
+            pattern = re.compile(rf"\${name}\b")
+            item_definitions = pattern.sub(f"${name}_{index}", item_definitions)
+            selection = pattern.sub(f"${name}_{index}", selection)
+        for name, value in (query_info.get("variables") or {}).items():
+            if name in names:
+                variables[f"{name}_{index}"] = value
+        if item_definitions.strip():
+            definitions.append(item_definitions.strip())
+        selections.append(_alias_top_level_fields(selection, item_prefix(index)))
+    # Name the merged operation after the first one so logs and metrics can
+    # tell batches apart, e.g. "mutation BatchedCreateLabel(...)".
+    first_name = operation_name(query_infos[0]["query"])
+    header = f"{operation_type} Batched{first_name[:1].upper()}{first_name[1:]}"
+    if definitions:
+        header += f"({', '.join(definitions)})"
+    query = f"{header} {{\n" + "\n".join(selections) + "\n}"
+    return {"query": query, "variables": variables}
+
+
+def split_response(response: dict, count: int) -> list:
+    """
+    Split the response of a merged operation into per-operation responses.
+
+    Errors are attributed to an operation through their path; errors without
+    a path are attached to every operation in the batch. A response without
+    data (e.g. "data": null) fails every operation with all of its errors.
+
+    Args:
+        response (dict): Response of the merged operation.
+        count (int): Number of operations that were merged.
+
+    Returns:
+        list: One {"data": ..., "errors": ...} response per operation.
+    """
+    if response.get("data") is None:
+        errors = response.get("errors") or [{"message": "Response has no data"}]
+        return [{"data": None, "errors": list(errors)} for _ in range(count)]
+    results = [{"data": {}} for _ in range(count)]
+    for key, value in response["data"].items():
+        index, _, field = key[1:].partition("_")
+        results[int(index)]["data"][field] = value
+    for error in response.get("errors") or []:
+        path = error.get("path") or []
+        targets = range(count)
+        if path and re.match(r"b\d+_", str(path[0])):
+            index, _, field = path[0][1:].partition("_")
+            targets = [int(index)]
+            error = {**error, "path": [field, *path[1:]]}
+        for index in targets:
+            results[index].setdefault("errors", []).append(error)
+    return results
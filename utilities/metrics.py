@@ -0,0 +1,190 @@
+import os
+import json
+import bisect
+import atexit
+import threading
+
+# Write the metrics of every Api instance to this file when the script exits.
+# A path ending in .prom is written as Prometheus text, anything else as JSON.
+METRICS_FILE = os.getenv("ION_METRICS_FILE")
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Upper bounds in seconds of the latency histogram buckets. Latencies are
+# counted into these rather than kept, so memory stays constant however many
+# requests a run makes; percentiles are estimated from the buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _quantile(bucket_counts: list, quantile: float) -> float:
+    """
+    Estimate a quantile from bucket counts, interpolating linearly within the
+    bucket it falls in like Prometheus' histogram_quantile.
+    """
+    total = sum(bucket_counts)
+    if not total:
+        return 0.0
+    rank = quantile * total
+    seen = 0
+    for index, count in enumerate(bucket_counts):
+        if count and seen + count >= rank:
+            if index == len(LATENCY_BUCKETS):
+                # Above the largest bound; report the bound.
+                return LATENCY_BUCKETS[-1]
+            lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+            upper = LATENCY_BUCKETS[index]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return LATENCY_BUCKETS[-1]
+
+
+class OperationStats(object):
+    """Counters and a latency histogram for one GraphQL operation."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        # Requests per LATENCY_BUCKETS bucket, plus one above the largest bound.
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency: float) -> None:
+        self.latency_sum += latency
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def summary(self) -> dict:
+        summary = {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency_sum": self.latency_sum,
+            "buckets": dict(
+                zip(
+                    [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"],
+                    self.bucket_counts,
+                )
+            ),
+        }
+        for quantile in QUANTILES:
+            summary[f"p{int(quantile * 100)}"] = _quantile(self.bucket_counts, quantile)
+        return summary
+
+
+class ApiMetrics(object):
+    """
+    Per-operation request metrics, keyed by GraphQL operation name.
+
+    Thread safe, so one instance can be shared by several Api instances and
+    worker threads. Dump it as JSON or Prometheus text at the end of a run.
+    """
+
+    def __init__(self) -> None:
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, operation: str) -> OperationStats:
+        if operation not in self._operations:
+            self._operations[operation] = OperationStats()
+        return self._operations[operation]
+
+    def record(
+        self,
+        operation: str,
+        latency: float,
+        bytes_sent: int = 0,
+        bytes_received: int = 0,
+        error: bool = False,
+    ) -> None:
+        """Record a completed request, including its retries."""
+        with self._lock:
+            stats = self._stats(operation)
+            stats.count += 1
+            stats.errors += int(error)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.observe(latency)
+
+    def record_retry(self, operation: str) -> None:
+        with self._lock:
+            self._stats(operation).retries += 1
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: {operation: {count, errors, retries, bytes_sent, bytes_received,
+                latency_sum, buckets, p50, p95, p99}}, latencies in seconds.
+                buckets maps each bucket's upper bound to its request count;
+                the percentiles are estimated from them.
+        """
+        with self._lock:
+            return {
+                operation: stats.summary()
+                for operation, stats in sorted(self._operations.items())
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = [
+            "# HELP ion_api_request_seconds GraphQL request latency.",
+            "# TYPE ion_api_request_seconds histogram",
+        ]
+        for operation, stats in summary.items():
+            cumulative = 0
+            for bound, count in stats["buckets"].items():
+                cumulative += count
+                lines.append(
+                    f'ion_api_request_seconds_bucket{{operation="{operation}",'
+                    f'le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f'ion_api_request_seconds_sum{{operation="{operation}"}} '
+                f'{stats["latency_sum"]}'
+            )
+            lines.append(
+                f'ion_api_request_seconds_count{{operation="{operation}"}} '
+                f'{stats["count"]}'
+            )
+        counters = [
+            ("errors", "Requests that failed or returned GraphQL errors."),
+            ("retries", "Retried request attempts."),
+            ("bytes_sent", "Request body bytes sent."),
+            ("bytes_received", "Response body bytes received."),
+        ]
+        for name, help_text in counters:
+            lines.append(f"# HELP ion_api_{name}_total {help_text}")
+            lines.append(f"# TYPE ion_api_{name}_total counter")
+            for operation, stats in summary.items():
+                lines.append(
+                    f'ion_api_{name}_total{{operation="{operation}"}} {stats[name]}'
+                )
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Write the metrics to path, as Prometheus text if it ends in .prom."""
+        with open(path, "w") as f:
+            f.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_default_metrics() -> ApiMetrics:
+    """
+    Get the process wide metrics, dumped to ION_METRICS_FILE at exit if set.
+    """
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = ApiMetrics()
+            if METRICS_FILE:
+                atexit.register(_default_metrics.dump, METRICS_FILE)
+        return _default_metrics
@@ -0,0 +1,162 @@
+import time
+import threading
+from collections import OrderedDict
+
+from utilities.csv_helper import chunked
+from utilities.reference_mirror import ENTITIES, get_reference_mirror
+
+# Names kept per resolver; the least recently used are evicted first.
+CACHE_SIZE = 10_000
+# Seconds a resolved id is reused before it is looked up again.
+CACHE_TTL = 15 * 60
+# Names per `in` filter when pre-resolving.
+BATCH_SIZE = 100
+
+
+class NameResolver(object):
+    """
+    Memoizing name to id lookups for one kind of ION record.
+
+    Scripts driven by csvs repeat the same team, role or user on many rows;
+    each distinct name is queried once and then served from a bounded LRU
+    cache until it expires. Call prefetch with every name up front to resolve
+    them in a few `in` filter queries instead of one query per name. If
+    ION_MIRROR_PATH is set, names are resolved from the reference data mirror
+    first and only the ones it doesn't have are queried. Thread safe.
+
+    Args:
+        api (Api): Client to query.
+        entity (str): Key of reference_mirror.ENTITIES, e.g. "teams".
+        max_size (int): Maximum number of names cached.
+        ttl (float): Seconds a resolved id stays cached.
+        batch_size (int): Names per query when prefetching.
+    """
+
+    def __init__(
+        self,
+        api,
+        entity: str,
+        max_size: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        batch_size: int = BATCH_SIZE,
+    ) -> None:
+        self.api = api
+        self.entity = entity
+        self.key, self.query = ENTITIES[entity]
+        self.max_size = max_size
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.mirror = get_reference_mirror(api)
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_cached(self, value: str):
+        with self._lock:
+            cached = self._cache.get(value)
+            if cached is None or cached[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._cache.move_to_end(value)
+            self.hits += 1
+            return cached[0]
+
+    def _store(self, value: str, id) -> None:
+        with self._lock:
+            self._cache[value] = (id, time.monotonic() + self.ttl)
+            self._cache.move_to_end(value)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _fetch(self, values: list) -> dict:
+        """Query the ids of values, returning {value: id} for those that exist."""
+        ids = {}
+        if self.mirror:
+            for value in values:
+                id = self.mirror.get_id(self.entity, value)
+                if id is not None:
+                    ids[value] = id
+            values = [value for value in values if value not in ids]
+            if not values:
+                return ids
+        variables = {"filters": {self.key: {"in": values}}}
+        if len(values) == 1:
+            variables = {"filters": {self.key: {"eq": values[0]}}}
+        for node in self.api.paginate(self.query, self.entity, variables):
+            # Like the single name queries, the first match wins.
+            if node[self.key] not in ids:
+                ids[node[self.key]] = node["id"]
+                if self.mirror:
+                    self.mirror.add(self.entity, node)
+        return ids
+
+    def prefetch(self, values) -> int:
+        """
+        Resolve many names up front, batch_size names per query.
+
+        Args:
+            values: Names to resolve, duplicates allowed.
+
+        Returns:
+            int: Number of names that were found.
+        """
+        missing = [
+            value for value in dict.fromkeys(values) if self._get_cached(value) is None
+        ]
+        found = 0
+        for chunk in chunked(missing, self.batch_size):
+            for value, id in self._fetch(chunk).items():
+                self._store(value, id)
+                found += 1
+        return found
+
+    def find(self, value: str):
+        """
+        Get the id of the record whose key field (name, email, ...) is value.
+
+        Returns:
+            Id of the record, or None if there is none.
+        """
+        id = self._get_cached(value)
+        if id is None:
+            id = self._fetch([value]).get(value)
+            if id is not None:
+                self._store(value, id)
+        return id
+
+    def resolve(self, value: str):
+        """
+        Like find, but for records that must exist.
+
+        Raises:
+            Exception: If there is no such record.
+        """
+        id = self.find(value)
+        if id is None:
+            raise Exception(
+                f"---AN ERROR OCCURRED: no {self.entity} with {self.key} {value!r}"
+            )
+        return id
+
+    def add(self, value: str, id) -> None:
+        """Cache the id of a record the caller just created."""
+        self._store(value, id)
+        if self.mirror:
+            self.mirror.add(self.entity, {"id": id, self.key: value})
+
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_name_resolver(api, entity: str) -> NameResolver:
+    """
+    Get the process wide resolver for one kind of record of an API, so every
+    lookup in a run shares its cache.
+    """
+    with _resolvers_lock:
+        key = (api.tenant_key, entity)
+        if key not in _resolvers:
+            _resolvers[key] = NameResolver(api, entity)
+        return _resolvers[key]
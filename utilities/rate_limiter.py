@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+
+# Client side rate limiting is off unless ION_RATE_LIMIT is set to the initial
+# request rate in requests per second. ION_RATE_LIMIT_MAX caps the rate.
+INITIAL_RATE = float(os.getenv("ION_RATE_LIMIT", "0"))
+MAX_RATE = float(os.getenv("ION_RATE_LIMIT_MAX", "100"))
+# Initial rate of limiters created directly.
+DEFAULT_RATE = 20.0
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class AdaptiveRateLimiter(object):
+    """
+    Token bucket whose rate adapts to how the API responds (AIMD).
+
+    Each successful request with a latency under target_latency adds
+    increase / rate requests per second, so the rate grows by roughly
+    `increase` every second at full speed. A throttled response (429/503) or
+    a latency above target_latency multiplies the rate by `decrease`, at most
+    once per window of requests: responses to requests sent before the last
+    decrease don't decrease it again, so a burst of concurrent 429s halves
+    the rate once. The bucket is thread safe, and wait_time() lets asyncio
+    callers sleep without blocking the event loop.
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        min_rate: float = 1.0,
+        max_rate: float = MAX_RATE,
+        burst: float = None,
+        increase: float = 5.0,
+        decrease: float = 0.5,
+        target_latency: float = 5.0,
+    ) -> None:
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst or max(rate, 1.0)
+        self.increase = increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._decreased_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """
+        Reserve one request and return how long to wait before sending it.
+
+        Returns:
+            float: Seconds to wait; 0 if a token was available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._tokens + (now - self._updated_at) * self.rate, self.burst
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        """Block the calling thread until a request may be sent."""
+        delay = self.wait_time()
+        if delay:
+            time.sleep(delay)
+
+    def on_success(self, latency: float, sent_at: float = None) -> None:
+        """
+        Additively increase the rate, or back off if the API is slowing down.
+
+        Args:
+            latency (float): Seconds the request took.
+            sent_at (float, optional): time.monotonic() when it was sent.
+        """
+        if latency > self.target_latency:
+            self._decrease(sent_at)
+            return
+        with self._lock:
+            self.rate = min(self.rate + self.increase / self.rate, self.max_rate)
+
+    def on_throttle(self, sent_at: float = None) -> None:
+        """
+        Multiplicatively decrease the rate after a 429/503 response.
+
+        Args:
+            sent_at (float, optional): time.monotonic() when the request was
+                sent. Without it every call decreases the rate.
+        """
+        self._decrease(sent_at)
+
+    def _decrease(self, sent_at: float = None) -> None:
+        with self._lock:
+            if sent_at is not None and sent_at < self._decreased_at:
+                # Already decreased for the window this request was sent in.
+                return
+            self.rate = max(self.rate * self.decrease, self.min_rate)
+            self._decreased_at = time.monotonic()
+            # Drop saved up tokens so the lower rate applies immediately.
+            self._tokens = min(self._tokens, 0.0)
+
+
+def get_rate_limiter(key: str):
+    """
+    Get the process wide rate limiter for an API, creating it on first use.
+
+    Args:
+        key (str): API the limiter applies to, e.g. its URL.
+
+    Returns:
+        AdaptiveRateLimiter: Shared limiter, or None unless ION_RATE_LIMIT is
+            set.
+    """
+    if INITIAL_RATE <= 0:
+        return None
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = AdaptiveRateLimiter(INITIAL_RATE)
+        return _limiters[key]
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from utilities.csv_helper import chunked
+
+# Set ION_MIRROR_PATH to a file (e.g. ion_mirror.sqlite3) to resolve names to
+# ids from a local SQLite copy of the reference data instead of one API query
+# per lookup.
+MIRROR_PATH = os.getenv("ION_MIRROR_PATH")
+
+# Incremental refreshes re-fetch records updated this long before the previous
+# refresh started, covering clock skew and updates made while it was paging.
+REFRESH_OVERLAP = timedelta(minutes=10)
+# Incremental refreshes can't see deletions, so entities are fully re-synced
+# this often (seconds).
+FULL_SYNC_INTERVAL = 24 * 60 * 60
+# A lookup that misses refreshes the entity at most this often (seconds).
+MISS_REFRESH_INTERVAL = 30
+
+GET_ROLES_PAGE = """
+    query ListRoles($filters: RolesInputFilters, $first: Int, $after: String) {
+        roles(filters: $filters, first: $first, after: $after) {
+            edges { node { id name updatedAt } }
+            pageInfo { endCursor hasNextPage }
+        }
+    }
+"""
+
+GET_TEAMS_PAGE = """
+    query ListTeams($filters: TeamsInputFilters, $first: Int, $after: String) {
+        teams(filters: $filters, first: $first, after: $after) {
+            edges { node { id name supervisorId updatedAt } }
+            pageInfo { endCursor hasNextPage }
+        }
+    }
+"""
+
+GET_USERS_PAGE = """
+    query ListUsers($filters: UserInputFilters, $first: Int, $after: String) {
+        users(filters: $filters, first: $first, after: $after) {
+            edges { node { id name email organizationId updatedAt } }
+            pageInfo { endCursor hasNextPage }
+        }
+    }
+"""
+
+GET_PERMISSION_GROUPS_PAGE = """
+    query ListPermissionGroups($filters: PermissionGroupsInputFilters, $first: Int, $after: String) {
+        permissionGroups(filters: $filters, first: $first, after: $after) {
+            edges { node { id name family updatedAt } }
+            pageInfo { endCursor hasNextPage }
+        }
+    }
+"""
+
+GET_LABELS_PAGE = """
+    query ListLabels($filters: LabelsInputFilters, $first: Int, $after: String) {
+        labels(filters: $filters, first: $first, after: $after) {
+            edges { node { id _etag value createdById updatedById updatedAt } }
+            pageInfo { endCursor hasNextPage }
+        }
+    }
+"""
+
+GET_LOCATIONS_PAGE = """
+    query ListLocations($filters: LocationsInputFilters, $first: Int, $after: String) {
+        locations(filters: $filters, first: $first, after: $after) {
+            edges { node { id name entityId updatedAt } }
+            pageInfo { endCursor hasNextPage }
+        }
+    }
+"""
+
+GET_PARTS_PAGE = """
+    query ListParts($filters: PartsInputFilters, $first: Int, $after: String) {
+        parts(filters: $filters, first: $first, after: $after) {
+            edges { node { id partNumber revision description updatedAt } }
+            pageInfo { endCursor hasNextPage }
+        }
+    }
+"""
+
+# Mirrored connections: (field looked up by, paginated query).
+ENTITIES = {
+    "roles": ("name", GET_ROLES_PAGE),
+    "teams": ("name", GET_TEAMS_PAGE),
+    "users": ("email", GET_USERS_PAGE),
+    "permissionGroups": ("name", GET_PERMISSION_GROUPS_PAGE),
+    "labels": ("value", GET_LABELS_PAGE),
+    "locations": ("name", GET_LOCATIONS_PAGE),
+    "parts": ("partNumber", GET_PARTS_PAGE),
+}
+
+
+class ReferenceMirror(object):
+    """
+    Local SQLite copy of ION reference data, for indexed name to id lookups.
+
+    Each entity in ENTITIES is synced in bulk the first time it is looked up
+    in a process: a full sync if it has never been synced (or not within
+    FULL_SYNC_INTERVAL), otherwise an incremental one fetching only records
+    updated since the last sync. Records of several environments can share
+    one file; they are keyed by Api.tenant_key (client id and audience), as
+    organizations share API URLs. Thread safe.
+
+    Args:
+        api (Api): Client of the environment to mirror.
+        db_path (str): SQLite file to keep the mirror in.
+    """
+
+    def __init__(self, api, db_path: str = MIRROR_PATH) -> None:
+        self.api = api
+        self.tenant = api.tenant_key
+        self.db_path = db_path
+        self.logger = api.logger or logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        # One refresh per entity at a time, so threads that miss together
+        # share a single API walk.
+        self._refresh_locks = {entity: threading.RLock() for entity in ENTITIES}
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._refreshed_at = {}
+        with self._db:
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(records)")]
+            if "api_url" in columns:
+                # Mirrors used to be keyed by API URL alone, mixing up the
+                # organizations behind one URL; start them over.
+                self._db.execute("DROP TABLE IF EXISTS records")
+                self._db.execute("DROP TABLE IF EXISTS sync_state")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "tenant TEXT, entity TEXT, id TEXT, key TEXT, updated_at TEXT, "
+                "data TEXT, PRIMARY KEY (tenant, entity, id))"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS records_by_key "
+                "ON records (tenant, entity, key)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                "tenant TEXT, entity TEXT, high_water_mark TEXT, "
+                "full_sync_at REAL, PRIMARY KEY (tenant, entity))"
+            )
+
+    def refresh(self, entity: str, full: bool = False) -> int:
+        """
+        Sync one entity from the API.
+
+        Args:
+            entity (str): Key of ENTITIES, e.g. "roles".
+            full (bool): Re-download every record, dropping deleted ones.
+                Otherwise only records updated since the last sync are fetched.
+
+        Returns:
+            int: Number of records fetched.
+        """
+        key, query = ENTITIES[entity]
+        started_at = datetime.now(timezone.utc)
+        with self._refresh_locks[entity]:
+            with self._lock:
+                state = self._db.execute(
+                    "SELECT high_water_mark, full_sync_at FROM sync_state "
+                    "WHERE tenant = ? AND entity = ?",
+                    (self.tenant, entity),
+                ).fetchone()
+            full = full or state is None or time.time() - state[1] > FULL_SYNC_INTERVAL
+            variables = None
+            if not full:
+                variables = {"filters": {"updatedAt": {"gte": state[0]}}}
+            # Page through the API without the lock, so lookups keep being
+            # served from the current copy, then swap the records in with
+            # one transaction.
+            nodes = list(self.api.paginate(query, entity, variables))
+            with self._lock, self._db:
+                if full:
+                    self._db.execute(
+                        "DELETE FROM records WHERE tenant = ? AND entity = ?",
+                        (self.tenant, entity),
+                    )
+                for chunk in chunked(nodes, 1000):
+                    self._upsert(entity, key, chunk)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                    (
+                        self.tenant,
+                        entity,
+                        (started_at - REFRESH_OVERLAP).isoformat(),
+                        time.time() if full else state[1],
+                    ),
+                )
+            self._refreshed_at[entity] = time.monotonic()
+        self.logger.info(
+            "mirror refreshed entity=%s full=%s records=%d", entity, full, len(nodes)
+        )
+        return len(nodes)
+
+    def _refresh_if_stale(self, entity: str, max_age: float = None) -> None:
+        """
+        Refresh an entity unless it was refreshed within max_age seconds (or at
+        all, if max_age is None), including by another thread while this one
+        waited for the entity's refresh lock.
+        """
+        with self._refresh_locks[entity]:
+            refreshed_at = self._refreshed_at.get(entity)
+            if refreshed_at is None or (
+                max_age is not None and time.monotonic() - refreshed_at > max_age
+            ):
+                self.refresh(entity)
+
+    def _upsert(self, entity: str, key: str, nodes: list) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    self.tenant,
+                    entity,
+                    str(node["id"]),
+                    node.get(key),
+                    node.get("updatedAt"),
+                    json.dumps(node),
+                )
+                for node in nodes
+            ],
+        )
+
+    def add(self, entity: str, node: dict) -> None:
+        """Store a record the caller just created, so later lookups find it."""
+        with self._lock, self._db:
+            self._upsert(entity, ENTITIES[entity][0], [node])
+
+    def find(self, entity: str, value: str) -> list:
+        """
+        Look up records by their key field (name, email, value or partNumber).
+
+        Syncs the entity on its first lookup in this process, and again if the
+        value isn't found, in case it was created since the last sync.
+
+        Returns:
+            list: Matching records as dicts, empty if there are none.
+        """
+        if entity not in self._refreshed_at:
+            self._refresh_if_stale(entity)
+        records = self._select(entity, value)
+        if (
+            not records
+            and time.monotonic() - self._refreshed_at[entity] > MISS_REFRESH_INTERVAL
+        ):
+            self._refresh_if_stale(entity, MISS_REFRESH_INTERVAL)
+            records = self._select(entity, value)
+        return records
+
+    def _select(self, entity: str, value: str) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM records WHERE tenant = ? AND entity = ? AND key = ? "
+                "ORDER BY CAST(id AS INTEGER)",
+                (self.tenant, entity, value),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, entity: str, value: str) -> dict:
+        """
+        Returns:
+            dict: First record whose key field equals value, or None.
+        """
+        records = self.find(entity, value)
+        return records[0] if records else None
+
+    def get_id(self, entity: str, value: str):
+        """
+        Returns:
+            str: Id of the first record whose key field equals value, or None.
+        """
+        record = self.get(entity, value)
+        return record["id"] if record else None
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_reference_mirror(api):
+    """
+    Get the process wide mirror of an API's reference data.
+
+    Args:
+        api (Api): Client of the environment to mirror.
+
+    Returns:
+        ReferenceMirror: Shared mirror, or None if ION_MIRROR_PATH isn't set.
+    """
+    if not MIRROR_PATH:
+        return None
+    with _mirrors_lock:
+        if api.tenant_key not in _mirrors:
+            _mirrors[api.tenant_key] = ReferenceMirror(api)
+        return _mirrors[api.tenant_key]
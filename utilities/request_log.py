@@ -0,0 +1,90 @@
+"""
+Cheap, structured request logging for the API clients.
+
+Request bodies are serialized once per request; the per-variable sizes fall
+out of that serialization, so INFO logging costs no extra formatting of the
+query or variables. Full payloads are only formatted when DEBUG is enabled.
+"""
+
+import re
+import json
+import logging
+from functools import lru_cache
+
+OPERATION_PATTERN = re.compile(r"\s*(query|mutation)\s*([_A-Za-z][_0-9A-Za-z]*)?")
+FIELD_PATTERN = re.compile(r"{\s*([_A-Za-z][_0-9A-Za-z]*)")
+
+
+@lru_cache(maxsize=256)
+def operation_name(query: str) -> str:
+    """
+    Get a short name for a GraphQL document.
+
+    Uses the operation name (e.g. "GetProcedure"), falling back to the first
+    top-level field for anonymous operations.
+    """
+    if not query:
+        return "unknown"
+    match = OPERATION_PATTERN.match(query)
+    if match and match.group(2):
+        return match.group(2)
+    field = FIELD_PATTERN.search(query)
+    return field.group(1) if field else "anonymous"
+
+
+def encode_body(query_info: dict) -> tuple:
+    """
+    Serialize a request body to JSON, measuring each variable on the way.
+
+    Args:
+        query_info (dict): Mutation or resolver request info.
+
+    Returns:
+        tuple: (JSON encoded body as bytes, {variable name: encoded size}).
+    """
+    variables = query_info.get("variables") or {}
+    parts = []
+    sizes = {}
+    for name, value in variables.items():
+        encoded = json.dumps(value)
+        sizes[name] = len(encoded)
+        parts.append(f"{json.dumps(name)}: {encoded}")
+    extra = [
+        f"{json.dumps(key)}: {json.dumps(value)}"
+        for key, value in query_info.items()
+        if key not in ("query", "variables")
+    ]
+    body = ", ".join(
+        [f'"query": {json.dumps(query_info.get("query"))}']
+        + extra
+        + [f'"variables": {{{", ".join(parts)}}}']
+    )
+    return f"{{{body}}}".encode(), sizes
+
+
+def log_request(
+    logger: logging.Logger,
+    api_url: str,
+    query_info: dict,
+    variable_sizes: dict,
+    status,
+    elapsed: float,
+    response_bytes: int,
+) -> None:
+    """
+    Log one request: operation, variable sizes and timing at INFO, and the full
+    payload at DEBUG. Nothing is formatted if neither level is enabled.
+    """
+    if not logger or not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info(
+        "graphql op=%s status=%s elapsed=%.3fs vars=%s response_bytes=%d url=%s",
+        operation_name(query_info.get("query")),
+        status,
+        elapsed,
+        variable_sizes,
+        response_bytes,
+        api_url,
+    )
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("graphql payload %s", query_info)
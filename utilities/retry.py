@@ -0,0 +1,163 @@
+import re
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# Status codes worth retrying. 429 and 503 mean the request was rejected
+# before being processed, the others may or may not have reached the API.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Statuses for which the server did not process the request, so retrying a
+# mutation cannot apply it twice.
+REJECTED_STATUSES = (429, 503)
+# Errors a mutation gets when it is sent again after an earlier attempt was
+# applied, by kind: the error's extensions.code, and a pattern its whole
+# message must match otherwise.
+REPLAY_ERRORS = {
+    # A delete whose record is gone.
+    "not_found": ("NOT_FOUND", re.compile(r"\w+ \S+ not found", re.IGNORECASE)),
+    # An etag guarded update whose etag has moved on.
+    "etag_mismatch": (
+        "ETAG_MISMATCH",
+        re.compile(r"etag mismatch for \w+ \S+", re.IGNORECASE),
+    ),
+    # A create or link that already exists.
+    "already_exists": (
+        "ALREADY_EXISTS",
+        re.compile(r"[\w ]+ already exists", re.IGNORECASE),
+    ),
+}
+
+
+def is_mutation(query: str) -> bool:
+    """Check if a GraphQL document is a mutation."""
+    return re.match(r"\s*mutation\b", query or "") is not None
+
+
+def is_replay_error(resp_value: dict, kinds: tuple) -> bool:
+    """
+    Check if every error of a GraphQL response is a replay error.
+
+    Args:
+        resp_value (dict): Decoded response.
+        kinds (tuple): Keys of REPLAY_ERRORS the request can get when replayed.
+    """
+
+    def matches(error: dict) -> bool:
+        code = (error.get("extensions") or {}).get("code")
+        message = str(error.get("message", ""))
+        for kind in kinds:
+            replay_code, pattern = REPLAY_ERRORS[kind]
+            if code == replay_code or pattern.fullmatch(message):
+                return True
+        return False
+
+    errors = resp_value.get("errors") or []
+    return bool(errors) and all(matches(e) for e in errors)
+
+
+def may_have_been_applied(status: int = None, error: Exception = None) -> bool:
+    """
+    Check if a failed attempt may have been run by the server although it
+    failed: a 5xx response other than a rejection, or a network error after
+    connecting such as a read timeout.
+
+    Args:
+        status (int): Status code of the response, if one was received.
+        error (Exception): Network error raised instead of a response.
+    """
+    if error is not None:
+        return not isinstance(error, requests.exceptions.ConnectTimeout)
+    return status >= 500 and status not in REJECTED_STATUSES
+
+
+def parse_retry_after(value) -> float:
+    """
+    Parse a Retry-After header value.
+
+    Args:
+        value (str): Number of seconds or an HTTP date.
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy(object):
+    """
+    Decide when a failed request is retried and how long to wait before it.
+
+    Queries are retried on any retryable status, timeout or connection error.
+    Mutations are only retried when the server cannot have applied them: a
+    429/503 rejection or a failure to connect. Set retry_mutations to retry
+    them like queries, e.g. for mutations that are safe to repeat.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 60.0,
+        retry_statuses: tuple = RETRY_STATUSES,
+        retry_mutations: bool = False,
+    ) -> None:
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+        self.retry_mutations = retry_mutations
+
+    def should_retry_status(self, status: int, attempt: int, idempotent: bool) -> bool:
+        if attempt >= self.max_retries or status not in self.retry_statuses:
+            return False
+        return idempotent or self.retry_mutations or status in REJECTED_STATUSES
+
+    def should_retry_exception(
+        self, error: Exception, attempt: int, idempotent: bool
+    ) -> bool:
+        if not isinstance(
+            error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        ):
+            return False
+        connect_failed = isinstance(error, requests.exceptions.ConnectTimeout)
+        return self.should_retry_error(attempt, idempotent, connect_failed)
+
+    def should_retry_error(
+        self, attempt: int, idempotent: bool, connect_failed: bool = False
+    ) -> bool:
+        """
+        Decide on a network error or timeout.
+
+        Args:
+            attempt (int): Number of retries already made.
+            idempotent (bool): Whether repeating the request is harmless.
+            connect_failed (bool): The connection was never established, so
+                the request cannot have reached the server.
+        """
+        if attempt >= self.max_retries:
+            return False
+        return connect_failed or idempotent or self.retry_mutations
+
+    def backoff(self, attempt: int, retry_after=None) -> float:
+        """
+        Seconds to wait before the next attempt.
+
+        Uses exponential backoff with full jitter, or the server's Retry-After
+        when it sent one.
+        """
+        retry_after = parse_retry_after(retry_after)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        ceiling = min(self.backoff_factor * (2**attempt), self.max_backoff)
+        return random.uniform(0, ceiling)